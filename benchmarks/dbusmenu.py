@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+"""
+Counts the dbusmenu signals, and their payload bytes, sent when the menu is
+updated, and compares them with expected limits.
+
+The indicator runs against a private session bus, started with
+`dbus-daemon`, where a fake StatusNotifierWatcher accepts its item, as a
+panel would. GTK needs a display, so it is meant to run under Xvfb:
+
+    $ PYTHONPATH=. xvfb-run -a python benchmarks/dbusmenu.py
+
+Each scenario changes the menu and then counts the signals from the
+`com.canonical.dbusmenu` interface seen by another connection to the bus.
+In particular, enabling or disabling a device should only update the
+properties of its item, without exporting the menu layout again.
+
+The limits in `LIMITS` are estimates: they have not been checked against a
+real dbusmenu yet. So the script only reports the scenarios above them. With
+`--enforce`, it exits with an error instead. Use that option only once the
+limits have been measured and recorded here.
+
+    $ PYTHONPATH=. xvfb-run -a python benchmarks/dbusmenu.py --enforce
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+
+# Unverified estimates (see above), not measured limits.
+LIMITS = {
+    # Scenario: maximum LayoutUpdated, ItemsPropertiesUpdated and bytes.
+    'toggle device': (0, 1, 512),
+    'device changed elsewhere': (0, 1, 512),
+    'refresh, nothing changed': (0, 0, 0),
+    'refresh, device plugged': (2, 2, 4096),
+}
+
+WATCHER_XML = '''
+<node>
+  <interface name="org.kde.StatusNotifierWatcher">
+    <method name="RegisterStatusNotifierItem">
+      <arg type="s" direction="in"/>
+    </method>
+    <method name="RegisterStatusNotifierHost">
+      <arg type="s" direction="in"/>
+    </method>
+    <property name="RegisteredStatusNotifierItems" type="as" access="read"/>
+    <property name="IsStatusNotifierHostRegistered" type="b" access="read"/>
+    <property name="ProtocolVersion" type="i" access="read"/>
+    <signal name="StatusNotifierItemRegistered">
+      <arg type="s"/>
+    </signal>
+    <signal name="StatusNotifierHostRegistered"/>
+  </interface>
+</node>
+'''
+
+DEVICES = '''
+⎡ Virtual core pointer                    id=2    [master pointer  (3)]
+⎜   ↳ Virtual core XTEST pointer          id=4    [slave  pointer  (2)]
+⎜   ↳ Touchpad                            id=12   [slave  pointer  (2)]
+⎣ Virtual core keyboard                   id=3    [master keyboard (2)]
+    ↳ Virtual core XTEST keyboard         id=5    [slave  keyboard (3)]
+    ↳ AT Translated Set 2 keyboard        id=11   [slave  keyboard (3)]
+'''
+
+PLUGGED_DEVICE = '''
+    ↳ USB Keyboard                        id=14   [slave  keyboard (3)]
+'''
+
+
+def start_bus():
+    """
+    Starts a private session bus and points the environment to it, before
+    any connection to the session bus is made.
+    """
+    daemon = subprocess.Popen(
+        ['dbus-daemon', '--session', '--nofork', '--print-address'],
+        stdout=subprocess.PIPE
+    )
+    address = daemon.stdout.readline().decode('utf-8').strip()
+    os.environ['DBUS_SESSION_BUS_ADDRESS'] = address
+    os.environ['XDG_CACHE_HOME'] = tempfile.mkdtemp()
+    return daemon, address
+
+
+class FakeWatcher:
+
+    def __init__(self, gio, glib, connection):
+        self.glib = glib
+        self.connection = connection
+        self.items = []
+        node = gio.DBusNodeInfo.new_for_xml(WATCHER_XML)
+        connection.register_object_with_closures(
+            '/StatusNotifierWatcher', node.interfaces[0], self.method_call,
+            self.get_property, None
+        )
+        connection.call_sync(
+            'org.freedesktop.DBus', '/org/freedesktop/DBus',
+            'org.freedesktop.DBus', 'RequestName',
+            glib.Variant('(su)', ('org.kde.StatusNotifierWatcher', 0)),
+            None, gio.DBusCallFlags.NONE, -1, None
+        )
+
+    def method_call(
+            self, connection, sender, path, interface, method, parameters,
+            invocation):
+        if method == 'RegisterStatusNotifierItem':
+            service = parameters.unpack()[0]
+            if service.startswith('/'):
+                self.items.append((sender, service))
+            else:
+                self.items.append((service, '/StatusNotifierItem'))
+        invocation.return_value(None)
+
+    def get_property(self, connection, sender, path, interface, name):
+        if name == 'RegisteredStatusNotifierItems':
+            return self.glib.Variant(
+                'as', ['{0}{1}'.format(*item) for item in self.items]
+            )
+        if name == 'IsStatusNotifierHostRegistered':
+            return self.glib.Variant('b', True)
+        return self.glib.Variant('i', 0)
+
+
+class SignalCounter:
+
+    def __init__(self, gio, connection):
+        self.counts = {}
+        self.size = 0
+        connection.signal_subscribe(
+            None, 'com.canonical.dbusmenu', None, None, None,
+            gio.DBusSignalFlags.NONE, self.signal_received
+        )
+
+    def signal_received(
+            self, connection, sender, path, interface, signal, parameters):
+        self.counts[signal] = self.counts.get(signal, 0) + 1
+        self.size += parameters.get_size()
+
+    def reset(self):
+        self.counts = {}
+        self.size = 0
+
+
+def wait(glib, milliseconds=300):
+    """
+    Runs the main loop for a while, so dbusmenu sends its signals (which are
+    batched in idle callbacks) and they are received.
+    """
+    loop = glib.MainLoop()
+    glib.timeout_add(milliseconds, loop.quit)
+    loop.run()
+
+
+def main(argv):
+    enforce = '--enforce' in argv
+    daemon, address = start_bus()
+    try:
+        failed = run(address)
+        if failed and not enforce:
+            print('Some limits were exceeded, but they are unverified '
+                  'estimates; use --enforce to fail on them.')
+            failed = 0
+        sys.exit(failed)
+    finally:
+        daemon.kill()
+        daemon.wait()
+
+
+def run(address):
+    import gi
+    gi.require_version('Gtk', '3.0')
+    gi.require_version('AppIndicator3', '0.1')
+    from gi.repository import AppIndicator3 as appindicator
+    from gi.repository import Gio as gio
+    from gi.repository import GLib as glib
+    from gi.repository import Gtk as gtk
+
+    from inputdeviceindicator.command import parse
+    from inputdeviceindicator.indicator import build_indicator
+    from inputdeviceindicator.menu import MenuCallbacks, build_menu
+    from inputdeviceindicator.mock import MockXInput
+
+    panel = gio.DBusConnection.new_for_address_sync(
+        address,
+        gio.DBusConnectionFlags.AUTHENTICATION_CLIENT |
+        gio.DBusConnectionFlags.MESSAGE_BUS_CONNECTION,
+        None, None
+    )
+    watcher = FakeWatcher(gio, glib, panel)
+    counter = SignalCounter(gio, panel)
+
+    devices = parse(DEVICES)
+    xinput = MockXInput(devices)
+    menu = gtk.Menu()
+    callbacks = MenuCallbacks(xinput, menu)
+    xinput.add_listener(callbacks.device_state_changed)
+    build_menu(menu, devices, callbacks)
+    indicator = build_indicator(menu)
+    indicator.set_status(appindicator.IndicatorStatus.ACTIVE)
+    wait(glib, 1000)
+    if not watcher.items:
+        print('the indicator did not register its item')
+        return 1
+
+    touchpad = devices[0].children[1]
+    touchpad_menu_item = [
+        i for i in menu.get_children()
+        if getattr(i, 'device', None) is touchpad
+    ][0]
+
+    def toggle_device():
+        touchpad_menu_item.set_active(not touchpad_menu_item.get_active())
+
+    def change_device_elsewhere():
+        xinput.enable(touchpad)
+
+    def refresh():
+        callbacks.update_devices(parse(DEVICES))
+
+    def plug_device():
+        callbacks.update_devices(parse(DEVICES + PLUGGED_DEVICE))
+
+    scenarios = [
+        ('toggle device', toggle_device),
+        ('device changed elsewhere', change_device_elsewhere),
+        ('refresh, nothing changed', refresh),
+        ('refresh, device plugged', plug_device),
+    ]
+    failed = False
+    for name, scenario in scenarios:
+        counter.reset()
+        scenario()
+        wait(glib)
+        layout = counter.counts.get('LayoutUpdated', 0)
+        properties = counter.counts.get('ItemsPropertiesUpdated', 0)
+        limit = LIMITS[name]
+        exceeded = layout > limit[0] or properties > limit[1] or \
+            counter.size > limit[2]
+        failed = failed or exceeded
+        print(
+            '{0:26} LayoutUpdated: {1} (max {4}), '
+            'ItemsPropertiesUpdated: {2} (max {5}), '
+            'bytes: {3} (max {6}){7}'.format(
+                name, layout, properties, counter.size, *limit,
+                ' EXCEEDED' if exceeded else ''
+            )
+        )
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
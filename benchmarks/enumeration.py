@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+"""
+Compares listing the devices through `xinput list --long` with enumerating
+them from sysfs.
+
+It needs an X server, so it is meant to run under Xvfb:
+
+    $ PYTHONPATH=. xvfb-run -a python benchmarks/enumeration.py
+
+Both listings run many times, alternately, and the script exits with an
+error if reading sysfs is not faster than invoking `xinput`. Under Xvfb
+there are only a couple of virtual devices in X, but sysfs still lists all
+input devices of the machine, so the comparison is not biased towards sysfs.
+"""
+
+import statistics
+import sys
+import time
+
+from inputdeviceindicator.command import XInput
+from inputdeviceindicator.sysfs import enumerate_devices
+
+
+ROUNDS = 200
+
+
+def measure(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def report(label, durations):
+    durations = sorted(duration * 1000 for duration in durations)
+    print('{0}, {1} rounds:'.format(label, ROUNDS))
+    print('    median: {0:.3f} ms'.format(statistics.median(durations)))
+    print('    p95:    {0:.3f} ms'.format(durations[int(ROUNDS * 0.95)]))
+    print('    max:    {0:.3f} ms'.format(durations[-1]))
+
+
+def main():
+    xinput = XInput()
+    subprocess_durations = []
+    sysfs_durations = []
+    for i in range(ROUNDS):
+        subprocess_durations.append(measure(xinput.list))
+        sysfs_durations.append(measure(enumerate_devices))
+
+    report('xinput list --long', subprocess_durations)
+    report('sysfs', sysfs_durations)
+    speedup = statistics.median(subprocess_durations) / \
+        statistics.median(sysfs_durations)
+    print('sysfs is {0:.1f} times as fast'.format(speedup))
+    if speedup <= 1:
+        sys.exit('reading sysfs is not faster than invoking xinput')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+"""
+Measures the time from a hotkey press to the change of the device state.
+
+It needs an X server where keys can be pressed with XTEST, so it is meant to
+run under Xvfb, with `xdotool` installed:
+
+    $ PYTHONPATH=. xvfb-run -a python benchmarks/hotkeys.py
+
+A hotkey toggling the "Virtual core XTEST pointer" is pressed with `xdotool`.
+The time is measured from the raw key press to the property event reporting
+the new state of the device. Both events are read by the same event monitor.
+"""
+
+import gi
+gi.require_version('Gtk', '3.0')  # noqa
+
+import statistics
+import subprocess
+import sys
+
+from gi.repository import GLib as glib
+from gi.repository import Gtk as gtk
+
+from inputdeviceindicator.command import XInput
+from inputdeviceindicator.events import EventMonitor
+from inputdeviceindicator.hotkeys import Hotkeys
+
+
+ACCELERATOR = '<Control><Alt>F9'
+KEYS = 'ctrl+alt+F9'
+DEVICE = 'Virtual core XTEST pointer'
+ROUNDS = 50
+
+
+def main():
+    xinput = XInput()
+    monitor = EventMonitor()
+    hotkeys = Hotkeys(
+        xinput, {ACCELERATOR: {'action': 'toggle', 'device': DEVICE}},
+        on_error=lambda e: sys.exit(str(e))
+    )
+    hotkeys.start()
+
+    latencies = []
+    pressed = []
+
+    def handle_event(event):
+        if event.type == 'RawKeyPress' and not pressed:
+            pressed.append(event.time)
+        elif event.type == 'PropertyEvent' and \
+                event.property == 'Device Enabled' and pressed:
+            latencies.append(event.time - pressed.pop())
+            if len(latencies) == ROUNDS:
+                gtk.main_quit()
+            else:
+                glib.timeout_add(50, press)
+
+    def press():
+        subprocess.Popen(['xdotool', 'key', KEYS])
+        return False
+
+    monitor.subscribe(handle_event)
+    glib.timeout_add(500, press)
+    gtk.main()
+
+    hotkeys.stop()
+    latencies = sorted(latency * 1000 for latency in latencies)
+    print('key press to device state change, {0} rounds:'.format(ROUNDS))
+    print('    median: {0:.2f} ms'.format(statistics.median(latencies)))
+    print('    p95:    {0:.2f} ms'.format(latencies[int(ROUNDS * 0.95)]))
+    print('    max:    {0:.2f} ms'.format(latencies[-1]))
+
+
+if __name__ == '__main__':
+    main()
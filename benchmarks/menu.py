@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+"""
+Measures how long it takes to build the menu, in both layouts, as the number
+of slave devices grows. GTK needs a display, so it is meant to run under Xvfb:
+
+    $ PYTHONPATH=. xvfb-run -a python benchmarks/menu.py
+
+In the "flat" layout, the time grows with the number of devices. In the
+"submenus" layout, the items of the slave devices are only built when their
+submenus are opened, so the initial build takes about the same time however
+many devices there are.
+"""
+
+import gi
+gi.require_version('Gtk', '3.0')  # noqa
+
+import statistics
+import time
+
+from gi.repository import Gtk as gtk
+
+from inputdeviceindicator.command import Device
+from inputdeviceindicator.menu import MENU_LAYOUTS, build_menu
+from inputdeviceindicator.mock import MockMenuCallbacks
+
+
+SLAVE_COUNTS = [10, 100, 1000]
+ROUNDS = 10
+
+
+def get_devices(slave_count):
+    pointer = Device(2, 'Virtual core pointer', 3, 'master', 'pointer')
+    keyboard = Device(3, 'Virtual core keyboard', 2, 'master', 'keyboard')
+    for i in range(slave_count):
+        master = pointer if i % 2 else keyboard
+        master.children.append(
+            Device(
+                10 + i, 'Device {0}'.format(i), master.id, 'slave',
+                master.type
+            )
+        )
+    return [pointer, keyboard]
+
+
+def measure(layout, devices):
+    times = []
+    for i in range(ROUNDS):
+        menu = gtk.Menu()
+        menu.layout = layout
+        start = time.perf_counter()
+        build_menu(menu, devices, MockMenuCallbacks())
+        times.append(time.perf_counter() - start)
+        menu.destroy()
+    return statistics.median(times)
+
+
+def main():
+    print('median time to build the menu, {0} rounds:'.format(ROUNDS))
+    for layout in MENU_LAYOUTS:
+        for slave_count in SLAVE_COUNTS:
+            print(
+                '    {0:8} {1:5} slaves: {2:8.2f} ms'.format(
+                    layout, slave_count,
+                    measure(layout, get_devices(slave_count)) * 1000
+                )
+            )
+
+
+if __name__ == '__main__':
+    main()
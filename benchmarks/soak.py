@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+"""
+Refreshes the menu and toggles devices thousands of times, checking that
+the memory used by the process does not keep growing.
+
+The device lists are replayed from a fixed sequence, with devices being
+plugged, unplugged and disabled. GTK needs a display, so it is meant to run
+under Xvfb:
+
+    $ PYTHONPATH=. xvfb-run -a python benchmarks/soak.py [CYCLES]
+
+After a warm-up, it tracks the memory allocated by Python (with
+`tracemalloc`), the GObject wrappers alive, and the GTK toplevel windows
+(every menu, even a leaked submenu, has one). If any of them still grows in
+the second half of the run, the script fails and reports the allocation
+sites which grew the most.
+"""
+
+import gi
+gi.require_version('Gtk', '3.0')  # noqa
+
+import gc
+import sys
+import tracemalloc
+
+from gi.repository import GObject as gobject
+from gi.repository import Gtk as gtk
+
+from inputdeviceindicator.command import parse
+from inputdeviceindicator.grouping import DeviceGroup
+from inputdeviceindicator.menu import MenuCallbacks, build_menu, update_menu
+from inputdeviceindicator.mock import MockXInput
+
+
+CYCLES = 5000
+WARM_UP = 500
+SAMPLES = 10
+MAX_MEMORY_GROWTH = 256 * 1024
+MAX_OBJECT_GROWTH = 10
+TOP_SITES = 10
+
+DEVICE_LISTS = [
+    '''
+⎡ Virtual core pointer                    id=2    [master pointer  (3)]
+⎜   ↳ Touchpad                            id=12   [slave  pointer  (2)]
+⎣ Virtual core keyboard                   id=3    [master keyboard (2)]
+    ↳ AT Translated Set 2 keyboard        id=11   [slave  keyboard (3)]
+''',
+    '''
+⎡ Virtual core pointer                    id=2    [master pointer  (3)]
+⎜   ↳ Touchpad                            id=12   [slave  pointer  (2)]
+⎜   ↳ USB Mouse                           id=15   [slave  pointer  (2)]
+⎣ Virtual core keyboard                   id=3    [master keyboard (2)]
+    ↳ AT Translated Set 2 keyboard        id=11   [slave  keyboard (3)]
+    ↳ USB Keyboard                        id=13   [slave  keyboard (3)]
+    ↳ USB Keyboard Consumer Control       id=14   [slave  keyboard (3)]
+''',
+    '''
+⎡ Virtual core pointer                    id=2    [master pointer  (3)]
+⎜   ↳ Touchpad                            id=12   [slave  pointer  (2)]
+⎣ Virtual core keyboard                   id=3    [master keyboard (2)]
+    ↳ AT Translated Set 2 keyboard        id=11   [slave  keyboard (3)]
+        This device is disabled
+''',
+]
+
+
+def count_gobjects():
+    gc.collect()
+    return sum(1 for o in gc.get_objects() if isinstance(o, gobject.Object))
+
+
+def count_toplevels():
+    return len(gtk.Window.list_toplevels())
+
+
+def process_events():
+    while gtk.events_pending():
+        gtk.main_iteration()
+
+
+def run_cycle(i, menu, callbacks):
+    devices = parse(DEVICE_LISTS[i % len(DEVICE_LISTS)])
+    if i % 100 == 0:
+        build_menu(menu, devices, callbacks)
+    elif i % 7 == 0:
+        keyboard = devices[1].children
+        update_menu(
+            menu, devices, callbacks,
+            [DeviceGroup('usb', keyboard[1:])] if len(keyboard) > 2 else []
+        )
+    else:
+        callbacks.update_devices(devices)
+    for item in menu.get_children():
+        if isinstance(item, gtk.CheckMenuItem):
+            item.set_active(not item.get_active())
+            break
+    process_events()
+
+
+def main(cycles=CYCLES):
+    xinput = MockXInput()
+    xinput.enable = xinput.disable = lambda device: None
+    menu = gtk.Menu()
+    callbacks = MenuCallbacks(xinput, menu)
+    xinput.add_listener(callbacks.device_state_changed)
+    build_menu(menu, [], callbacks)
+
+    tracemalloc.start(10)
+    samples = []
+    snapshots = []
+    warm_up = min(WARM_UP, cycles // 10)
+    sample_every = max((cycles - warm_up) // SAMPLES, 1)
+    for i in range(cycles):
+        run_cycle(i, menu, callbacks)
+        if i >= warm_up and (i - warm_up) % sample_every == 0:
+            gc.collect()
+            samples.append(
+                (
+                    tracemalloc.get_traced_memory()[0], count_gobjects(),
+                    count_toplevels()
+                )
+            )
+            snapshots.append(tracemalloc.take_snapshot())
+
+    print('{0} cycles, after {1} cycles of warm-up:'.format(cycles, warm_up))
+    print(
+        '    {0:>12} {1:>10} {2:>10}'.format('bytes', 'gobjects', 'toplevels')
+    )
+    for memory, gobjects, toplevels in samples:
+        print('    {0:12} {1:10} {2:10}'.format(memory, gobjects, toplevels))
+
+    middle, last = samples[len(samples) // 2], samples[-1]
+    failures = []
+    if last[0] - middle[0] > MAX_MEMORY_GROWTH:
+        failures.append(
+            'memory grew {0} bytes in the second half'.format(
+                last[0] - middle[0]
+            )
+        )
+    if last[1] - middle[1] > MAX_OBJECT_GROWTH:
+        failures.append(
+            '{0} more GObject wrappers in the second half'.format(
+                last[1] - middle[1]
+            )
+        )
+    if last[2] - middle[2] > MAX_OBJECT_GROWTH:
+        failures.append(
+            '{0} more toplevel windows in the second half'.format(
+                last[2] - middle[2]
+            )
+        )
+
+    print('top growing allocation sites:')
+    stats = snapshots[-1].compare_to(snapshots[0], 'lineno')
+    for stat in stats[:TOP_SITES]:
+        print('    {0}'.format(stat))
+
+    for failure in failures:
+        print('FAILED: ' + failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(a) for a in sys.argv[1:2]]))
@@ -20,10 +20,9 @@ gi.require_version('Gtk', '3.0')  # noqa
 gi.require_version('AppIndicator3', '0.1')  # noqa
 
 from gi.repository import Gtk as gtk
-from gi.repository import GdkPixbuf as gdkpb
-
-from inputdeviceindicator.info import PROGRAM_NAME, VERSION, DESCRIPTION,\
-    ICON_PATH, URL, AUTHOR, COPYRIGHT, EMAIL, LICENSE
+from inputdeviceindicator.icons import get_icon_pixbuf
+from inputdeviceindicator.info import PROGRAM_NAME, VERSION, DESCRIPTION, \
+    URL, AUTHOR, COPYRIGHT, EMAIL, get_license
 
 
 def get_about_dialog():
@@ -31,14 +30,13 @@ def get_about_dialog():
     dialog.set_program_name(PROGRAM_NAME)
     dialog.set_version(VERSION)
     dialog.set_comments(DESCRIPTION)
-    pixbuf = gdkpb.Pixbuf.new_from_file(ICON_PATH)
-    dialog.set_logo(pixbuf)
-    dialog.set_icon(pixbuf)
+    dialog.set_logo(get_icon_pixbuf(128))
+    dialog.set_icon(get_icon_pixbuf(48))
     dialog.set_website(URL)
     authors = [
         "{name} <{email}>".format(name=AUTHOR, email=EMAIL)
     ]
     dialog.set_authors(authors)
     dialog.set_copyright(COPYRIGHT)
-    dialog.set_license(LICENSE)
+    dialog.set_license(get_license())
     return dialog
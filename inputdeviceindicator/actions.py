@@ -0,0 +1,124 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+from inputdeviceindicator.command import XInputError
+
+
+def get_slave_devices(devices):
+    """
+    Returns the slave devices from a device tree, including floating ones:
+
+    >>> from inputdeviceindicator.command import parse
+    >>> get_slave_devices(parse('''
+    ... ⎡ A        id=2    [master pointer  (3)]
+    ... ⎜   ↳ A1   id=4    [slave  pointer  (2)]
+    ... ~ C        id=6    [floating slave]
+    ... '''))
+    [Device(4, 'A1', 2, 'slave', 'pointer', True), \
+Device(6, 'C', None, 'slave', 'floating', True)]
+    """
+    slaves = []
+    for d in devices:
+        if d.level == 'slave':
+            slaves.append(d)
+        slaves.extend(d.children)
+    return slaves
+
+
+def find_devices(devices, name):
+    """
+    Finds the slave devices with the given name. Device ids change between
+    sessions, but names do not, so configurations refer to devices by name.
+    Since some devices share a name, more than one device may be returned:
+
+    >>> from inputdeviceindicator.command import parse
+    >>> find_devices(parse('''
+    ... ⎣ Keyboard               id=3    [master keyboard (2)]
+    ...     ↳ Consumer Control   id=8    [slave  keyboard (3)]
+    ...     ↳ Laptop keys        id=9    [slave  keyboard (3)]
+    ...     ↳ Consumer Control   id=10   [slave  keyboard (3)]
+    ... '''), 'Consumer Control')
+    [Device(8, 'Consumer Control', 3, 'slave', 'keyboard', True), \
+Device(10, 'Consumer Control', 3, 'slave', 'keyboard', True)]
+    """
+    return [d for d in get_slave_devices(devices) if d.name == name]
+
+
+def set_enabled(xinput, devices, enabled, source=None):
+    """
+    Enables or disables the given devices together, skipping the ones already
+    in the requested state:
+
+    >>> from inputdeviceindicator.command import Device
+    >>> from inputdeviceindicator.mock import MockXInput
+    >>> a, b = Device(1, 'a', 3, 'slave', 'pointer'), \\
+    ...     Device(2, 'b', 3, 'slave', 'pointer')
+    >>> b.enabled = False
+    >>> set_enabled(MockXInput(), [a, b], False)
+    Device a disabled
+    [Device(1, 'a', 3, 'slave', 'pointer', False)]
+
+    The `source` is the feature asking for the change, for the audit log.
+    The devices actually changed are returned, so the change can be undone.
+    """
+    devices = [d for d in devices if d.enabled != enabled]
+    if not devices:
+        return []
+    xinput.set_enabled_many(devices, enabled, source)
+    for device in devices:
+        device.enabled = enabled
+    return devices
+
+
+def apply_profile(xinput, devices, profile, source=None):
+    """
+    Applies a profile, a dict mapping device names to the states they should
+    be in:
+
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.mock import MockXInput
+    >>> devices = parse('''
+    ... ⎡ Pointer      id=2    [master pointer  (3)]
+    ... ⎜   ↳ Mouse    id=4    [slave  pointer  (2)]
+    ... ⎜   ↳ Touchpad id=5    [slave  pointer  (2)]
+    ... ''')
+    >>> apply_profile(
+    ...     MockXInput(devices), devices,
+    ...     {'Mouse': True, 'Touchpad': False, 'Trackball': False}
+    ... )
+    Device Touchpad disabled
+    [(Device(5, 'Touchpad', 2, 'slave', 'pointer', False), False)]
+
+    Devices missing from the tree are ignored. If some device cannot be
+    changed, the others are changed anyway and the first error is raised at
+    the end. Otherwise, the changed devices are returned with their new
+    states.
+    """
+    error = None
+    changes = []
+    for name, enabled in profile.items():
+        try:
+            changed = set_enabled(
+                xinput, find_devices(devices, name), enabled, source
+            )
+        except XInputError as e:
+            error = error or e
+        else:
+            changes.extend((d, enabled) for d in changed)
+    if error is not None:
+        raise error
+    return changes
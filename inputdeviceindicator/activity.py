@@ -0,0 +1,246 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import time
+
+from gi.repository import GLib as glib
+
+from inputdeviceindicator.config import DEFAULT_CONFIG
+from inputdeviceindicator.events import INPUT_EVENT_TYPES
+from inputdeviceindicator.menu import get_device_menu_items, \
+    set_device_menu_item_suffix
+
+
+DEFAULT_SETTINGS = DEFAULT_CONFIG['activity_meter']
+
+
+class EventCounter:
+    """
+    `EventCounter` counts events in a ring buffer of one-second buckets, so
+    it takes the same memory no matter how many events arrive:
+
+    >>> counter = EventCounter(seconds=3)
+    >>> for t in [10.1, 10.5, 11.2, 12.9, 12.95]:
+    ...     counter.add(t)
+    >>> counter.count(now=12.99)
+    5
+
+    Old buckets are not counted, and are reused by newer events:
+
+    >>> counter.count(now=13.5)
+    3
+    >>> counter.add(14.0)
+    >>> counter.count(now=14.0)
+    3
+    >>> counter.count(now=14.0, seconds=1)
+    1
+    >>> len(counter.buckets)
+    3
+    """
+
+    def __init__(self, seconds=5):
+        self.buckets = [0] * seconds
+        self.stamps = [None] * seconds
+
+    def add(self, time):
+        second = int(time)
+        index = second % len(self.buckets)
+        if self.stamps[index] != second:
+            self.stamps[index] = second
+            self.buckets[index] = 0
+        self.buckets[index] += 1
+
+    def count(self, now, seconds=None):
+        if seconds is None:
+            seconds = len(self.buckets)
+        current = int(now)
+        return sum(
+            count for count, stamp in zip(self.buckets, self.stamps)
+            if stamp is not None and current - seconds < stamp <= current
+        )
+
+
+class ActivityMeter:
+    """
+    `ActivityMeter` counts the raw events of each device, to tell which
+    device is which.
+
+    >>> from inputdeviceindicator.events import Event
+    >>> from inputdeviceindicator.mock import MockEventMonitor
+    >>> monitor = MockEventMonitor()
+    >>> now = [100.0]
+    >>> meter = ActivityMeter(monitor, seconds=5, clock=lambda: now[0])
+
+    It only receives events once started:
+
+    >>> meter.start()
+    >>> for i in range(20):
+    ...     monitor.dispatch(Event('RawMotion', 12, 12, time=96 + i * 0.25))
+    >>> monitor.dispatch(Event('RawKeyPress', 11, 11, 38, time=97.0))
+
+    Then it knows the recent events per second of each device, and whether
+    it is active right now:
+
+    >>> meter.get_rate(12), meter.is_active(12)
+    (4.0, True)
+    >>> meter.get_rate(11), meter.is_active(11)
+    (0.2, False)
+    >>> meter.get_rate(13), meter.is_active(13)
+    (0.0, False)
+
+    The `on_activity` function, if given, is called with the id of the
+    source device of each event.
+
+    Starting it again does nothing; stopping it unsubscribes it and forgets
+    all counts:
+
+    >>> meter.start()
+    >>> len(monitor.listeners)
+    1
+    >>> meter.stop()
+    >>> monitor.listeners, meter.get_rate(12)
+    ([], 0.0)
+    """
+
+    def __init__(
+            self, monitor, seconds=5, clock=time.monotonic, on_activity=None):
+        self.monitor = monitor
+        self.seconds = seconds
+        self.clock = clock
+        self.on_activity = on_activity
+        self.counters = {}
+        self.started = False
+
+    def start(self):
+        if not self.started:
+            self.monitor.subscribe(self.handle_event, INPUT_EVENT_TYPES)
+            self.started = True
+
+    def stop(self):
+        if self.started:
+            self.monitor.unsubscribe(self.handle_event)
+            self.started = False
+            self.counters.clear()
+
+    def handle_event(self, event):
+        if not event.type.startswith('Raw'):
+            return
+        counter = self.counters.get(event.source_id)
+        if counter is None:
+            counter = EventCounter(self.seconds)
+            self.counters[event.source_id] = counter
+        counter.add(event.time)
+        if self.on_activity is not None:
+            self.on_activity(event.source_id)
+
+    def get_rate(self, device_id):
+        counter = self.counters.get(device_id)
+        if counter is None:
+            return 0.0
+        return counter.count(self.clock()) / self.seconds
+
+    def is_active(self, device_id):
+        counter = self.counters.get(device_id)
+        return counter is not None and counter.count(self.clock(), 2) > 0
+
+
+class ActivityLabels:
+    """
+    `ActivityLabels` displays the activity of each device next to its item in
+    the menu. The labels are refreshed as soon as some device is used, and
+    then every second, until no device is active anymore.
+
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.events import Event
+    >>> from inputdeviceindicator.menu import build_menu
+    >>> from inputdeviceindicator.mock import MockEventMonitor, \\
+    ...     MockMenuCallbacks, MockTimer
+    >>> from gi.repository import Gtk as gtk
+    >>> menu = gtk.Menu()
+    >>> build_menu(menu, parse('''
+    ... ⎡ A        id=2    [master pointer  (3)]
+    ... ⎜   ↳ A1   id=4    [slave  pointer  (2)]
+    ... ⎜   ↳ A2   id=5    [slave  pointer  (2)]
+    ... '''), MockMenuCallbacks())
+    >>> monitor = MockEventMonitor()
+    >>> now = [10.0]
+    >>> meter = ActivityMeter(monitor, clock=lambda: now[0])
+    >>> timer = MockTimer()
+    >>> labels = ActivityLabels(menu, meter, timeout_add=timer.timeout_add)
+
+    The meter starts right away, but nothing else runs while the devices are
+    not used:
+
+    >>> len(monitor.listeners), timer.pending
+    (1, [])
+
+    Once a device is used, its label shows it, and is refreshed every
+    second:
+
+    >>> for i in range(10):
+    ...     monitor.dispatch(Event('RawMotion', 5, 5, time=9 + i * 0.1))
+    >>> timer.pending
+    [1000]
+    >>> timer.fire()
+    >>> [i.get_label() for i in menu.get_children()[:3]]
+    ['A', 'A1', 'A2  ● 2/s']
+
+    When no device is active anymore, the labels are restored and the
+    refreshes stop:
+
+    >>> now[0] = 20.0
+    >>> timer.fire()
+    >>> [i.get_label() for i in menu.get_children()[:3]]
+    ['A', 'A1', 'A2']
+    >>> timer.pending
+    []
+    """
+
+    def __init__(self, menu, meter, timeout_add=glib.timeout_add):
+        self.menu = menu
+        self.meter = meter
+        self.timeout_add = timeout_add
+        self.timeout_id = None
+        meter.on_activity = self.activity_detected
+        meter.start()
+
+    def activity_detected(self, device_id):
+        if self.timeout_id is None:
+            self.refresh()
+            self.timeout_id = self.timeout_add(1000, self.tick)
+
+    def tick(self):
+        if self.refresh():
+            return True
+        self.timeout_id = None
+        return False
+
+    def refresh(self):
+        """
+        Updates the labels, returning whether some device is active.
+        """
+        active = False
+        for item in get_device_menu_items(self.menu):
+            device = item.device
+            if device.level != 'slave':
+                continue
+            suffix = None
+            if self.meter.is_active(device.id):
+                suffix = '● {0:.0f}/s'.format(self.meter.get_rate(device.id))
+                active = True
+            set_device_menu_item_suffix(item, 'activity', suffix)
+        return active
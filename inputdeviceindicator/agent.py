@@ -0,0 +1,220 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import re
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from inputdeviceindicator.actions import apply_profile
+from inputdeviceindicator.command import XInput, XInputError
+from inputdeviceindicator.paths import get_cache_dir
+from inputdeviceindicator.snapshot import Snapshot
+
+
+class AgentError(Exception):
+    """
+    Raised when the agent is asked for something it cannot do, such as
+    applying a profile which does not exist.
+    """
+
+
+class DisplayStatus:
+    """
+    The outcome of the last operation of the agent on a display: how many
+    devices it has, or why it failed, and how long it took:
+
+    >>> print(DisplayStatus(':1', devices=6, duration=0.0123))
+    :1: ok, 6 devices, 12 ms
+    >>> print(DisplayStatus(':2', error='Unable to connect to X server'))
+    :2: error: Unable to connect to X server
+    """
+
+    def __init__(self, display, devices=0, error=None, duration=0):
+        self.display = display
+        self.devices = devices
+        self.error = error
+        self.duration = duration
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        if not self.ok:
+            return '{0}: error: {1}'.format(self.display, self.error)
+        return '{0}: ok, {1} devices, {2:.0f} ms'.format(
+            self.display, self.devices, self.duration * 1000
+        )
+
+
+class DisplayAgent:
+    """
+    `DisplayAgent` manages the input devices of many X servers, such as the
+    kiosk sessions of a host, without any user interface. Each display has
+    its own `XInput`, with its own device cache and circuit breaker, and the
+    displays are handled in parallel by a bounded pool of workers.
+
+    Let's see it with some mock displays:
+
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.mock import MockXInput
+    >>> def get_xinput(display):
+    ...     return MockXInput(parse('''
+    ... ⎡ Pointer      id=2    [master pointer  (3)]
+    ... ⎜   ↳ Mouse    id=4    [slave  pointer  (2)]
+    ... ⎜   ↳ Touchpad id=5    [slave  pointer  (2)]
+    ... '''))
+    >>> import tempfile
+    >>> agent = DisplayAgent(
+    ...     [':1', ':2'], {'kiosk': {'Touchpad': False}},
+    ...     xinput_factory=get_xinput, snapshot_dir=tempfile.mkdtemp()
+    ... )
+
+    Profiles are applied to all displays:
+
+    >>> statuses = agent.apply_profile('kiosk')
+    Device Touchpad disabled
+    Device Touchpad disabled
+    >>> [s.ok for s in statuses]
+    [True, True]
+    >>> agent.apply_profile('office')
+    Traceback (most recent call last):
+      ...
+    inputdeviceindicator.agent.AgentError: no profile named 'office'
+
+    The devices of each display can be saved as snapshots:
+
+    >>> statuses = agent.collect_snapshots()
+    >>> agent.get_snapshot(':2').load()[0].children[1]
+    Device(5, 'Touchpad', 2, 'slave', 'pointer', False)
+
+    The statuses are returned in the order of the displays, and errors in a
+    display do not affect the others:
+
+    >>> agent.xinputs[':1'].errors.append(
+    ...     XInputError('Unable to connect to X server')
+    ... )
+    >>> for status in agent.collect_snapshots():
+    ...     print(status.display, status.ok, status.error)
+    :1 False Unable to connect to X server
+    :2 True None
+
+    The same goes for snapshots which cannot be saved:
+
+    >>> agent.snapshot_dir = os.path.join(agent.snapshot_dir, 'file')
+    >>> open(agent.snapshot_dir, 'w').close()
+    >>> for status in agent.collect_snapshots(): # doctest: +ELLIPSIS
+    ...     print(status)
+    :1: error: [Errno 17] File exists: '.../file'
+    :2: error: [Errno 17] File exists: '.../file'
+    >>> agent.shutdown()
+
+    With real X servers:
+
+    >>> from inputdeviceindicator.mock import start_xvfb
+    >>> servers = [start_xvfb() for i in range(3)]
+    >>> agent = DisplayAgent(
+    ...     [display for process, display in servers],
+    ...     {'kiosk': {'Virtual core XTEST pointer': False}}, max_workers=2
+    ... )
+    >>> [s.ok for s in agent.apply_profile('kiosk')]
+    [True, True, True]
+    >>> [
+    ...     [d.enabled for d in x.list()[0].children
+    ...         if d.name == 'Virtual core XTEST pointer']
+    ...     for x in agent.xinputs.values()
+    ... ]
+    [[False], [False], [False]]
+    >>> agent.shutdown()
+    >>> for process, display in servers:
+    ...     process.terminate()
+    ...     _ = process.wait()
+    """
+
+    def __init__(
+            self, displays, profiles=None, max_workers=4,
+            xinput_factory=None, snapshot_dir=None, timeouts=None,
+            clock=time.monotonic):
+        if xinput_factory is None:
+            def xinput_factory(display):
+                return XInput(timeouts=timeouts, display=display)
+        if snapshot_dir is None:
+            snapshot_dir = os.path.join(get_cache_dir(), 'displays')
+        self.displays = list(displays)
+        self.profiles = profiles if profiles is not None else {}
+        self.snapshot_dir = snapshot_dir
+        self.clock = clock
+        self.xinputs = {d: xinput_factory(d) for d in self.displays}
+        self.executor = ThreadPoolExecutor(max_workers)
+
+    def apply_profile(self, name):
+        """
+        Applies a profile (see `actions.apply_profile()`) on all displays,
+        returning their statuses.
+        """
+        if name not in self.profiles:
+            raise AgentError('no profile named {0!r}'.format(name))
+        profile = self.profiles[name]
+        return self.run_all(
+            lambda display, xinput, devices:
+                apply_profile(xinput, devices, profile, 'agent')
+        )
+
+    def collect_snapshots(self):
+        """
+        Saves the devices of each display in its snapshot, returning the
+        statuses of the displays.
+        """
+        return self.run_all(
+            lambda display, xinput, devices:
+                self.get_snapshot(display).save(devices)
+        )
+
+    def get_snapshot(self, display):
+        name = re.sub(r'[^\w.-]', '_', display)
+        return Snapshot(
+            os.path.join(self.snapshot_dir, 'display' + name + '.json')
+        )
+
+    def run_all(self, function):
+        futures = [
+            self.executor.submit(self.run, display, function)
+            for display in self.displays
+        ]
+        return [f.result() for f in futures]
+
+    def run(self, display, function):
+        xinput = self.xinputs[display]
+        start = self.clock()
+        try:
+            devices = xinput.list()
+            function(display, xinput, devices)
+        except (XInputError, OSError) as e:
+            # A snapshot which cannot be saved should not stop the agent:
+            # it is reported in the status of the display, like any error.
+            return DisplayStatus(
+                display, error=str(e), duration=self.clock() - start
+            )
+        return DisplayStatus(
+            display, devices=sum(1 + len(d.children) for d in devices),
+            duration=self.clock() - start
+        )
+
+    def shutdown(self):
+        self.executor.shutdown()
@@ -0,0 +1,285 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import asyncio
+
+from inputdeviceindicator.command import DEFAULT_SOURCE, DEFAULT_TIMEOUTS, \
+    CircuitBreaker, XInputError, XInputTimeout, match_properties, parse, \
+    parse_properties, split_by_name
+from inputdeviceindicator.events import EVENT_COMMAND, EventParser
+
+
+class AsyncXInput:
+    """
+    `AsyncXInput` is an `XInput` for asyncio programs: `xinput` runs as an
+    asyncio subprocess, so the event loop is not blocked while it runs.
+
+    To see how it works without an X server, let's use a fake `xinput` which
+    takes a while to list the devices, and counts how many times it ran:
+
+    >>> import os, stat, tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> command = os.path.join(directory, 'xinput')
+    >>> with open(command, 'w') as f:
+    ...     _ = f.write('''#!/bin/sh
+    ... echo run >> "$0.log"
+    ... sleep 0.1
+    ... echo "⎡ A        id=2    [master pointer  (3)]"
+    ... echo "⎜   ↳ A1   id=4    [slave  pointer  (2)]"
+    ... ''')
+    >>> os.chmod(command, stat.S_IRWXU)
+    >>> xi = AsyncXInput(command=command)
+
+    Devices are listed with `list()`:
+
+    >>> asyncio.run(xi.list()) # doctest: +NORMALIZE_WHITESPACE
+    [Device(2, 'A', 3, 'master', 'pointer', True,
+            [Device(4, 'A1', 2, 'slave', 'pointer', True)])]
+
+    Callers asking for the devices while they are being listed share the
+    same `xinput` invocation (and the same result):
+
+    >>> async def list_concurrently():
+    ...     return await asyncio.gather(xi.list(), xi.list(), xi.list())
+    >>> a, b, c = asyncio.run(list_concurrently())
+    >>> a is b is c
+    True
+    >>> with open(command + '.log') as f:
+    ...     len(f.readlines())
+    2
+
+    Otherwise, it works like `XInput`: `enable()`, `disable()` and
+    `set_enabled_many()` confirm the new state of the devices by reading it
+    back, and errors are reported as `XInputError`:
+
+    >>> with open(command, 'w') as f:
+    ...     _ = f.write('''#!/bin/sh
+    ... echo "unable to find device $2" >&2
+    ... exit 1
+    ... ''')
+    >>> from inputdeviceindicator.command import Device
+    >>> asyncio.run(xi.enable(Device(9, 'Mouse', 2, 'slave', 'pointer')))
+    Traceback (most recent call last):
+      ...
+    inputdeviceindicator.command.XInputError: unable to find device 9
+    """
+
+    def __init__(
+            self, timeouts=None, breaker=None, command='xinput',
+            events_command=EVENT_COMMAND):
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.command = command
+        self.events_command = events_command
+        self.listing = None
+        self.audit = None
+
+    async def run(self, operation, arguments):
+        """
+        Invokes `xinput` with the given arguments, like `XInput.run()`.
+        """
+        self.breaker.check()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                self.command, *arguments, stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+        except OSError as e:
+            self.breaker.failure()
+            raise XInputError('could not run xinput: {0}'.format(e))
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(), self.timeouts[operation]
+            )
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            self.breaker.failure()
+            raise XInputTimeout(
+                'xinput {0} timed out after {1} seconds'.format(
+                    operation, self.timeouts[operation]
+                )
+            )
+
+        if process.returncode != 0:
+            message = stderr.decode('utf-8', 'replace').strip()
+            if 'Unable to connect to X server' in message:
+                self.breaker.failure()
+            raise XInputError(message or 'xinput {0} failed'.format(operation))
+        self.breaker.success()
+        return stdout.decode('utf-8')
+
+    async def list(self):
+        """
+        Lists the devices. If they are already being listed, waits for that
+        listing instead of invoking `xinput` again.
+        """
+        if self.listing is None:
+            self.listing = asyncio.ensure_future(self.list_devices())
+            self.listing.add_done_callback(self.listing_done)
+        return await asyncio.shield(self.listing)
+
+    async def list_devices(self):
+        return parse(await self.run('list', ['list', '--long']))
+
+    def listing_done(self, future):
+        self.listing = None
+
+    async def enable(self, device, source=None):
+        await self.set_enabled_many([device], True, source)
+
+    async def disable(self, device, source=None):
+        await self.set_enabled_many([device], False, source)
+
+    async def set_enabled_many(self, devices, enabled, source=None):
+        """
+        Enables or disables many devices at once, running `xinput` for all of
+        them concurrently and confirming their new states with a single
+        `xinput list-props` call.
+
+        The properties are matched to the devices by the names in the output
+        (see `match_properties()`, and `split_by_name()` for devices with the
+        same name), so a device unplugged in the meantime does not shift the
+        states of the others. Here, the device 5 is gone:
+
+        >>> import os, stat, tempfile
+        >>> command = os.path.join(tempfile.mkdtemp(), 'xinput')
+        >>> with open(command, 'w') as f:
+        ...     _ = f.write('''#!/bin/sh
+        ... [ "$1" = list-props ] || exit 0
+        ... echo "Device 'Mouse':"
+        ... printf '\\tDevice Enabled (147):\\t0\\n'
+        ... echo "Device 'Keys':"
+        ... printf '\\tDevice Enabled (147):\\t0\\n'
+        ... ''')
+        >>> os.chmod(command, stat.S_IRWXU)
+        >>> from inputdeviceindicator.command import Device
+        >>> devices = [
+        ...     Device(4, 'Mouse', 2, 'slave', 'pointer'),
+        ...     Device(5, 'Touchpad', 2, 'slave', 'pointer'),
+        ...     Device(6, 'Keys', 3, 'slave', 'keyboard'),
+        ... ]
+        >>> xi = AsyncXInput(command=command)
+        >>> asyncio.run(xi.set_enabled_many(devices, False))
+        Traceback (most recent call last):
+          ...
+        inputdeviceindicator.command.XInputError: device Touchpad is gone
+        >>> [(d.enabled, d.stale) for d in devices]
+        [(False, False), (True, True), (False, False)]
+        """
+        if not devices:
+            return
+        operation = 'enable' if enabled else 'disable'
+        results = await asyncio.gather(
+            *(
+                self.run(operation, ['--' + operation, str(d.id)])
+                for d in devices
+            ),
+            return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, Exception)]
+        try:
+            if errors:
+                raise errors[0]
+            matched = {}
+            for batch in split_by_name(devices):
+                output = await self.run(
+                    'list-props', ['list-props'] + [str(d.id) for d in batch]
+                )
+                matched.update(
+                    match_properties(batch, parse_properties(output))
+                )
+        except XInputError as e:
+            for device in devices:
+                self.record(device, enabled, source, str(e))
+            raise
+        stuck = []
+        gone = []
+        for device in devices:
+            if device.id not in matched:
+                device.stale = True
+                gone.append(device.name)
+                self.record(
+                    device, enabled, source,
+                    'device {0} is gone'.format(device.name)
+                )
+                continue
+            properties = matched[device.id]
+            device.enabled = properties.get('Device Enabled') == ['1']
+            if device.enabled != enabled:
+                stuck.append(device.name)
+                self.record(
+                    device, enabled, source, 'device {0} is still {1}'.format(
+                        device.name, 'disabled' if enabled else 'enabled'
+                    )
+                )
+            else:
+                self.record(device, enabled, source)
+        if gone:
+            message = 'device {0} is gone' if len(gone) == 1 \
+                else 'devices {0} are gone'
+            raise XInputError(message.format(', '.join(gone)))
+        if stuck:
+            message = 'device {0} is still {1}' if len(stuck) == 1 \
+                else 'devices {0} are still {1}'
+            raise XInputError(
+                message.format(
+                    ', '.join(stuck), 'disabled' if enabled else 'enabled'
+                )
+            )
+
+    def record(self, device, enabled, source, result='ok'):
+        if self.audit is not None:
+            self.audit.record(
+                device, enabled, source or DEFAULT_SOURCE, result
+            )
+
+    async def hierarchy_changes(self):
+        """
+        Yields a `HierarchyChanged` event whenever devices are added, removed,
+        enabled or disabled, for as long as the iteration goes on:
+
+        >>> xi = AsyncXInput(events_command=['printf', '%s\\n',
+        ...     'EVENT type 13 (RawKeyPress)', '    device: 11 (11)',
+        ...     '    detail: 38', '    flags: ', '',
+        ...     'EVENT type 11 (HierarchyChanged)',
+        ...     '    Changes happened: [device enabled]', ''
+        ... ])
+        >>> async def print_changes():
+        ...     async for event in xi.hierarchy_changes():
+        ...         print(event)
+        >>> asyncio.run(print_changes())
+        Event('HierarchyChanged', None, None, None, '')
+        """
+        process = await asyncio.create_subprocess_exec(
+            *self.events_command, stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        parser = EventParser()
+        try:
+            async for line in process.stdout:
+                event = parser.feed(line.decode('utf-8', 'replace'))
+                if event is not None and event.type == 'HierarchyChanged':
+                    yield event
+        finally:
+            # Once the output is over, the process is just waited for:
+            # killing it would reap it before asyncio does.
+            if not process.stdout.at_eof():
+                process.kill()
+            await process.wait()
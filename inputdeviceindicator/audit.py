@@ -0,0 +1,245 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+from inputdeviceindicator.paths import get_state_dir
+
+
+DEFAULT_SETTINGS = {
+    'enabled': True,
+    'max_bytes': 1024 * 1024,
+    'backups': 3,
+}
+
+
+class AuditLog:
+    """
+    `AuditLog` records the changes of device states, as JSON lines, so it is
+    possible to know later who disabled a device, and when:
+
+    >>> import tempfile
+    >>> from inputdeviceindicator.command import Device
+    >>> path = os.path.join(tempfile.mkdtemp(), 'audit.jsonl')
+    >>> log = AuditLog(path, clock=lambda: 1600000000.0)
+    >>> touchpad = Device(12, 'Touchpad', 2, 'slave', 'pointer')
+    >>> log.record(touchpad, False, 'timer')
+    >>> log.record(touchpad, True, 'menu', 'device Touchpad is still disabled')
+
+    `record()` only queues the record, so it never waits for the disk: a
+    background thread writes the queued records in batches. `flush()` waits
+    for it:
+
+    >>> log.flush()
+    >>> print(open(path).read())
+    {"time":1600000000.0,"id":12,"name":"Touchpad","enabled":false,\
+"source":"timer","result":"ok"}
+    {"time":1600000000.0,"id":12,"name":"Touchpad","enabled":true,\
+"source":"menu","result":"device Touchpad is still disabled"}
+    <BLANKLINE>
+
+    Once the file is bigger than `max_bytes`, it is rotated, keeping up to
+    `backups` old files:
+
+    >>> log = AuditLog(path, max_bytes=200, backups=2)
+    >>> for i in range(6):
+    ...     log.record(touchpad, bool(i % 2), 'menu')
+    ...     log.flush()
+    >>> sorted(os.listdir(os.path.dirname(path)))
+    ['audit.jsonl', 'audit.jsonl.1', 'audit.jsonl.2']
+    """
+
+    def __init__(
+            self, path=None, max_bytes=DEFAULT_SETTINGS['max_bytes'],
+            backups=DEFAULT_SETTINGS['backups'], clock=time.time):
+        if path is None:
+            path = get_audit_path()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.clock = clock
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def record(self, device, enabled, source, result='ok'):
+        self.queue.put({
+            'time': self.clock(), 'id': device.id, 'name': device.name,
+            'enabled': enabled, 'source': source, 'result': result
+        })
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.write, daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def flush(self):
+        self.queue.join()
+
+    def write(self):
+        while True:
+            records = [self.queue.get()]
+            while True:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write_records(records)
+            except OSError:
+                # An audit log which cannot be written should not stop the
+                # indicator from working.
+                pass
+            finally:
+                for record in records:
+                    self.queue.task_done()
+
+    def write_records(self, records):
+        data = ''.join(
+            json.dumps(r, ensure_ascii=False, separators=(',', ':')) + '\n'
+            for r in records
+        ).encode('utf-8')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            size = 0
+        if size and size + len(data) > self.max_bytes:
+            self.rotate()
+        with open(self.path, 'ab') as f:
+            f.write(data)
+
+    def rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            old_path = '{0}.{1}'.format(self.path, i)
+            if os.path.exists(old_path):
+                os.replace(old_path, '{0}.{1}'.format(self.path, i + 1))
+        if self.backups > 0:
+            os.replace(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+
+
+def get_audit_path():
+    return os.path.join(get_state_dir(), 'audit.jsonl')
+
+
+def read_history(
+        path=None, device=None, since=None, until=None,
+        backups=DEFAULT_SETTINGS['backups']):
+    """
+    Reads the records of the audit log, oldest first, optionally only the
+    ones about a device (given by its name) and in a time range:
+
+    >>> import tempfile
+    >>> from inputdeviceindicator.command import Device
+    >>> path = os.path.join(tempfile.mkdtemp(), 'audit.jsonl')
+    >>> now = [1000.0]
+    >>> log = AuditLog(path, max_bytes=300, clock=lambda: now[0])
+    >>> touchpad = Device(12, 'Touchpad', 2, 'slave', 'pointer')
+    >>> keyboard = Device(11, 'AT keyboard', 3, 'slave', 'keyboard')
+    >>> for i in range(10):
+    ...     now[0] += 10
+    ...     log.record(touchpad if i % 2 else keyboard, False, 'menu')
+    ...     log.flush()
+    >>> [
+    ...     (r['time'], r['name'])
+    ...     for r in read_history(path, 'Touchpad', since=1035, until=1080)
+    ... ]
+    [(1040.0, 'Touchpad'), (1060.0, 'Touchpad'), (1080.0, 'Touchpad')]
+
+    Since records are written in order, rotated files entirely out of the
+    range are skipped after reading their first and last lines, and reading
+    a file stops at the first record after the range. Lines about other
+    devices are skipped before being parsed.
+    """
+    if path is None:
+        path = get_audit_path()
+    paths = [
+        '{0}.{1}'.format(path, i) for i in range(backups, 0, -1)
+    ] + [path]
+    marker = None
+    if device is not None:
+        marker = '"name":{0}'.format(
+            json.dumps(device, ensure_ascii=False)
+        ).encode('utf-8')
+    for p in paths:
+        try:
+            f = open(p, 'rb')
+        except FileNotFoundError:
+            continue
+        with f:
+            if not in_range(f, since, until):
+                continue
+            for line in f:
+                if marker is not None and marker not in line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if since is not None and record['time'] < since:
+                    continue
+                if until is not None and record['time'] > until:
+                    return
+                yield record
+
+
+def in_range(f, since, until):
+    """
+    Checks whether the records of an audit log file may be in a time range,
+    by reading only its first and last records.
+    """
+    if since is None and until is None:
+        return True
+    try:
+        first = json.loads(f.readline())
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        last = json.loads(f.read().splitlines()[-1])
+    except (ValueError, IndexError):
+        f.seek(0)
+        return True
+    f.seek(0)
+    if since is not None and last['time'] < since:
+        return False
+    if until is not None and first['time'] > until:
+        return False
+    return True
+
+
+def format_record(record):
+    """
+    Formats a record for the `history` command:
+
+    >>> print(format_record({
+    ...     'time': 0, 'id': 12, 'name': 'Touchpad', 'enabled': False,
+    ...     'source': 'timer', 'result': 'ok'
+    ... })) # doctest: +ELLIPSIS
+    19... Touchpad (12) disabled by timer: ok
+    """
+    return '{0} {1} ({2}) {3} by {4}: {5}'.format(
+        time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['time'])),
+        record['name'], record['id'],
+        'enabled' if record['enabled'] else 'disabled', record['source'],
+        record['result']
+    )
@@ -0,0 +1,236 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import importlib.metadata
+import json
+import os
+import time
+
+from inputdeviceindicator.command import XInputError
+from inputdeviceindicator.paths import get_runtime_dir
+
+
+ENTRY_POINT_GROUP = 'inputdeviceindicator.backends'
+BUILTIN_BACKENDS = {
+    'xinput': 'inputdeviceindicator.command:XInput',
+    'evdev': 'inputdeviceindicator.evdev:EvdevInput',
+}
+DEFAULT_BACKEND = 'xinput'
+SESSION_VARIABLES = ['XDG_SESSION_ID', 'DISPLAY', 'WAYLAND_DISPLAY']
+
+
+class BackendError(Exception):
+    """
+    Raised when the requested backend does not exist.
+    """
+
+
+def find_backends():
+    """
+    Finds the available backends, as a dict from their names to entry points
+    loading their classes. Besides the built-in ones, other packages can
+    register backends (implementing `inputdeviceindicator.command.Backend`)
+    as entry points in the "inputdeviceindicator.backends" group:
+
+    >>> backends = find_backends()
+    >>> backends['xinput'].load()
+    <class 'inputdeviceindicator.command.XInput'>
+    >>> backends['evdev'].load()
+    <class 'inputdeviceindicator.evdev.EvdevInput'>
+    """
+    backends = {
+        name: importlib.metadata.EntryPoint(name, value, ENTRY_POINT_GROUP)
+        for name, value in BUILTIN_BACKENDS.items()
+    }
+    entry_points = importlib.metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        entry_points = entry_points.select(group=ENTRY_POINT_GROUP)
+    else:
+        entry_points = entry_points.get(ENTRY_POINT_GROUP, [])
+    for entry_point in entry_points:
+        backends[entry_point.name] = entry_point
+    return backends
+
+
+def probe_backends(backends, timeouts=None, clock=time.perf_counter):
+    """
+    Creates and probes the given backends. Returns a dict from the backend
+    names to how long their probes took, or `None` for the backends which
+    do not work, and a dict with the working backends:
+
+    >>> from inputdeviceindicator.mock import MockBackend
+    >>> results, working = probe_backends(
+    ...     {'slow': MockBackend.entry_point(duration=3),
+    ...      'broken': MockBackend.entry_point(works=False)},
+    ...     clock=MockBackend.clock
+    ... )
+    >>> results
+    {'slow': 3, 'broken': None}
+    >>> list(working)
+    ['slow']
+    """
+    results = {}
+    working = {}
+    for name, entry_point in backends.items():
+        try:
+            backend = entry_point.load()(timeouts=timeouts)
+            start = clock()
+            backend.probe()
+            results[name] = clock() - start
+            working[name] = backend
+        except (XInputError, OSError, ImportError, AttributeError):
+            results[name] = None
+    return results, working
+
+
+class ProbeCache:
+    """
+    `ProbeCache` keeps the probe results for the current session, so later
+    launches in the same session do not probe the backends again:
+
+    >>> import tempfile
+    >>> cache = ProbeCache(os.path.join(tempfile.mkdtemp(), 'backends.json'))
+    >>> cache.load('session 1')
+    >>> cache.save('session 1', {'xinput': 0.01, 'evdev': None})
+    >>> cache.load('session 1')
+    {'xinput': 0.01, 'evdev': None}
+
+    Results from other sessions are ignored:
+
+    >>> cache.load('session 2')
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(get_runtime_dir(), 'backends.json')
+        self.path = path
+
+    def load(self, session):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data['session'] != session:
+                return None
+            return {
+                str(name): None if duration is None else float(duration)
+                for name, duration in data['results'].items()
+            }
+        except (OSError, ValueError, TypeError, KeyError, AttributeError):
+            return None
+
+    def save(self, session, results):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'session': session, 'results': results}, f)
+        os.replace(temp_path, self.path)
+
+
+def get_session():
+    """
+    Returns a key identifying the current session, from its environment.
+    """
+    return '|'.join(os.environ.get(v, '') for v in SESSION_VARIABLES)
+
+
+def select_backend(
+        name=None, timeouts=None, backends=None, cache=None, session=None,
+        clock=time.perf_counter, environ=None):
+    """
+    Creates the backend with the given name:
+
+    >>> from inputdeviceindicator.mock import MockBackend
+    >>> backends = {
+    ...     'fast': MockBackend.entry_point(duration=1),
+    ...     'faster': MockBackend.entry_point(duration=0.5),
+    ...     'broken': MockBackend.entry_point(works=False)
+    ... }
+    >>> select_backend('fast', backends=backends)
+    MockBackend(duration=1)
+    >>> select_backend('slow', backends=backends)
+    Traceback (most recent call last):
+      ...
+    inputdeviceindicator.backends.BackendError: unknown backend 'slow', \
+expected one of broken, fast, faster
+
+    Without a name, in an X session (i.e. with `$DISPLAY` set), `xinput` is
+    used, since the ids of the other backends do not match the XI2 ids of
+    the events and settings:
+
+    >>> backends['xinput'] = MockBackend.entry_point(duration=2)
+    >>> select_backend(backends=backends, environ={'DISPLAY': ':0'})
+    MockBackend(duration=2)
+    >>> del backends['xinput']
+
+    Otherwise, the fastest working backend is chosen by probing them all.
+    The results are cached for the session:
+
+    >>> import tempfile
+    >>> cache = ProbeCache(os.path.join(tempfile.mkdtemp(), 'backends.json'))
+    >>> select_backend(
+    ...     backends=backends, cache=cache, session='s',
+    ...     clock=MockBackend.clock, environ={}
+    ... )
+    MockBackend(duration=0.5)
+    >>> cache.load('s')
+    {'fast': 1.0, 'faster': 0.5, 'broken': None}
+
+    So, in the same session, the backends are not probed again:
+
+    >>> cache.save('s', {'fast': 0.1, 'faster': 0.5, 'broken': None})
+    >>> select_backend(
+    ...     backends=backends, cache=cache, session='s', environ={}
+    ... )
+    MockBackend(duration=1)
+
+    If no backend works, `xinput` is used anyway, so its errors are shown.
+    """
+    if backends is None:
+        backends = find_backends()
+    if name is not None:
+        if name not in backends:
+            raise BackendError(
+                'unknown backend {0!r}, expected one of {1}'.format(
+                    name, ', '.join(sorted(backends))
+                )
+            )
+        return backends[name].load()(timeouts=timeouts)
+    if environ is None:
+        environ = os.environ
+    if environ.get('DISPLAY') and DEFAULT_BACKEND in backends:
+        return backends[DEFAULT_BACKEND].load()(timeouts=timeouts)
+
+    if cache is None:
+        cache = ProbeCache()
+    if session is None:
+        session = get_session()
+    results = cache.load(session)
+    working = {}
+    if results is None:
+        results, working = probe_backends(backends, timeouts, clock)
+        try:
+            cache.save(session, results)
+        except OSError:
+            pass
+    durations = sorted(
+        (duration, name) for name, duration in results.items()
+        if duration is not None and name in backends
+    )
+    name = durations[0][1] if durations else DEFAULT_BACKEND
+    if name in working:
+        return working[name]
+    return backends[name].load()(timeouts=timeouts)
@@ -0,0 +1,345 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+from collections import deque
+
+from inputdeviceindicator.command import XInputError
+
+
+MODIFIER_KEYCODES = frozenset([
+    37,   # Control_L
+    50,   # Shift_L
+    62,   # Shift_R
+    64,   # Alt_L
+    66,   # Caps_Lock
+    105,  # Control_R
+    108,  # Alt_R / ISO_Level3_Shift
+    133,  # Super_L
+    134,  # Super_R
+])
+
+DEFAULT_SETTINGS = {
+    'enabled': False,
+    'max_held_keys': 6,
+    'max_chord_keys': 4,
+    'max_presses': 25,
+    'window': 1.0,
+    'max_repeats': 100,
+    'unlock': {
+        'type': 'RawButtonPress',
+        'detail': 1,
+        'count': 3,
+        'window': 1.5,
+    },
+}
+
+
+class KeyMashClassifier:
+    """
+    `KeyMashClassifier` decides, from the raw key events of one keyboard,
+    whether it is being typed on or mashed (say, by a cat lying on it). It
+    uses constant memory: the set of held keys is bounded by the number of
+    keycodes, and the recent presses are kept in a fixed-size queue.
+
+    >>> from inputdeviceindicator.events import Event
+    >>> def press(keycode, time, flags=''):
+    ...     return Event('RawKeyPress', 11, 11, keycode, flags, time=time)
+    >>> def release(keycode, time):
+    ...     return Event('RawKeyRelease', 11, 11, keycode, time=time)
+
+    Normal typing, even fast typing with some rollover, is fine:
+
+    >>> classifier = KeyMashClassifier()
+    >>> events = []
+    >>> for i, keycode in enumerate([43, 26, 46, 46, 32] * 4):
+    ...     events.append(press(keycode, i * 0.1))
+    ...     events.append(release(keycode, i * 0.1 + 0.05))
+    >>> any(classifier.feed(e) for e in events)
+    False
+
+    So is holding modifiers while pressing a key:
+
+    >>> classifier = KeyMashClassifier()
+    >>> any(classifier.feed(press(k, 0)) for k in [37, 50, 64, 133, 119])
+    False
+
+    Holding many keys at once is not:
+
+    >>> classifier = KeyMashClassifier()
+    >>> [classifier.feed(press(k, 0)) for k in [37, 50, 64, 105, 133, 24]]
+    [False, False, False, False, False, True]
+
+    Neither are implausible chords, such as four letters at once...
+
+    >>> classifier = KeyMashClassifier()
+    >>> [classifier.feed(press(k, 0)) for k in [37, 24, 52, 33, 61]]
+    [False, False, False, False, True]
+
+    ...nor too many presses in a short window...
+
+    >>> classifier = KeyMashClassifier(max_presses=10, window=1.0)
+    >>> results = []
+    >>> for i in range(12):
+    ...     results.append(classifier.feed(press(24 + i % 2, i * 0.05)))
+    ...     results.append(classifier.feed(release(24 + i % 2, i * 0.05)))
+    >>> results.index(True) // 2
+    10
+
+    ...nor a storm of repetitions of a single key:
+
+    >>> classifier = KeyMashClassifier(max_repeats=50)
+    >>> results = [
+    ...     classifier.feed(press(24, i * 0.04, 'repeat')) for i in range(60)
+    ... ]
+    >>> results.index(True)
+    50
+    """
+
+    def __init__(
+            self, max_held_keys=6, max_chord_keys=4, max_presses=25,
+            window=1.0, max_repeats=100):
+        self.max_held_keys = max_held_keys
+        self.max_chord_keys = max_chord_keys
+        self.max_repeats = max_repeats
+        self.window = window
+        self.held = set()
+        self.presses = deque(maxlen=max_presses + 1)
+        self.last_keycode = None
+        self.repeats = 0
+
+    def feed(self, event):
+        if event.type == 'RawKeyRelease':
+            self.held.discard(event.detail)
+            return False
+        if event.type != 'RawKeyPress':
+            return False
+
+        if event.detail == self.last_keycode and \
+                (event.repeat or event.detail in self.held):
+            self.repeats += 1
+        else:
+            self.last_keycode = event.detail
+            self.repeats = 0
+            self.presses.append(event.time)
+        self.held.add(event.detail)
+
+        return (
+            len(self.held) >= self.max_held_keys or
+            len(self.held - MODIFIER_KEYCODES) >= self.max_chord_keys or
+            self.repeats >= self.max_repeats or
+            (
+                len(self.presses) == self.presses.maxlen and
+                self.presses[-1] - self.presses[0] < self.window
+            )
+        )
+
+    def reset(self):
+        self.held.clear()
+        self.presses.clear()
+        self.last_keycode = None
+        self.repeats = 0
+
+
+class UnlockGesture:
+    """
+    `UnlockGesture` recognizes a repeated event, by default a triple click
+    with the left button:
+
+    >>> from inputdeviceindicator.events import Event
+    >>> def click(time):
+    ...     return Event('RawButtonPress', 12, 12, 1, time=time)
+    >>> gesture = UnlockGesture()
+    >>> [gesture.feed(click(t)) for t in [0, 2.0, 4.0, 4.2, 4.4]]
+    [False, False, False, False, True]
+
+    Other events are ignored:
+
+    >>> gesture.feed(Event('RawButtonPress', 12, 12, 3, time=2.5))
+    False
+    """
+
+    def __init__(self, type='RawButtonPress', detail=1, count=3, window=1.5):
+        self.type = type
+        self.detail = detail
+        self.window = window
+        self.times = deque(maxlen=count)
+
+    def feed(self, event):
+        if event.type != self.type or event.detail != self.detail:
+            return False
+        self.times.append(event.time)
+        if len(self.times) == self.times.maxlen and \
+                self.times[-1] - self.times[0] <= self.window:
+            self.times.clear()
+            return True
+        return False
+
+
+class CatDetector:
+    """
+    `CatDetector` watches the raw key events of every slave keyboard and
+    disables the keyboard that seems to be mashed. It is enabled again when
+    the unlock gesture is done with another device.
+
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.events import Event
+    >>> from inputdeviceindicator.mock import MockXInput, MockEventMonitor
+    >>> xinput = MockXInput(parse('''
+    ... ⎡ Pointer            id=2    [master pointer  (3)]
+    ... ⎜   ↳ Touchpad       id=12   [slave  pointer  (2)]
+    ... ⎣ Keyboard           id=3    [master keyboard (2)]
+    ...     ↳ Laptop keys    id=11   [slave  keyboard (3)]
+    ... '''))
+    >>> monitor = MockEventMonitor()
+    >>> detector = CatDetector(xinput, monitor)
+    >>> detector.start()
+
+    When the keyboard is mashed, it is disabled right away:
+
+    >>> for keycode in [24, 25, 26, 27, 38, 39, 40]:
+    ...     monitor.dispatch(Event('RawKeyPress', 11, 11, keycode, time=0))
+    Device Laptop keys disabled
+
+    A triple click from the touchpad enables it again:
+
+    >>> for t in [5.0, 5.2, 5.4]:
+    ...     monitor.dispatch(Event('RawButtonPress', 12, 12, 1, time=t))
+    Device Laptop keys enabled
+
+    The device list is updated when the devices change:
+
+    >>> xinput.devices[1].children[0].name = 'Laptop keyboard'
+    >>> monitor.dispatch(Event('HierarchyChanged'))
+    >>> for keycode in [24, 25, 26, 27, 38, 39, 40]:
+    ...     monitor.dispatch(Event('RawKeyPress', 11, 11, keycode, time=9))
+    Device Laptop keyboard disabled
+
+    Once stopped, it does not receive events anymore:
+
+    >>> detector.stop()
+    >>> monitor.listeners
+    []
+
+    With a real X server, keys mashed through XTEST (here, by `xdotool`)
+    disable the XTEST keyboard:
+
+    >>> import os
+    >>> import subprocess
+    >>> import time
+    >>> from gi.repository import GLib as glib
+    >>> from inputdeviceindicator.command import XInput
+    >>> from inputdeviceindicator.events import EVENT_COMMAND, EventMonitor
+    >>> from inputdeviceindicator.mock import start_xvfb
+    >>> process, display = start_xvfb()
+    >>> env = dict(os.environ, DISPLAY=display)
+    >>> xinput = XInput(display=display)
+    >>> monitor = EventMonitor(['env', 'DISPLAY=' + display] + EVENT_COMMAND)
+    >>> detector = CatDetector(xinput, monitor)
+    >>> detector.start()
+    >>> time.sleep(0.5) # Until xinput test-xi2 listens to the events.
+    >>> keys = ['a', 's', 'd', 'f', 'g', 'h']
+    >>> subprocess.run(['xdotool', 'keydown'] + keys, env=env).returncode
+    0
+    >>> deadline = time.monotonic() + 5
+    >>> while not detector.locked and time.monotonic() < deadline:
+    ...     _ = glib.MainContext.default().iteration(False)
+    ...     time.sleep(0.01)
+    >>> [d.name for d in detector.locked.values()]
+    ['Virtual core XTEST keyboard']
+    >>> keyboard = next(
+    ...     c for d in xinput.list() for c in d.children
+    ...     if c.name == 'Virtual core XTEST keyboard'
+    ... )
+    >>> xinput.get_enabled(keyboard)
+    False
+    >>> detector.stop()
+    >>> process.terminate()
+    >>> _ = process.wait()
+    """
+
+    def __init__(self, xinput, monitor, settings=None, on_error=None):
+        settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+        self.xinput = xinput
+        self.monitor = monitor
+        self.on_error = on_error
+        self.classifier_settings = {
+            name: settings[name] for name in [
+                'max_held_keys', 'max_chord_keys', 'max_presses', 'window',
+                'max_repeats'
+            ]
+        }
+        self.unlock_gesture = UnlockGesture(**settings['unlock'])
+        self.keyboards = {}
+        self.classifiers = {}
+        self.locked = {}
+
+    def start(self):
+        self.update_keyboards()
+        self.monitor.subscribe(self.handle_event, {
+            'HierarchyChanged', 'RawKeyPress', 'RawKeyRelease',
+            self.unlock_gesture.type
+        })
+
+    def stop(self):
+        self.monitor.unsubscribe(self.handle_event)
+
+    def update_keyboards(self):
+        try:
+            devices = self.xinput.get_devices()
+        except XInputError as e:
+            self.report(e)
+            return
+        self.keyboards = {
+            c.id: c for d in devices if d.type == 'keyboard'
+            for c in d.children
+        }
+
+    def handle_event(self, event):
+        if event.type == 'HierarchyChanged':
+            self.update_keyboards()
+        elif event.source_id in self.keyboards and \
+                event.source_id not in self.locked:
+            classifier = self.classifiers.get(event.source_id)
+            if classifier is None:
+                classifier = KeyMashClassifier(**self.classifier_settings)
+                self.classifiers[event.source_id] = classifier
+            if classifier.feed(event):
+                self.lock(self.keyboards[event.source_id])
+                classifier.reset()
+        elif self.locked and self.unlock_gesture.feed(event):
+            self.unlock()
+
+    def lock(self, device):
+        try:
+            self.xinput.disable(device, 'cat detector')
+        except XInputError as e:
+            self.report(e)
+            return
+        self.locked[device.id] = device
+
+    def unlock(self):
+        for device in list(self.locked.values()):
+            try:
+                self.xinput.enable(device, 'cat detector')
+            except XInputError as e:
+                self.report(e)
+                continue
+            del self.locked[device.id]
+
+    def report(self, error):
+        if self.on_error is not None:
+            self.on_error(error)
@@ -15,11 +15,259 @@
 # You should have received a copy of the GNU General Public License along with
 # Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
 
+import abc
+import os
 import re
 import subprocess
+import threading
+import time
 
 
-class XInput:
+DEFAULT_TIMEOUTS = {
+    'list': 5.0,
+    'list-props': 2.0,
+    'set-prop': 2.0,
+    'enable': 2.0,
+    'disable': 2.0,
+}
+
+DEVICE_CACHE_TTL = 60.0
+
+DEFAULT_SOURCE = 'indicator'
+
+ENABLED_PROPERTY_REGEX = re.compile(
+    r'^\s*Device Enabled \(\d+\):\s*(?P<value>\d)', re.MULTILINE
+)
+
+
+class XInputError(Exception):
+    """
+    Raised when an `xinput` invocation fails.
+    """
+
+
+class XInputTimeout(XInputError):
+    """
+    Raised when `xinput` does not finish in time (and then is killed).
+    """
+
+
+class XInputUnavailable(XInputError):
+    """
+    Raised, without invoking `xinput`, when it failed too many times in a row
+    and the circuit breaker is waiting before trying again.
+    """
+
+
+class Backend(abc.ABC):
+    """
+    `Backend` is the interface of the objects which list, enable and disable
+    devices for the indicator. `XInput` is the main one; others are found by
+    `inputdeviceindicator.backends`.
+
+    Devices are listed by `list()`, and `get_devices()` returns them from a
+    cache, which `invalidate()` discards. `set_enabled_many()` enables or
+    disables many devices at once, notifying the functions registered by
+    `add_listener()` (through `notify()`), and raising `XInputError` on
+    failures. `enable()` and `disable()` are shortcuts for a single device:
+
+    >>> class MyBackend(Backend):
+    ...     def list(self):
+    ...         return []
+    ...     def set_enabled_many(self, devices, enabled, source=None):
+    ...         print(devices, enabled)
+    >>> MyBackend().disable('Touchpad')
+    ['Touchpad'] False
+
+    `list()` and `set_enabled_many()` are abstract, so a backend cannot be
+    created without them:
+
+    >>> class IncompleteBackend(Backend):
+    ...     def list(self):
+    ...         return []
+    >>> IncompleteBackend() # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+      ...
+    TypeError: Can't instantiate abstract class IncompleteBackend...
+
+    Backends without device properties keep the default `get_properties()`,
+    which returns no properties, and `set_properties()`, which fails.
+
+    Each change is attributed to a `source` (the feature which asked for it,
+    such as "menu" or "timer") and recorded, with its result, in the
+    `audit` log, if there is one. Changes made by other programs are
+    recorded with the "external" source.
+
+    Changes in the devices are learned from the XI2 events (as
+    `event_received()` calls) and from the kernel uevents (as
+    `uevent_received()` calls); `event_source` tells which of them the
+    backend depends on. Only the XI2 events in `event_types` are given to
+    `event_received()`.
+
+    `probe()` checks whether the backend works in the current session,
+    raising an error if it does not.
+    """
+
+    event_source = 'xi2'
+    event_types = frozenset(['HierarchyChanged', 'PropertyEvent'])
+    audit = None
+
+    def __init__(self, dispatch=None):
+        self.dispatch = dispatch
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """
+        Registers a function to be called with the device and its new state
+        whenever `enable()` or `disable()` succeeds:
+
+        >>> xi = XInput()
+        >>> device = xi.list()[1].children[-1]
+        >>> current_status = device.enabled
+        >>> xi.add_listener(
+        ...     lambda d, enabled: print(d.name == device.name, enabled)
+        ... )
+        >>> xi.disable(device)
+        True False
+        >>> xi.enable(device)
+        True True
+        >>> xi.listeners.clear()
+        >>> if not current_status:
+        ...    xi.disable(device)
+
+        This way, all parts of the indicator learn about changes made by any
+        of them.
+
+        Listeners are called in the thread which made the change, unless it
+        is not the main thread and a `dispatch` function (such as
+        `GLib.idle_add`) was given to the constructor. Then, the listeners
+        are handed over to it instead.
+        """
+        self.listeners.append(listener)
+
+    def notify(self, device, enabled):
+        in_main_thread = threading.current_thread() is threading.main_thread()
+        for listener in list(self.listeners):
+            if self.dispatch is None or in_main_thread:
+                listener(device, enabled)
+            else:
+                self.dispatch(listener, device, enabled)
+
+    @abc.abstractmethod
+    def list(self):
+        pass
+
+    def get_devices(self):
+        return self.list()
+
+    def invalidate(self):
+        pass
+
+    def event_received(self, event):
+        pass
+
+    def uevent_received(self, uevent):
+        pass
+
+    def get_properties(self, devices):
+        return {d.id: {} for d in devices}
+
+    def set_properties(self, device, values):
+        raise XInputError(
+            'properties cannot be set on device {0}'.format(device.name)
+        )
+
+    @abc.abstractmethod
+    def set_enabled_many(self, devices, enabled, source=None):
+        pass
+
+    def disable(self, device, source=None):
+        self.set_enabled_many([device], False, source)
+
+    def enable(self, device, source=None):
+        self.set_enabled_many([device], True, source)
+
+    def probe(self):
+        self.list()
+
+    def record(self, device, enabled, source, result='ok'):
+        if self.audit is not None:
+            self.audit.record(
+                device, enabled, source or DEFAULT_SOURCE, result
+            )
+
+
+class XInput(Backend):
+
+    def __init__(
+            self, timeouts=None, breaker=None, dispatch=None,
+            cache_ttl=DEVICE_CACHE_TTL, clock=time.monotonic, display=None):
+        Backend.__init__(self, dispatch)
+        self.display = display
+        self.env = dict(os.environ, DISPLAY=display) \
+            if display is not None else None
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.cache_ttl = cache_ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.devices = None
+        self.listed_at = None
+        self.properties = {}
+
+    def run(self, operation, arguments):
+        """
+        Invokes `xinput` with the given arguments, killing it if it takes
+        longer than the timeout of the operation, and returns its output:
+
+        >>> xi = XInput(timeouts={'list': 0.000001})
+        >>> xi.run('list', ['list'])
+        Traceback (most recent call last):
+          ...
+        inputdeviceindicator.command.XInputTimeout: xinput list timed out \
+after 1e-06 seconds
+
+        If `xinput` fails, an `XInputError` is raised with its error message:
+
+        >>> xi = XInput()
+        >>> xi.run('enable', ['--enable', '-1'])
+        Traceback (most recent call last):
+          ...
+        inputdeviceindicator.command.XInputError: unable to find device -1
+
+        Timeouts, and failures to connect to the X server, count as failures
+        for the circuit breaker, which stops invoking `xinput` once there are
+        too many of them.
+
+        If a `display` was given to the constructor, `xinput` talks to that X
+        server, and not to the one in `$DISPLAY`.
+        """
+        self.breaker.check()
+        try:
+            cp = subprocess.run(
+                ['xinput'] + arguments, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, timeout=self.timeouts[operation],
+                env=self.env
+            )
+        except subprocess.TimeoutExpired:
+            self.breaker.failure()
+            raise XInputTimeout(
+                'xinput {0} timed out after {1} seconds'.format(
+                    operation, self.timeouts[operation]
+                )
+            )
+        except OSError as e:
+            self.breaker.failure()
+            raise XInputError('could not run xinput: {0}'.format(e))
+
+        if cp.returncode != 0:
+            message = cp.stderr.decode('utf-8', 'replace').strip()
+            if 'Unable to connect to X server' in message:
+                self.breaker.failure()
+            raise XInputError(message or 'xinput {0} failed'.format(operation))
+        self.breaker.success()
+        return cp.stdout.decode('utf-8')
 
     def list(self):
         """
@@ -29,13 +277,401 @@ class XInput:
         >>> xi.list() # doctest: +ELLIPSIS
         [Device(..., ..., ..., [Device(...)]), Device(..., ..., ...)]
         """
-        cp = subprocess.run(
-            ['xinput', 'list', '--long'], stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        return parse(cp.stdout.decode('utf-8'))
+        devices = parse(self.run('list', ['list', '--long']))
+        with self.lock:
+            previous_devices = self.devices
+            self.devices = devices
+            self.listed_at = self.clock()
+            self.properties.clear()
+        if previous_devices is not None and self.audit is not None:
+            for device in (c for d in devices for c in [d] + d.children):
+                previous = get_device_from_list_by_id(
+                    previous_devices, device.id
+                )
+                if previous is not None and \
+                        previous.enabled != device.enabled:
+                    self.record(device, device.enabled, 'external')
+        return devices
 
-    def disable(self, device):
+    def get_devices(self):
+        """
+        Returns the devices from the last listing, if it is not older than
+        `cache_ttl` seconds and was not invalidated; otherwise, lists them
+        again:
+
+        >>> now = [0]
+        >>> xi = XInput(cache_ttl=10, clock=lambda: now[0])
+        >>> devices = xi.get_devices()
+        >>> xi.get_devices() is devices
+        True
+        >>> now[0] = 11
+        >>> xi.get_devices() is devices
+        False
+
+        The cache is kept up to date by `enable()` and `disable()`, so
+        toggling devices does not require listing them again. Changes made
+        elsewhere (e.g. by another program) are noticed when the devices
+        are listed again, or through `event_received()`.
+        """
+        with self.lock:
+            devices = self.devices
+            fresh = devices is not None and \
+                self.clock() - self.listed_at < self.cache_ttl
+        if fresh:
+            return devices
+        return self.list()
+
+    def invalidate(self):
+        """
+        Discards the cached devices and properties, so they are read again
+        the next time they are needed.
+        """
+        with self.lock:
+            self.devices = None
+            self.properties.clear()
+
+    def event_received(self, event):
+        """
+        Keeps the cache up to date with the events reported by an
+        `EventMonitor`: it is invalidated when devices are added or removed,
+        the properties of a device are discarded when one of them changes,
+        and the state of a cached device is read again when it changes.
+        """
+        if event.type == 'HierarchyChanged':
+            self.invalidate()
+        elif event.type == 'PropertyEvent':
+            with self.lock:
+                self.properties.pop(event.device_id, None)
+        if event.type == 'PropertyEvent' and \
+                event.property == 'Device Enabled':
+            with self.lock:
+                devices = self.devices or []
+            device = get_device_from_list_by_id(devices, event.device_id)
+            if device is None:
+                return
+            try:
+                enabled = self.get_enabled(device)
+            except XInputError:
+                self.invalidate()
+                return
+            if enabled != device.enabled:
+                device.enabled = enabled
+                self.record(device, enabled, 'external')
+                self.notify(device, enabled)
+
+    def uevent_received(self, uevent):
+        """
+        Keeps the cache up to date with the kernel uevents reported by a
+        `UeventMonitor`, so devices plugged or unplugged are noticed without
+        polling `xinput`. The cached devices behind a removed device node
+        (found by their "Device Node" property) are marked as stale, and the
+        cache is invalidated:
+
+        >>> from inputdeviceindicator.sysfs import Uevent
+        >>> xi = XInput()
+        >>> xi.devices = parse('''
+        ... ⎡ Pointer      id=2    [master pointer  (3)]
+        ... ⎜   ↳ Mouse    id=4    [slave  pointer  (2)]
+        ... ⎜   ↳ Touchpad id=5    [slave  pointer  (2)]
+        ... ''')
+        >>> mouse, touchpad = xi.devices[0].children
+        >>> xi.properties = {
+        ...     4: {'Device Node': ['/dev/input/event4']},
+        ...     5: {'Device Node': ['/dev/input/event5']},
+        ... }
+        >>> xi.uevent_received(Uevent('remove', '/dev/input/event4'))
+        >>> mouse.stale, touchpad.stale, xi.devices
+        (True, False, None)
+
+        Changes in existing nodes are ignored.
+        """
+        # Imported here because sysfs needs GLib, which XInput does not.
+        from inputdeviceindicator.sysfs import SysfsDevice, match_devices
+
+        if uevent.action == 'change' and uevent.node is not None:
+            return
+        if uevent.action == 'remove' and uevent.node is not None:
+            with self.lock:
+                devices = self.devices or []
+                properties = dict(self.properties)
+            removed = SysfsDevice(uevent.node, None, None, None, None, {})
+            matches = match_devices(devices, properties, [removed])
+            for device in (c for d in devices for c in d.children):
+                if device.id in matches:
+                    device.stale = True
+        self.invalidate()
+
+    def get_enabled(self, device):
+        """
+        Reads the current state of a single device, which is way cheaper than
+        listing all of them:
+
+        >>> xi = XInput()
+        >>> device = xi.list()[1].children[-1]
+        >>> xi.get_enabled(device) == device.enabled
+        True
+        """
+        output = self.run('list-props', ['list-props', str(device.id)])
+        m = ENABLED_PROPERTY_REGEX.search(output)
+        if m is None:
+            raise XInputError(
+                'could not read the state of device {0}'.format(device.name)
+            )
+        return m.group('value') == '1'
+
+    def get_properties(self, devices):
+        """
+        Returns the properties of the given devices, as a dict from device
+        ids to dicts from property names to their values:
+
+        >>> xi = XInput()
+        >>> devices = xi.list()[1].children
+        >>> properties = xi.get_properties(devices)
+        >>> properties[devices[0].id]['Device Enabled'] # doctest: +ELLIPSIS
+        ['...']
+
+        The properties of all devices not in the cache are read by a single
+        `xinput list-props` call (or one per device with the same name as
+        another, see `split_by_name()`), and then cached until they change:
+
+        >>> xi.get_properties(devices) == properties
+        True
+
+        Devices which `xinput` does not know anymore (e.g. because they were
+        unplugged) are marked as stale, have no properties, and the device
+        cache is invalidated (see `match_properties()`).
+        """
+        with self.lock:
+            missing = [d for d in devices if d.id not in self.properties]
+        if missing:
+            matched = {}
+            for batch in split_by_name(missing):
+                output = self.run(
+                    'list-props', ['list-props'] + [str(d.id) for d in batch]
+                )
+                matched.update(
+                    match_properties(batch, parse_properties(output))
+                )
+            gone = [d for d in missing if d.id not in matched]
+            for device in gone:
+                device.stale = True
+            with self.lock:
+                self.properties.update(matched)
+                if gone:
+                    self.devices = None
+        with self.lock:
+            return {
+                d.id: dict(self.properties.get(d.id, {})) for d in devices
+            }
+
+    def set_properties(self, device, values):
+        """
+        Sets many properties of a device at once, given a dict from property
+        names to values (a value or a list of them, for properties with many
+        items):
+
+        >>> xi = XInput()
+        >>> device = xi.list()[1].children[-1]
+        >>> xi.set_properties(device, {'Device Enabled': 1})
+        >>> xi.get_properties([device])[device.id]['Device Enabled']
+        ['1']
+
+        `xinput set-prop` only sets one property per call, so properties
+        which already have the given values are skipped, and all writes are
+        confirmed by reading the properties back only once.
+        """
+        current = self.get_properties([device])[device.id]
+        changed = False
+        for name, value in values.items():
+            value = [
+                str(v) for v in (value if isinstance(value, list) else [value])
+            ]
+            if current.get(name) == value:
+                continue
+            self.run(
+                'set-prop', ['set-prop', str(device.id), name] + value
+            )
+            changed = True
+        if changed:
+            with self.lock:
+                self.properties.pop(device.id, None)
+            self.get_properties([device])
+
+    def set_enabled_many(self, devices, enabled, source=None):
+        """
+        Enables or disables many devices at once: `xinput` is invoked for all
+        of them in parallel, and their new states are confirmed by a single
+        `xinput list-props` call:
+
+        >>> xi = XInput()
+        >>> devices = xi.list()[1].children
+        >>> # For restoring later.
+        >>> current_statuses = [d.enabled for d in devices]
+        >>> xi.set_enabled_many(devices[-2:], False)
+        >>> [d.enabled for d in devices[-2:]]
+        [False, False]
+        >>> xi.set_enabled_many(devices[-2:], True)
+        >>> [d.enabled for d in devices[-2:]]
+        [True, True]
+
+        >>> for d, status in zip(devices, current_statuses):
+        ...     if not status:
+        ...         xi.disable(d)
+
+        The listeners are notified about each device, and each change is
+        recorded in the audit log, with its source:
+
+        >>> from inputdeviceindicator.mock import MockAuditLog
+        >>> xi.audit = MockAuditLog()
+        >>> device = devices[-1]
+        >>> xi.set_enabled_many([device], False, 'menu') # doctest: +ELLIPSIS
+        Audit: ... disabled by menu: ok
+        >>> xi.set_enabled_many([device], True) # doctest: +ELLIPSIS
+        Audit: ... enabled by indicator: ok
+
+        If some invocations fail, the devices changed by the others are still
+        confirmed, notified and recorded, and the failures are recorded with
+        their error before it is raised:
+
+        >>> ghost = Device(-1, 'Ghost', 3, 'slave', 'keyboard')
+        >>> try:
+        ...     xi.set_enabled_many([device, ghost], False, 'menu')
+        ... except XInputError as e:
+        ...     print(e) # doctest: +ELLIPSIS
+        Audit: ... disabled by menu: ok
+        Audit: Ghost disabled by menu: unable to find device -1
+        unable to find device -1
+        >>> device.enabled
+        False
+        >>> xi.audit = None
+        >>> if current_statuses[-1]:
+        ...     xi.enable(device)
+        """
+        if not devices:
+            return
+        operation = 'enable' if enabled else 'disable'
+        error = None
+        try:
+            self.run_many(
+                operation, [['--' + operation, str(d.id)] for d in devices]
+            )
+        except XInputError as e:
+            # Some devices may have changed anyway, so their states are read
+            # back before reporting the error.
+            error = e
+        with self.lock:
+            for d in devices:
+                self.properties.pop(d.id, None)
+        try:
+            properties = self.get_properties(devices)
+        except XInputError as e:
+            for device in devices:
+                self.record(device, enabled, source, str(error or e))
+            raise error or e
+        with self.lock:
+            cached_devices = self.devices or []
+        stuck = []
+        gone = []
+        for device in devices:
+            if device.stale:
+                gone.append(device.name)
+                self.record(
+                    device, enabled, source,
+                    str(error) if error is not None
+                    else 'device {0} is gone'.format(device.name)
+                )
+                continue
+            actual = properties[device.id].get('Device Enabled') == ['1']
+            cached = get_device_from_list_by_id(cached_devices, device.id)
+            for d in (device, cached):
+                if d is not None:
+                    d.enabled = actual
+            if actual != enabled:
+                stuck.append(device.name)
+                self.record(
+                    device, enabled, source,
+                    str(error) if error is not None
+                    else 'device {0} is still {1}'.format(
+                        device.name, 'disabled' if enabled else 'enabled'
+                    )
+                )
+            else:
+                self.record(device, enabled, source)
+            self.notify(device, actual)
+        if error is not None:
+            raise error
+        if gone:
+            message = 'device {0} is gone' if len(gone) == 1 \
+                else 'devices {0} are gone'
+            raise XInputError(message.format(', '.join(gone)))
+        if stuck:
+            message = 'device {0} is still {1}' if len(stuck) == 1 \
+                else 'devices {0} are still {1}'
+            raise XInputError(
+                message.format(
+                    ', '.join(stuck), 'disabled' if enabled else 'enabled'
+                )
+            )
+
+    def run_many(self, operation, arguments_list):
+        """
+        Invokes `xinput` once for each list of arguments, all in parallel,
+        and returns their outputs. It behaves like `run()`, but the timeout
+        of the operation applies to the whole batch, and the errors of all
+        failed invocations are reported together.
+        """
+        if len(arguments_list) == 1:
+            return [self.run(operation, arguments_list[0])]
+        self.breaker.check()
+        deadline = time.monotonic() + self.timeouts[operation]
+        try:
+            processes = [
+                subprocess.Popen(
+                    ['xinput'] + arguments, stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    env=self.env
+                )
+                for arguments in arguments_list
+            ]
+        except OSError as e:
+            self.breaker.failure()
+            raise XInputError('could not run xinput: {0}'.format(e))
+
+        results = []
+        try:
+            for process in processes:
+                results.append(
+                    process.communicate(
+                        timeout=max(deadline - time.monotonic(), 0)
+                    )
+                )
+        except subprocess.TimeoutExpired:
+            for process in processes:
+                process.kill()
+                process.communicate()
+            self.breaker.failure()
+            raise XInputTimeout(
+                'xinput {0} timed out after {1} seconds'.format(
+                    operation, self.timeouts[operation]
+                )
+            )
+
+        messages = []
+        for process, (stdout, stderr) in zip(processes, results):
+            if process.returncode != 0:
+                message = stderr.decode('utf-8', 'replace').strip()
+                if 'Unable to connect to X server' in message:
+                    self.breaker.failure()
+                    raise XInputError(message)
+                messages.append(
+                    message or 'xinput {0} failed'.format(operation)
+                )
+        if messages:
+            raise XInputError('; '.join(messages))
+        self.breaker.success()
+        return [stdout.decode('utf-8') for stdout, stderr in results]
+
+    def disable(self, device, source=None):
         """
         Given a specific device...
 
@@ -59,13 +695,25 @@ class XInput:
         >>> device.enabled
         True
 
+        The new state is confirmed by reading it back from the device, and
+        written through to the device and to the cached devices, so there
+        is no need to list them again:
+
+        >>> xi.disable(device)
+        >>> device.enabled, xi.get_enabled(device)
+        (False, False)
+        >>> cached = get_device_from_list_by_id(xi.get_devices(), device.id)
+        >>> cached.enabled
+        False
+        >>> xi.enable(device)
+
         >>> # If it was disabled before, let it this way.
         >>> if not current_status:
         ...    xi.disable(device)
         """
-        subprocess.run(['xinput', '--disable', str(device.id)])
+        self.set_enabled_many([device], False, source)
 
-    def enable(self, device):
+    def enable(self, device, source=None):
         """
         Given a specific device...
 
@@ -87,7 +735,121 @@ class XInput:
         >>> if not current_status:
         ...    xi.disable(device)
         """
-        subprocess.run(['xinput', '--enable', str(device.id)])
+        self.set_enabled_many([device], True, source)
+
+
+class CircuitBreaker:
+    """
+    `CircuitBreaker` keeps `XInput` from invoking `xinput` again and again
+    when the X server is not answering.
+
+    >>> now = [0]
+    >>> breaker = CircuitBreaker(
+    ...     threshold=2, backoff=1.0, clock=lambda: now[0]
+    ... )
+
+    While there are few failures in a row, calls are allowed:
+
+    >>> breaker.failure()
+    >>> breaker.check()
+
+    Once the threshold is reached, the breaker opens and calls are refused:
+
+    >>> breaker.failure()
+    >>> breaker.check()
+    Traceback (most recent call last):
+      ...
+    inputdeviceindicator.command.XInputUnavailable: xinput failed 2 times, \
+retrying in 1.0 seconds
+
+    After the backoff, one more try is allowed. If it fails, the backoff
+    doubles:
+
+    >>> now[0] = 1
+    >>> breaker.check()
+    >>> breaker.failure()
+    >>> breaker.get_retry_delay()
+    2.0
+
+    The backoff doubles up to `max_backoff`. A success closes the breaker:
+
+    >>> breaker.success()
+    >>> breaker.check()
+    >>> breaker.get_retry_delay()
+    0
+    """
+
+    def __init__(
+            self, threshold=3, backoff=1.0, max_backoff=60.0,
+            clock=time.monotonic):
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.failures = 0
+        self.open_until = None
+
+    def check(self):
+        delay = self.get_retry_delay()
+        if delay > 0:
+            raise XInputUnavailable(
+                'xinput failed {0} times, retrying in {1:.1f} seconds'.format(
+                    self.failures, delay
+                )
+            )
+
+    def success(self):
+        self.failures = 0
+        self.open_until = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            exponent = self.failures - self.threshold
+            delay = min(self.backoff * 2 ** exponent, self.max_backoff)
+            self.open_until = self.clock() + delay
+
+    def get_retry_delay(self):
+        if self.open_until is None:
+            return 0
+        return max(self.open_until - self.clock(), 0)
+
+
+def wait_for_devices(
+        xinput, timeout=60, on_error=None, clock=time.monotonic,
+        sleep=time.sleep):
+    """
+    Lists the devices, retrying while the X server is not ready (e.g. right
+    after login). Retries follow the backoff of the circuit breaker, and each
+    error is given to `on_error`:
+
+    >>> from inputdeviceindicator.mock import MockXInput
+    >>> xi = MockXInput(errors=[XInputError('Unable to connect to X server')])
+    >>> wait_for_devices(xi, on_error=print, sleep=lambda s: None)
+    Unable to connect to X server
+    []
+
+    If the devices cannot be listed until the timeout, the last error is
+    raised:
+
+    >>> xi = MockXInput(errors=[XInputError('Unable to connect to X server')])
+    >>> wait_for_devices(xi, timeout=0)
+    Traceback (most recent call last):
+      ...
+    inputdeviceindicator.command.XInputError: Unable to connect to X server
+    """
+    deadline = clock() + timeout
+    while True:
+        try:
+            return xinput.list()
+        except XInputError as e:
+            if on_error is not None:
+                on_error(e)
+            remaining = deadline - clock()
+            if remaining <= 0:
+                raise
+            delay = xinput.breaker.get_retry_delay() or xinput.breaker.backoff
+            sleep(min(delay, remaining))
 
 
 class Device:
@@ -101,6 +863,13 @@ class Device:
     >>> d
     Device(1, 'abc', 4, 'master', 'keyboard', True)
 
+    A device listed by `xinput` reflects the current state of the device. It
+    may also have been loaded from an older snapshot, in which case it is
+    stale:
+
+    >>> d.stale
+    False
+
     You can also add a device as a child of another with ``add_child()``:
 
     >>> d.add_child(Device(2, 'def', 1, 'slave', 'keyboard'))
@@ -116,6 +885,7 @@ class Device:
         self.level = level
         self.type = type
         self.enabled = True
+        self.stale = False
         self.children = []
 
     def __repr__(self):
@@ -283,3 +1053,120 @@ def get_device_from_list_by_id(devices, device_id):
             if child_device.id == device_id:
                 return child_device
     return None
+
+
+PROPERTIES_HEADER_REGEX = re.compile(r"^Device '(?P<name>.*)':$")
+PROPERTY_REGEX = re.compile(
+    r'^\s+(?P<name>.+?) \((?P<atom>\d+)\):\s*(?P<value>.*)$'
+)
+
+
+def parse_properties(string):
+    """
+    Parses the output of `xinput list-props`, for one or more devices, into a
+    list of pairs with the name of each device and a dict of its properties:
+
+    >>> parse_properties('''
+    ... Device 'Touchpad':
+    ... \tDevice Enabled (147):\t1
+    ... \tlibinput Tapping Enabled (300):\t0
+    ... \tlibinput Accel Speed (310):\t0.000000
+    ... \tlibinput Click Methods Available (320):\t1, 1
+    ... \tDevice Node (270):\t"/dev/input/event5"
+    ... Device 'Keyboard':
+    ... \tDevice Enabled (147):\t0
+    ... ''') # doctest: +NORMALIZE_WHITESPACE
+    [('Touchpad', {'Device Enabled': ['1'],
+                   'libinput Tapping Enabled': ['0'],
+                   'libinput Accel Speed': ['0.000000'],
+                   'libinput Click Methods Available': ['1', '1'],
+                   'Device Node': ['/dev/input/event5']}),
+     ('Keyboard', {'Device Enabled': ['0']})]
+    """
+    blocks = []
+    for line in string.splitlines():
+        m = PROPERTIES_HEADER_REGEX.match(line)
+        if m is not None:
+            blocks.append((m.group('name'), {}))
+            continue
+        m = PROPERTY_REGEX.match(line)
+        if m is not None and blocks:
+            value = m.group('value').strip()
+            blocks[-1][1][m.group('name')] = [
+                v.strip('"') for v in value.split(', ')
+            ] if value else []
+    return blocks
+
+
+def match_properties(devices, blocks):
+    """
+    Matches the devices given to `xinput list-props` with the blocks of its
+    output, returning a dict from device ids to properties.
+
+    `xinput` prints nothing to standard output for ids it does not know
+    (e.g. devices unplugged since they were listed), and the headers of the
+    blocks only have the device names, so the blocks are matched by name:
+
+    >>> devices = [
+    ...     Device(4, 'Mouse', 2, 'slave', 'pointer'),
+    ...     Device(6, 'Touchpad', 2, 'slave', 'pointer'),
+    ...     Device(7, 'USB Keyboard', 3, 'slave', 'keyboard'),
+    ... ]
+    >>> match_properties(devices, parse_properties('''
+    ... Device 'Mouse':
+    ... \tDevice Enabled (147):\t1
+    ... Device 'USB Keyboard':
+    ... \tDevice Enabled (147):\t0
+    ... '''))
+    {4: {'Device Enabled': ['1']}, 7: {'Device Enabled': ['0']}}
+
+    The touchpad is missing from the result, instead of getting the
+    properties of the next device.
+
+    Blocks are never matched by position, so devices with the same name
+    cannot be told apart, and must be read by separate calls (see
+    `split_by_name()`):
+
+    >>> match_properties(devices + devices[-1:], [])
+    Traceback (most recent call last):
+      ...
+    ValueError: devices with the same name: 'USB Keyboard'
+    """
+    by_name = {}
+    for device in devices:
+        if device.name in by_name:
+            raise ValueError(
+                'devices with the same name: {0!r}'.format(device.name)
+            )
+        by_name[device.name] = device
+    return {
+        by_name[name].id: properties for name, properties in blocks
+        if name in by_name
+    }
+
+
+def split_by_name(devices):
+    """
+    Splits the devices in as few lists as possible where no two devices have
+    the same name, so the properties of each list can be read by a single
+    `xinput list-props` call (see `match_properties()`). Many keyboards have
+    more than one device with the same name:
+
+    >>> split_by_name([
+    ...     Device(4, 'Mouse', 2, 'slave', 'pointer'),
+    ...     Device(5, 'USB Keyboard', 3, 'slave', 'keyboard'),
+    ...     Device(7, 'USB Keyboard', 3, 'slave', 'keyboard'),
+    ... ]) # doctest: +NORMALIZE_WHITESPACE
+    [[Device(4, 'Mouse', 2, 'slave', 'pointer', True),
+      Device(5, 'USB Keyboard', 3, 'slave', 'keyboard', True)],
+     [Device(7, 'USB Keyboard', 3, 'slave', 'keyboard', True)]]
+    """
+    batches = []
+    for device in devices:
+        for batch in batches:
+            if all(d.name != device.name for d in batch):
+                batch.append(device)
+                break
+        else:
+            batches.append([device])
+    return batches
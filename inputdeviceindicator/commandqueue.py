@@ -0,0 +1,292 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from inputdeviceindicator.command import XInputError
+
+
+class DeviceCommandQueue:
+    """
+    `DeviceCommandQueue` runs enable/disable commands outside the main loop.
+    Commands for the same device run one at a time, in order, while commands
+    for different devices run in parallel. While a command runs, further
+    requests for its device are coalesced: only the last requested state is
+    applied afterwards.
+
+    Consider an `XInput` whose commands take a while:
+
+    >>> from inputdeviceindicator.command import Device
+    >>> from inputdeviceindicator.mock import MockSlowXInput
+    >>> xinput = MockSlowXInput(delay=0.001)
+    >>> devices = [
+    ...     Device(i, 'device {0}'.format(i), 3, 'slave', 'keyboard')
+    ...     for i in range(4)
+    ... ]
+
+    Once the commands are done, the queue calls `on_done` with the device, its
+    confirmed state and its state before the first of the coalesced requests
+    (here, right away; in the indicator, through the main loop):
+
+    >>> confirmed = {}
+    >>> def on_done(device, enabled, previous):
+    ...     confirmed[device.id] = enabled
+    >>> queue = DeviceCommandQueue(
+    ...     xinput, on_done=on_done, dispatch=lambda f, *args: f(*args)
+    ... )
+
+    Let's toggle the devices thousands of times:
+
+    >>> import random
+    >>> requested = {}
+    >>> for i in range(5000):
+    ...     device = random.choice(devices)
+    ...     requested[device.id] = random.choice([True, False])
+    ...     queue.request(device, requested[device.id])
+    >>> queue.join()
+
+    The final state of each device is the last one requested...
+
+    >>> all(
+    ...     xinput.states.get(d.id, True) == d.enabled == requested[d.id]
+    ...     for d in devices
+    ... )
+    True
+    >>> confirmed == requested
+    True
+
+    ...but far fewer commands were run:
+
+    >>> xinput.calls < 1000
+    True
+
+    Commands never overlapped for the same device, but did for different
+    devices:
+
+    >>> xinput.max_running_per_device, xinput.max_running > 1
+    (1, True)
+
+    A device toggled back to its previous state before the commands were
+    done is reported as such, so callers can tell it did not change:
+
+    >>> xinput = MockSlowXInput(delay=0.1)
+    >>> device = Device(9, 'device 9', 3, 'slave', 'keyboard')
+    >>> queue = DeviceCommandQueue(
+    ...     xinput, on_done=print, dispatch=lambda f, *args: f(*args)
+    ... )
+    >>> queue.request(device, False)
+    >>> queue.request(device, True)
+    >>> queue.join()
+    Device(9, 'device 9', 3, 'slave', 'keyboard', True) True True
+
+    Many devices (e.g. the parts of a group) can be requested at once. They
+    are then changed by a single `set_enabled_many()` call, except those
+    which already have commands running, whose requests are coalesced as
+    usual:
+
+    >>> xinput = MockSlowXInput(delay=0.01)
+    >>> group = [
+    ...     Device(i, 'part {0}'.format(i), 3, 'slave', 'keyboard')
+    ...     for i in range(10, 14)
+    ... ]
+    >>> queue = DeviceCommandQueue(xinput, dispatch=lambda f, *args: f(*args))
+    >>> queue.request(group[0], False)
+    >>> queue.request_many(group, False)
+    >>> queue.join()
+    >>> xinput.batches, xinput.calls, [d.enabled for d in group]
+    (1, 4, [False, False, False, False])
+
+    The callbacks are called without holding any lock of the queue, so they
+    can request more commands:
+
+    >>> def on_done(device, enabled, previous):
+    ...     print(device.name, enabled)
+    ...     if not enabled:
+    ...         queue.request(device, True)
+    >>> queue = DeviceCommandQueue(xinput, on_done=on_done)
+    >>> queue.request(device, False); queue.join()
+    device 9 False
+    device 9 True
+
+    If a command fails, `on_error` is called with the device, the error and
+    the last confirmed state of the device:
+
+    >>> xinput = MockSlowXInput(errors=[XInputError('xinput timed out')])
+    >>> queue = DeviceCommandQueue(
+    ...     xinput, on_error=print, dispatch=lambda f, *args: f(*args)
+    ... )
+    >>> queue.request(device, False)
+    >>> queue.join()
+    Device(9, 'device 9', 3, 'slave', 'keyboard', True) xinput timed out True
+    """
+
+    def __init__(
+            self, xinput, on_done=None, on_error=None, dispatch=None,
+            max_workers=4, source=None):
+        self.xinput = xinput
+        self.source = source
+        self.on_done = on_done
+        self.on_error = on_error
+        self.dispatch = dispatch
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='xinput'
+        )
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.entries = {}
+        self.pending_calls = 0
+
+    def request(self, device, enabled):
+        with self.lock:
+            entry = self.entries.get(device.id)
+            if entry is None:
+                entry = self.entries[device.id] = QueueEntry(device)
+            entry.device = device
+            entry.requested = enabled
+            if entry.running:
+                return
+            # The device may have been changed elsewhere since the last time.
+            entry.confirmed = entry.previous = device.enabled
+            entry.running = True
+        self.executor.submit(self.run, entry)
+
+    def request_many(self, devices, enabled):
+        entries = []
+        with self.lock:
+            for device in devices:
+                entry = self.entries.get(device.id)
+                if entry is None:
+                    entry = self.entries[device.id] = QueueEntry(device)
+                entry.device = device
+                entry.requested = enabled
+                if entry.running:
+                    continue
+                entry.confirmed = entry.previous = device.enabled
+                entry.running = True
+                entries.append(entry)
+        if entries:
+            self.executor.submit(self.run_many, entries, enabled)
+
+    def run_many(self, entries, enabled):
+        with self.lock:
+            batch = [
+                e for e in entries
+                if e.requested == enabled and e.confirmed != enabled
+            ]
+        failed = []
+        if batch:
+            try:
+                self.xinput.set_enabled_many(
+                    [entry.device for entry in batch], enabled, self.source
+                )
+            except XInputError as e:
+                # The backend confirms the state of each device, so the
+                # devices which did change are not taken as failures.
+                error = e
+                failed = [
+                    entry for entry in batch
+                    if entry.device.enabled != enabled
+                ]
+            calls = []
+            with self.lock:
+                for entry in batch:
+                    if entry not in failed:
+                        entry.confirmed = entry.device.enabled = enabled
+                for entry in failed:
+                    entry.requested = entry.confirmed
+                    calls.append(self.finish(
+                        entry, self.on_error, entry.device, error,
+                        entry.confirmed
+                    ))
+            for call in calls:
+                self.call(*call)
+        # Requests which arrived meanwhile, if any, are run one by one.
+        for entry in entries:
+            if entry not in failed:
+                self.run(entry)
+
+    def run(self, entry):
+        while True:
+            with self.lock:
+                requested = entry.requested
+                if requested == entry.confirmed:
+                    call = self.finish(
+                        entry, self.on_done, entry.device, entry.confirmed,
+                        entry.previous
+                    )
+                    break
+            try:
+                if requested:
+                    self.xinput.enable(entry.device, self.source)
+                else:
+                    self.xinput.disable(entry.device, self.source)
+            except XInputError as e:
+                with self.lock:
+                    entry.requested = entry.confirmed
+                    call = self.finish(
+                        entry, self.on_error, entry.device, e, entry.confirmed
+                    )
+                break
+            with self.lock:
+                entry.confirmed = entry.device.enabled = requested
+        self.call(*call)
+
+    def finish(self, entry, callback, *args):
+        """
+        Marks the commands of an entry as done, returning the callback to be
+        called, with its arguments. It must be called with the lock held,
+        and the callback called after releasing it, so the callback can
+        request new commands. `join()` waits for the callback.
+        """
+        entry.running = False
+        self.pending_calls += 1
+        return (callback,) + args
+
+    def call(self, callback, *args):
+        try:
+            if callback is None:
+                return
+            if self.dispatch is not None:
+                self.dispatch(callback, *args)
+            else:
+                callback(*args)
+        finally:
+            with self.lock:
+                self.pending_calls -= 1
+                self.idle.notify_all()
+
+    def join(self):
+        """
+        Waits until there are no commands running.
+        """
+        with self.lock:
+            self.idle.wait_for(
+                lambda: not self.pending_calls and
+                not any(e.running for e in self.entries.values())
+            )
+
+
+class QueueEntry:
+
+    def __init__(self, device):
+        self.device = device
+        self.requested = device.enabled
+        self.confirmed = device.enabled
+        self.previous = device.enabled
+        self.running = False
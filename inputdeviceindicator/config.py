@@ -0,0 +1,123 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import copy
+import json
+import os.path
+
+from inputdeviceindicator import audit, catdetector, hooks
+from inputdeviceindicator.command import DEFAULT_TIMEOUTS
+from inputdeviceindicator.paths import get_config_dir
+
+
+# The settings of the features which need GTK are defined here, and not in
+# their modules, so reading the configuration does not import GTK before the
+# startup profile can time it.
+DEFAULT_CONFIG = {
+    'timeouts': DEFAULT_TIMEOUTS,
+    'activity_meter': {
+        'enabled': False,
+        'seconds': 5,
+    },
+    'cat_detector': catdetector.DEFAULT_SETTINGS,
+    'disable_while_typing': {
+        'enabled': False,
+        'keyboards': [],
+        'pointer': None,
+        'idle': 0.5,
+    },
+    'hotkeys': {},
+    'profiles': {},
+    'menu_layout': 'flat',
+    'backend': None,
+    'audit_log': audit.DEFAULT_SETTINGS,
+    'undo': {
+        'size': 20,
+        'dead_mans_switch': {
+            'enabled': False,
+            'seconds': 15,
+        },
+    },
+    'hooks': hooks.DEFAULT_SETTINGS,
+}
+
+
+class ConfigError(Exception):
+    """
+    Raised when the configuration file cannot be read.
+    """
+
+
+def get_config_path():
+    return os.path.join(get_config_dir(), 'config.json')
+
+
+def load_config(path=None):
+    """
+    Loads the configuration file, a JSON object whose values override the
+    defaults from `DEFAULT_CONFIG`:
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'config.json')
+    >>> with open(path, 'w') as f:
+    ...     _ = f.write('{"timeouts": {"list": 10}}')
+    >>> config = load_config(path)
+    >>> config['timeouts']['list'], config['timeouts']['enable']
+    (10, 2.0)
+
+    If the file does not exist, the defaults are used:
+
+    >>> load_config(path + '.missing') == DEFAULT_CONFIG
+    True
+
+    An invalid file is an error, though:
+
+    >>> with open(path, 'w') as f:
+    ...     _ = f.write('{"timeouts": ')
+    >>> load_config(path) # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+      ...
+    inputdeviceindicator.config.ConfigError: invalid configuration file ...
+    """
+    if path is None:
+        path = get_config_path()
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    try:
+        with open(path, encoding='utf-8') as f:
+            overrides = json.load(f)
+    except FileNotFoundError:
+        return config
+    except (OSError, ValueError) as e:
+        raise ConfigError(
+            'invalid configuration file {0}: {1}'.format(path, e)
+        )
+    return merge(config, overrides)
+
+
+def merge(config, overrides):
+    """
+    Merges two configurations, recursively merging nested objects:
+
+    >>> merge({'a': {'b': 1, 'c': 2}, 'd': 3}, {'a': {'b': 4}, 'e': 5})
+    {'a': {'b': 4, 'c': 2}, 'd': 3, 'e': 5}
+    """
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            merge(config[key], value)
+        else:
+            config[key] = value
+    return config
@@ -0,0 +1,243 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import json
+import os
+import os.path
+import socket
+import threading
+
+from concurrent.futures import Future
+
+from gi.repository import GLib as glib
+
+from inputdeviceindicator.paths import get_runtime_dir
+
+
+class ControlError(Exception):
+    """
+    Raised when a command cannot be sent to the indicator, or fails there.
+    """
+
+
+class IndicatorNotRunning(ControlError):
+    """
+    Raised when a command is sent but the indicator is not running.
+    """
+
+
+def get_socket_path():
+    return os.path.join(get_runtime_dir(), 'control.sock')
+
+
+class ControlServer:
+    """
+    `ControlServer` listens on a Unix socket for commands to the running
+    indicator, such as the ones sent by the command line. Each request is a
+    JSON object in one line, with the command name and its arguments, and
+    the response is a JSON object in one line as well.
+
+    Commands are handled by the given functions. Requests are read in a
+    thread for each connection, so a slow client never blocks the main loop,
+    and the functions are called through `dispatch` (by default,
+    `GLib.idle_add`, so they run in the main loop). Here, they are called in
+    the thread itself:
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'control.sock')
+    >>> def disable_for(device, seconds):
+    ...     return '{0} disabled for {1}s'.format(device, seconds)
+    >>> server = ControlServer({'disable-for': disable_for}, path, None)
+    >>> server.start()
+
+    Here, connections are accepted in a thread because `send_command()`
+    blocks the main loop, but usually requests come from other processes:
+
+    >>> import threading
+    >>> thread = threading.Thread(target=server.handle_connection)
+    >>> thread.start()
+    >>> send_command(
+    ...     {'command': 'disable-for', 'device': 'Touchpad', 'seconds': 60},
+    ...     path
+    ... )
+    'Touchpad disabled for 60s'
+    >>> thread.join()
+
+    Errors are sent back and raised as `ControlError`:
+
+    >>> thread = threading.Thread(target=server.handle_connection)
+    >>> thread.start()
+    >>> send_command({'command': 'explode'}, path)
+    Traceback (most recent call last):
+      ...
+    inputdeviceindicator.control.ControlError: unknown command 'explode'
+    >>> thread.join()
+
+    Only one indicator can listen on the socket. If another one answers
+    there, the server does not start:
+
+    >>> ControlServer({}, path).start() # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+      ...
+    inputdeviceindicator.control.ControlError: another indicator is already \
+running...
+    >>> server.stop()
+
+    A socket left behind by an indicator which did not stop properly is
+    replaced, though:
+
+    >>> stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    >>> stale.bind(path)
+    >>> stale.close()
+    >>> server.start()
+    >>> server.stop()
+
+    If the indicator is not running, `send_command()` also raises
+    `ControlError`:
+
+    >>> send_command({'command': 'disable-for'}, path) # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+      ...
+    inputdeviceindicator.control.IndicatorNotRunning: the indicator is not \
+running...
+    """
+
+    def __init__(self, handlers, path=None, dispatch=glib.idle_add):
+        self.handlers = handlers
+        self.path = path if path is not None else get_socket_path()
+        self.dispatch = dispatch
+        self.socket = None
+        self.watch_id = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            self.remove_stale_socket()
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.socket.listen()
+        self.watch_id = glib.io_add_watch(
+            self.socket, glib.PRIORITY_DEFAULT, glib.IO_IN, self.accept
+        )
+
+    def stop(self):
+        if self.watch_id is not None:
+            glib.source_remove(self.watch_id)
+            self.watch_id = None
+        self.socket.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def remove_stale_socket(self):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        probe.settimeout(1)
+        with probe:
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)
+                return
+        raise ControlError(
+            'another indicator is already running (listening on {0})'.format(
+                self.path
+            )
+        )
+
+    def accept(self, source, condition):
+        self.handle_connection()
+        return True
+
+    def handle_connection(self):
+        connection, _ = self.socket.accept()
+        thread = threading.Thread(
+            target=self.serve, args=(connection,), daemon=True
+        )
+        thread.start()
+
+    def serve(self, connection):
+        with connection:
+            connection.settimeout(1)
+            try:
+                request = json.loads(read_line(connection))
+                response = {'result': self.call_handler(request)}
+            except Exception as e:
+                response = {'error': str(e)}
+            data = json.dumps(response).encode('utf-8') + b'\n'
+            try:
+                connection.sendall(data)
+            except OSError:
+                pass  # The client went away.
+
+    def call_handler(self, request):
+        if self.dispatch is None:
+            return self.handle(request)
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(self.handle(request))
+            except Exception as e:
+                future.set_exception(e)
+            return False
+
+        self.dispatch(run)
+        return future.result()
+
+    def handle(self, request):
+        arguments = dict(request)
+        command = arguments.pop('command', None)
+        handler = self.handlers.get(command)
+        if handler is None:
+            raise ControlError('unknown command {0!r}'.format(command))
+        return handler(**arguments)
+
+
+def send_command(request, path=None, timeout=10):
+    """
+    Sends a command to the running indicator and returns its result. See
+    `ControlServer`.
+    """
+    if path is None:
+        path = get_socket_path()
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    with client:
+        try:
+            client.connect(path)
+        except OSError as e:
+            raise IndicatorNotRunning(
+                'the indicator is not running ({0})'.format(e)
+            )
+        try:
+            client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            response = json.loads(read_line(client))
+        except (OSError, ValueError) as e:
+            raise ControlError('no answer from the indicator ({0})'.format(e))
+    if 'error' in response:
+        raise ControlError(response['error'])
+    return response.get('result')
+
+
+def read_line(connection):
+    data = b''
+    while not data.endswith(b'\n'):
+        chunk = connection.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data.decode('utf-8')
@@ -0,0 +1,120 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+from gi.repository import GLib as glib
+
+from inputdeviceindicator.menu import get_device_menu_items, \
+    set_device_menu_item_suffix
+from inputdeviceindicator.scheduler import format_countdown
+
+
+class CountdownLabels:
+    """
+    `CountdownLabels` displays, next to each device disabled for some time,
+    how long until it is enabled again. The labels are updated whenever the
+    timers of the scheduler change, and every second while there is some
+    timer pending.
+
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.menu import build_menu
+    >>> from inputdeviceindicator.mock import MockMenuCallbacks, \\
+    ...     MockScheduler, MockTimer
+    >>> from gi.repository import Gtk as gtk
+    >>> menu = gtk.Menu()
+    >>> build_menu(menu, parse('''
+    ... ⎡ A        id=2    [master pointer  (3)]
+    ... ⎜   ↳ A1   id=4    [slave  pointer  (2)]
+    ... ⎜   ↳ A2   id=5    [slave  pointer  (2)]
+    ... '''), MockMenuCallbacks())
+    >>> scheduler = MockScheduler()
+    >>> timer = MockTimer()
+    >>> labels = CountdownLabels(
+    ...     menu, scheduler, timeout_add=timer.timeout_add,
+    ...     source_remove=timer.source_remove
+    ... )
+    >>> scheduler.on_change = labels.scheduler_changed
+
+    Nothing runs while there are no timers:
+
+    >>> timer.pending
+    []
+
+    A new timer shows up right away, and is counted down every second:
+
+    >>> scheduler.disable_for('A2', 272.3)
+    A2 disabled for 272.3 seconds
+    >>> [i.get_label() for i in menu.get_children()[:3]]
+    ['A', 'A1', 'A2  back in 4:33']
+    >>> timer.pending
+    [1000]
+    >>> scheduler.remaining['A2'] = 271.3
+    >>> timer.fire()
+    >>> [i.get_label() for i in menu.get_children()[:3]]
+    ['A', 'A1', 'A2  back in 4:32']
+
+    Once there are no timers, the labels are restored and the countdown
+    stops:
+
+    >>> del scheduler.remaining['A2']
+    >>> timer.fire()
+    >>> [i.get_label() for i in menu.get_children()[:3]]
+    ['A', 'A1', 'A2']
+    >>> timer.pending
+    []
+    """
+
+    def __init__(
+            self, menu, scheduler, timeout_add=glib.timeout_add,
+            source_remove=glib.source_remove):
+        self.menu = menu
+        self.scheduler = scheduler
+        self.timeout_add = timeout_add
+        self.source_remove = source_remove
+        self.timeout_id = None
+        # Timers may have been loaded already, e.g. after a restart.
+        self.scheduler_changed()
+
+    def scheduler_changed(self):
+        if self.refresh():
+            if self.timeout_id is None:
+                self.timeout_id = self.timeout_add(1000, self.tick)
+        elif self.timeout_id is not None:
+            self.source_remove(self.timeout_id)
+            self.timeout_id = None
+
+    def tick(self):
+        if self.refresh():
+            return True
+        self.timeout_id = None
+        return False
+
+    def refresh(self):
+        """
+        Updates the labels, returning whether there is some timer pending.
+        """
+        pending = False
+        for item in get_device_menu_items(self.menu):
+            device = item.device
+            if device.level != 'slave':
+                continue
+            remaining = self.scheduler.get_remaining(device.name)
+            suffix = None
+            if remaining is not None:
+                suffix = 'back in ' + format_countdown(remaining)
+                pending = True
+            set_device_menu_item_suffix(item, 'timer', suffix)
+        return pending
@@ -0,0 +1,305 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import fcntl
+import os
+import threading
+
+from inputdeviceindicator.command import Backend, CircuitBreaker, Device, \
+    XInputError, get_device_from_list_by_id
+from inputdeviceindicator.grouping import SYSFS_ROOT
+from inputdeviceindicator.sysfs import DEV_INPUT_ROOT, enumerate_devices
+
+
+EVIOCGRAB = 0x40044590
+POINTER_ID = 2
+KEYBOARD_ID = 3
+FIRST_SLAVE_ID = 4
+
+
+class EvdevInput(Backend):
+    """
+    `EvdevInput` works like `XInput`, but on the kernel input devices
+    (/dev/input/event*) instead of `xinput`, so it also works under Wayland
+    or on the console. It needs no GTK typelib either:
+
+    >>> import os, subprocess, sys
+    >>> subprocess.run(
+    ...     [
+    ...         sys.executable, '-c', 'import gi; required = []; '
+    ...         'gi.require_version = lambda n, v: required.append(n); '
+    ...         'import inputdeviceindicator.evdev; print(required)'
+    ...     ],
+    ...     env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+    ...     stdout=subprocess.PIPE, universal_newlines=True
+    ... ).stdout
+    '[]\\n'
+
+    The devices are listed from sysfs, in the same shape `parse()` returns:
+
+    >>> from inputdeviceindicator.mock import make_sysfs
+    >>> ei = EvdevInput(sysfs_root=make_sysfs())
+    >>> ei.list() # doctest: +NORMALIZE_WHITESPACE
+    [Device(2, 'Virtual core pointer', 3, 'master', 'pointer', True,
+            [Device(11, 'Virtual Mouse', 2, 'slave', 'pointer', True)]),
+     Device(3, 'Virtual core keyboard', 2, 'master', 'keyboard', True,
+            [Device(6, 'AT Translated Set 2 keyboard', 3, 'slave',
+                    'keyboard', True),
+             Device(8, 'USB Keyboard', 3, 'slave', 'keyboard', True),
+             Device(9, 'USB Keyboard Consumer Control', 3, 'slave',
+                    'keyboard', True)])]
+
+    Slave ids are the event numbers plus 4, so they do not clash with the
+    master devices. The "Device Node" of each one is available as a property,
+    so devices can be grouped:
+
+    >>> ei.get_properties([ei.list()[1].children[1]])
+    {8: {'Device Enabled': ['1'], 'Device Node': ['/dev/input/event4']}}
+
+    A device is disabled by grabbing it exclusively (with the EVIOCGRAB
+    ioctl), so no other program gets its events, and enabled by releasing
+    it. The grabs are held by this object, so the devices are enabled again
+    when the process exits. Let's try it with a uinput device:
+
+    >>> from inputdeviceindicator.mock import MockUInputDevice
+    >>> uinput = MockUInputDevice('Evdev Test Keyboard')
+    >>> ei = EvdevInput()
+    >>> device = [
+    ...     d for d in ei.list()[1].children if d.name == 'Evdev Test Keyboard'
+    ... ][0]
+    >>> ei.disable(device)
+    >>> device.enabled, ei.get_enabled(device)
+    (False, False)
+
+    Only one grab is possible, so other programs cannot take the device:
+
+    >>> EvdevInput().disable(device) # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+      ...
+    inputdeviceindicator.command.XInputError: could not grab /dev/input/...
+
+    >>> ei.enable(device)
+    >>> device.enabled, ei.get_enabled(device)
+    (True, True)
+    >>> uinput.destroy()
+    """
+
+    event_source = 'uevent'
+
+    def __init__(
+            self, sysfs_root=SYSFS_ROOT, dev_root=DEV_INPUT_ROOT,
+            dispatch=None, timeouts=None):
+        # The ioctls do not block, so the timeouts are not used, but they are
+        # accepted like in the other backends.
+        Backend.__init__(self, dispatch)
+        self.timeouts = timeouts
+        self.sysfs_root = sysfs_root
+        self.dev_root = dev_root
+        self.breaker = CircuitBreaker()
+        self.lock = threading.Lock()
+        self.devices = None
+        self.nodes = {}
+        self.grabs = {}
+
+    def list(self):
+        """
+        Lists the devices with a single walk over sysfs. Devices without keys,
+        relative or absolute axes (e.g. lid switches) are not listed, as X
+        would not list them either.
+        """
+        pointer = Device(
+            POINTER_ID, 'Virtual core pointer', KEYBOARD_ID, 'master',
+            'pointer'
+        )
+        keyboard = Device(
+            KEYBOARD_ID, 'Virtual core keyboard', POINTER_ID, 'master',
+            'keyboard'
+        )
+        nodes = {}
+        sysfs_devices = enumerate_devices(self.sysfs_root, self.dev_root)
+        with self.lock:
+            for sysfs_device in sysfs_devices:
+                if sysfs_device.type is None:
+                    continue
+                id = FIRST_SLAVE_ID + sysfs_device.number
+                master = pointer if sysfs_device.type == 'pointer' \
+                    else keyboard
+                device = Device(
+                    id, sysfs_device.name, master.id, 'slave',
+                    sysfs_device.type
+                )
+                device.enabled = id not in self.grabs
+                master.add_child(device)
+                nodes[id] = sysfs_device.node
+            for id in set(self.grabs) - set(nodes):
+                os.close(self.grabs.pop(id))
+            self.nodes = nodes
+            self.devices = [pointer, keyboard]
+            return self.devices
+
+    def get_devices(self):
+        """
+        Returns the devices from the last listing, listing them if they were
+        not listed yet or were invalidated.
+        """
+        with self.lock:
+            devices = self.devices
+        if devices is not None:
+            return devices
+        return self.list()
+
+    def invalidate(self):
+        with self.lock:
+            self.devices = None
+
+    def event_received(self, event):
+        if event.type == 'HierarchyChanged':
+            self.invalidate()
+
+    def uevent_received(self, uevent):
+        """
+        Invalidates the devices when a `UeventMonitor` reports that a device
+        was added or removed, as there are no X events without X.
+        """
+        if uevent.action != 'change' or uevent.node is None:
+            self.invalidate()
+
+    def get_enabled(self, device):
+        with self.lock:
+            return device.id not in self.grabs
+
+    def get_properties(self, devices):
+        """
+        Returns the "Device Enabled" and "Device Node" properties of the given
+        devices, in the format of `XInput.get_properties()`.
+        """
+        self.get_devices()
+        with self.lock:
+            return {
+                d.id: {
+                    'Device Enabled': ['0' if d.id in self.grabs else '1'],
+                    'Device Node': [self.nodes[d.id]]
+                } if d.id in self.nodes else {}
+                for d in devices
+            }
+
+    def set_properties(self, device, values):
+        raise XInputError(
+            'properties cannot be set on device {0} without X'.format(
+                device.name
+            )
+        )
+
+    def set_enabled_many(self, devices, enabled, source=None):
+        """
+        Enables or disables many devices. All devices are tried, and the ones
+        which could not be changed are reported by a single `XInputError`.
+        """
+        self.get_devices()
+        errors = []
+        for device in devices:
+            try:
+                if enabled:
+                    self.release(device)
+                else:
+                    self.grab(device)
+            except XInputError as e:
+                errors.append(str(e))
+                self.record(device, enabled, source, str(e))
+                continue
+            with self.lock:
+                cached = get_device_from_list_by_id(
+                    self.devices or [], device.id
+                )
+            for d in (device, cached):
+                if d is not None:
+                    d.enabled = enabled
+            self.record(device, enabled, source)
+            self.notify(device, enabled)
+        if errors:
+            raise XInputError('; '.join(errors))
+
+    def grab(self, device):
+        with self.lock:
+            if device.id in self.grabs:
+                return
+            node = self.nodes.get(device.id)
+            if node is None:
+                raise XInputError(
+                    'unable to find device {0}'.format(device.id)
+                )
+            self.grabs[device.id] = open_grabbed(node)
+
+    def release(self, device):
+        with self.lock:
+            fd = self.grabs.pop(device.id, None)
+        if fd is None:
+            return
+        try:
+            fcntl.ioctl(fd, EVIOCGRAB, 0)
+        except OSError:
+            # The device is gone, but closing the file releases it anyway.
+            pass
+        finally:
+            os.close(fd)
+
+    def probe(self):
+        """
+        Checks that this process can open every listed device for reading
+        and writing, and grab it. Being able to read some nodes is not
+        enough: e.g. joysticks are often readable by the user, or the user
+        is in the `input` group, while keyboards cannot be grabbed.
+
+        >>> from inputdeviceindicator.mock import make_sysfs
+        >>> ei = EvdevInput(sysfs_root=make_sysfs(), dev_root='/nonexistent')
+        >>> ei.probe() # doctest: +ELLIPSIS
+        Traceback (most recent call last):
+          ...
+        inputdeviceindicator.command.XInputError: could not grab \
+/nonexistent/event...: No such file or directory
+        """
+        self.list()
+        with self.lock:
+            nodes = list(self.nodes.values())
+            grabbed = {self.nodes.get(id) for id in self.grabs}
+        if not nodes:
+            raise XInputError('no input device can be grabbed')
+        for node in nodes:
+            if node in grabbed:
+                continue
+            fd = open_grabbed(node)
+            try:
+                fcntl.ioctl(fd, EVIOCGRAB, 0)
+            finally:
+                os.close(fd)
+
+
+def open_grabbed(node):
+    """
+    Opens a device node for reading and writing and grabs it, returning the
+    file descriptor, or raising `XInputError` if either fails.
+    """
+    try:
+        fd = os.open(node, os.O_RDWR | os.O_NONBLOCK)
+    except OSError as e:
+        raise XInputError('could not grab {0}: {1}'.format(node, e.strerror))
+    try:
+        fcntl.ioctl(fd, EVIOCGRAB, 1)
+    except OSError as e:
+        os.close(fd)
+        raise XInputError('could not grab {0}: {1}'.format(node, e.strerror))
+    return fd
@@ -0,0 +1,350 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import re
+import subprocess
+import time
+
+from gi.repository import GLib as glib
+
+
+EVENT_COMMAND = ['xinput', 'test-xi2', '--root']
+
+HEADER_REGEX = re.compile(r'^EVENT type (?P<code>\d+) \((?P<type>\w+)\)')
+DEVICE_REGEX = re.compile(r'^\s+device: (?P<id>\d+)(?: \((?P<source>\d+)\))?')
+FIELD_REGEX = re.compile(
+    r'^\s+(?P<name>detail|flags|property):\s*(?P<value>.*)'
+)
+
+INPUT_EVENT_TYPES = frozenset([
+    'RawKeyPress', 'RawKeyRelease', 'RawButtonPress', 'RawButtonRelease',
+    'RawMotion', 'RawTouchBegin', 'RawTouchUpdate', 'RawTouchEnd'
+])
+
+MAX_RESTART_DELAY = 60
+
+
+class EventMonitorError(Exception):
+    """
+    Raised (or given to `on_error`) when `xinput test-xi2` stops.
+    """
+
+
+class Event:
+    """
+    An XI2 event, as reported by `xinput test-xi2`. For raw events,
+    `device_id` and `source_id` are the same slave device:
+
+    >>> Event('RawKeyPress', 11, 11, 38)
+    Event('RawKeyPress', 11, 11, 38, '')
+    """
+
+    def __init__(
+            self, type, device_id=None, source_id=None, detail=None, flags='',
+            property=None, time=None):
+        self.type = type
+        self.device_id = device_id
+        self.source_id = source_id
+        self.detail = detail
+        self.flags = flags
+        self.property = property
+        self.time = time
+
+    @property
+    def repeat(self):
+        return 'repeat' in self.flags
+
+    def __repr__(self):
+        parameters = [
+            self.type, self.device_id, self.source_id, self.detail, self.flags
+        ]
+        if self.property is not None:
+            parameters.append(self.property)
+        return 'Event({0})'.format(', '.join(repr(p) for p in parameters))
+
+
+class EventParser:
+    """
+    `EventParser` parses the output of `xinput test-xi2` line by line. Once a
+    line completes an event, `feed()` returns it:
+
+    >>> parser = EventParser(clock=lambda: 0)
+    >>> lines = [
+    ...     'EVENT type 13 (RawKeyPress)',
+    ...     '    device: 11 (11)',
+    ...     '    detail: 38',
+    ...     '    flags: ',
+    ...     '    valuators:',
+    ...     '',
+    ...     'EVENT type 12 (PropertyEvent)',
+    ...     '     property: 301 \\'Device Enabled\\'',
+    ...     '     changed: modified',
+    ...     '    device: 11',
+    ...     'EVENT type 11 (HierarchyChanged)',
+    ...     '    Changes happened: [device enabled]',
+    ...     '',
+    ... ]
+    >>> [e for e in (parser.feed(l) for l in lines) if e is not None]
+    [Event('RawKeyPress', 11, 11, 38, ''), \
+Event('PropertyEvent', 11, None, None, '', 'Device Enabled'), \
+Event('HierarchyChanged', None, None, None, '')]
+
+    Raw events are returned as soon as their flags are known, so there is no
+    need to wait for the next event to handle them.
+
+    If a set of `types` is given, other events are skipped without being
+    parsed:
+
+    >>> parser = EventParser(clock=lambda: 0, types={'HierarchyChanged'})
+    >>> [e for e in (parser.feed(l) for l in lines) if e is not None]
+    [Event('HierarchyChanged', None, None, None, '')]
+    """
+
+    def __init__(self, clock=time.monotonic, types=None):
+        self.clock = clock
+        self.types = types
+        self.event = None
+
+    def feed(self, line):
+        m = HEADER_REGEX.match(line)
+        if m is not None:
+            previous = self.event
+            type = m.group('type')
+            if self.types is None or type in self.types:
+                self.event = Event(type, time=self.clock())
+            else:
+                self.event = None
+            return previous
+        if self.event is None:
+            return None
+        if not line.strip():
+            return self.pop()
+
+        m = DEVICE_REGEX.match(line)
+        if m is not None:
+            self.event.device_id = int(m.group('id'))
+            if m.group('source') is not None:
+                self.event.source_id = int(m.group('source'))
+            return None
+
+        m = FIELD_REGEX.match(line)
+        if m is not None:
+            name, value = m.group('name'), m.group('value').strip()
+            if name == 'detail':
+                self.event.detail = int(value)
+            elif name == 'property':
+                self.event.property = value.partition(' ')[2].strip("'")
+            else:
+                self.event.flags = value
+                if self.event.type.startswith('Raw'):
+                    return self.pop()
+        return None
+
+    def pop(self):
+        event, self.event = self.event, None
+        return event
+
+
+class EventMonitor:
+    """
+    `EventMonitor` runs `xinput test-xi2` and dispatches the events it reports
+    to the subscribed listeners, from the GLib main loop.
+
+    `xinput` only runs while there are listeners, so there is no cost if no
+    feature needs events:
+
+    >>> monitor = EventMonitor(command=['cat'])
+    >>> monitor.process is None
+    True
+    >>> def listener(event):
+    ...     print(event)
+    >>> monitor.subscribe(listener)
+    >>> monitor.process is None
+    False
+    >>> monitor.unsubscribe(listener)
+    >>> monitor.process is None
+    True
+
+    The output is read in chunks, which may end in the middle of a line:
+
+    >>> monitor.subscribe(listener)
+    >>> monitor.feed(b'EVENT type 13 (RawKeyPress)\\n    device: 11 (11)\\n')
+    >>> monitor.feed(b'    detail: 38\\n    fla')
+    >>> monitor.feed(b'gs: \\n')
+    Event('RawKeyPress', 11, 11, 38, '')
+    >>> monitor.unsubscribe(listener)
+
+    Listeners may say which event `types` they need. Events nobody needs
+    (e.g. `RawMotion`, which comes by the hundreds) are skipped before being
+    parsed:
+
+    >>> monitor.subscribe(listener, types={'HierarchyChanged'})
+    >>> monitor.feed(b'EVENT type 17 (RawMotion)\\n    device: 12 (12)\\n')
+    >>> monitor.feed(b'    detail: 0\\n    flags: \\n\\n')
+    >>> monitor.feed(b'EVENT type 11 (HierarchyChanged)\\n\\n')
+    Event('HierarchyChanged', None, None, None, '')
+    >>> monitor.unsubscribe(listener)
+
+    If `xinput` exits (e.g. the X server restarted), the error is given to
+    `on_error` and `xinput` is started again after a delay, which doubles on
+    each failure in a row, up to `MAX_RESTART_DELAY` seconds:
+
+    >>> from inputdeviceindicator.mock import MockTimer
+    >>> timer = MockTimer()
+    >>> monitor = EventMonitor(
+    ...     command=['true'], on_error=print, timeout_add=timer.timeout_add,
+    ...     source_remove=timer.source_remove
+    ... )
+    >>> monitor.subscribe(listener)
+    >>> monitor.read(monitor.process.stdout, None)
+    xinput test-xi2 exited with status 0; restarting in 1 seconds
+    False
+    >>> monitor.process is None, timer.pending
+    (True, [1000])
+    >>> timer.fire()
+    >>> monitor.process is None
+    False
+    >>> monitor.read(monitor.process.stdout, None)
+    xinput test-xi2 exited with status 0; restarting in 2 seconds
+    False
+
+    Once there are no listeners, there is no restart:
+
+    >>> monitor.unsubscribe(listener)
+    >>> timer.pending
+    []
+    """
+
+    def __init__(
+            self, command=EVENT_COMMAND, clock=time.monotonic, on_error=None,
+            timeout_add=glib.timeout_add, source_remove=glib.source_remove):
+        self.command = command
+        self.clock = clock
+        self.on_error = on_error
+        self.timeout_add = timeout_add
+        self.source_remove = source_remove
+        self.listeners = []
+        self.types = {}
+        self.process = None
+        self.watch_id = None
+        self.restart_id = None
+        self.failures = 0
+        self.parser = EventParser(clock)
+        self.buffer = b''
+
+    def subscribe(self, listener, types=None):
+        self.listeners.append(listener)
+        self.types[listener] = types
+        self.update_types()
+        if self.process is None and self.restart_id is None:
+            self.start()
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+        if listener not in self.listeners:
+            del self.types[listener]
+        self.update_types()
+        if not self.listeners:
+            self.stop()
+
+    def update_types(self):
+        types = set()
+        for listener_types in self.types.values():
+            if listener_types is None:
+                types = None
+                break
+            types.update(listener_types)
+        self.parser.types = types
+
+    def start(self):
+        self.restart_id = None
+        self.parser.event = None
+        self.buffer = b''
+        try:
+            self.process = subprocess.Popen(
+                self.command, stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+        except OSError as e:
+            self.process = None
+            self.restart('could not run xinput: {0}'.format(e))
+            return False
+        self.watch_id = glib.io_add_watch(
+            self.process.stdout, glib.PRIORITY_HIGH,
+            glib.IO_IN | glib.IO_HUP | glib.IO_ERR, self.read
+        )
+        return False
+
+    def stop(self):
+        if self.restart_id is not None:
+            self.source_remove(self.restart_id)
+            self.restart_id = None
+        self.failures = 0
+        if self.process is None:
+            return
+        glib.source_remove(self.watch_id)
+        self.process.kill()
+        self.process.wait()
+        self.process.stdout.close()
+        self.process = None
+        self.watch_id = None
+
+    def read(self, stdout, condition):
+        data = os.read(stdout.fileno(), 65536)
+        if not data:
+            # xinput died (e.g. the X server went away): try again later.
+            self.watch_id = None
+            status = self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+            self.restart('xinput test-xi2 exited with status {0}'.format(
+                status
+            ))
+            return False
+        self.failures = 0
+        self.feed(data)
+        return True
+
+    def restart(self, reason):
+        if not self.listeners:
+            return
+        delay = min(2 ** self.failures, MAX_RESTART_DELAY)
+        self.failures += 1
+        self.restart_id = self.timeout_add(delay * 1000, self.start)
+        if self.on_error is not None:
+            self.on_error(EventMonitorError(
+                '{0}; restarting in {1} seconds'.format(reason, delay)
+            ))
+
+    def feed(self, data):
+        lines = (self.buffer + data).split(b'\n')
+        self.buffer = lines.pop()
+        parser = self.parser
+        for line in lines:
+            # Cheap check, so the lines of skipped events are not decoded.
+            if parser.event is None and not line.startswith(b'EVENT'):
+                continue
+            event = parser.feed(line.decode('utf-8', 'replace'))
+            if event is not None:
+                self.dispatch(event)
+
+    def dispatch(self, event):
+        for listener in list(self.listeners):
+            types = self.types.get(listener)
+            if types is None or event.type in types:
+                listener(event)
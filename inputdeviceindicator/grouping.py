@@ -0,0 +1,168 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import os.path
+
+from inputdeviceindicator.actions import get_slave_devices
+
+
+SYSFS_ROOT = '/sys'
+
+
+class DeviceGroup:
+    """
+    A `DeviceGroup` gathers the slave devices which are parts of the same
+    physical device, such as the "Keyboard", "Consumer Control" and "System
+    Control" devices of a single USB keyboard:
+
+    >>> from inputdeviceindicator.command import Device
+    >>> group = DeviceGroup('/sys/devices/usb1/1-2', [
+    ...     Device(8, 'USB Keyboard Consumer Control', 3, 'slave', 'keyboard'),
+    ...     Device(9, 'USB Keyboard', 3, 'slave', 'keyboard'),
+    ... ])
+
+    The group is named after its shortest part name, and it is enabled only
+    if all its parts are:
+
+    >>> group.name, group.enabled
+    ('USB Keyboard', True)
+    >>> group.devices[0].enabled = False
+    >>> group.enabled
+    False
+    """
+
+    def __init__(self, path, devices):
+        self.path = path
+        self.devices = devices
+
+    @property
+    def key(self):
+        return (self.devices[0].parent_id, self.path)
+
+    @property
+    def name(self):
+        return min((d.name for d in self.devices), key=len)
+
+    @property
+    def enabled(self):
+        return all(d.enabled for d in self.devices)
+
+    def __repr__(self):
+        return 'DeviceGroup({0!r}, {1!r})'.format(self.path, self.devices)
+
+
+def group_devices(devices, properties, sysfs_root=SYSFS_ROOT):
+    """
+    Groups the slave devices by the physical device behind them, given their
+    properties (as returned by `XInput.get_properties()`), from which the
+    "Device Node" property is used:
+
+    >>> from inputdeviceindicator.mock import make_sysfs
+    >>> sysfs = make_sysfs()
+    >>> from inputdeviceindicator.command import parse
+    >>> devices = parse('''
+    ... ⎣ Keyboard                       id=3    [master keyboard (2)]
+    ...     ↳ USB Keyboard               id=8    [slave  keyboard (3)]
+    ...     ↳ USB Keyboard System Control   id=9    [slave  keyboard (3)]
+    ...     ↳ AT keyboard                id=10   [slave  keyboard (3)]
+    ...     ↳ Virtual keyboard           id=11   [slave  keyboard (3)]
+    ... ''')
+    >>> properties = {
+    ...     8: {'Device Node': ['/dev/input/event4']},
+    ...     9: {'Device Node': ['/dev/input/event5']},
+    ...     10: {'Device Node': ['/dev/input/event2']},
+    ...     11: {},
+    ... }
+    >>> group_devices(devices, properties, sysfs) # doctest: +ELLIPSIS
+    [DeviceGroup('.../devices/pci0000:00/usb1/1-2', \
+[Device(8, 'USB Keyboard', 3, 'slave', 'keyboard', True), \
+Device(9, 'USB Keyboard System Control', 3, 'slave', 'keyboard', True)])]
+
+    Only physical devices with more than one part under the same master
+    device make a group.
+    """
+    paths = {}
+    for device in get_slave_devices(devices):
+        node = get_device_node(properties.get(device.id, {}))
+        if node is None:
+            continue
+        path = get_physical_path(node, sysfs_root)
+        if path is None:
+            continue
+        paths.setdefault((device.parent_id, path), []).append(device)
+    return [
+        DeviceGroup(path, parts)
+        for (parent_id, path), parts in paths.items() if len(parts) > 1
+    ]
+
+
+def get_device_node(properties):
+    """
+    Returns the device node (e.g. "/dev/input/event4") from the properties of
+    a device, if it has one:
+
+    >>> get_device_node({'Device Node': ['/dev/input/event4']})
+    '/dev/input/event4'
+    >>> get_device_node({'Device Enabled': ['1']})
+    """
+    values = properties.get('Device Node')
+    return values[0] if values else None
+
+
+def get_physical_path(node, sysfs_root=SYSFS_ROOT):
+    """
+    Finds, in sysfs, the physical device behind a device node. For USB
+    devices, it is the USB device, which may have many interfaces, each one
+    with many input devices:
+
+    >>> from inputdeviceindicator.mock import make_sysfs
+    >>> sysfs = make_sysfs()
+    >>> get_physical_path('/dev/input/event4', sysfs) # doctest: +ELLIPSIS
+    '.../devices/pci0000:00/usb1/1-2'
+    >>> get_physical_path('/dev/input/event5', sysfs) # doctest: +ELLIPSIS
+    '.../devices/pci0000:00/usb1/1-2'
+
+    For other devices, it is the parent of the input device:
+
+    >>> get_physical_path('/dev/input/event2', sysfs) # doctest: +ELLIPSIS
+    '.../devices/platform/i8042/serio0'
+
+    Virtual devices, and devices not found, have no physical device:
+
+    >>> get_physical_path('/dev/input/event7', sysfs)
+    >>> get_physical_path('/dev/input/event9', sysfs)
+    """
+    input_path = os.path.join(
+        sysfs_root, 'class', 'input', os.path.basename(node), 'device'
+    )
+    if not os.path.isdir(input_path):
+        return None
+    input_path = os.path.realpath(input_path)
+    devices_path = os.path.join(os.path.realpath(sysfs_root), 'devices')
+    if input_path.startswith(os.path.join(devices_path, 'virtual', '')):
+        return None
+
+    path = input_path
+    while path.startswith(os.path.join(devices_path, '')):
+        if os.path.exists(os.path.join(path, 'idVendor')):
+            return path
+        path = os.path.dirname(path)
+
+    parent = os.path.dirname(input_path)
+    if os.path.basename(parent) == 'input':
+        parent = os.path.dirname(parent)
+    return parent
@@ -0,0 +1,234 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import os.path
+import subprocess
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from inputdeviceindicator.paths import get_config_dir
+
+
+DEFAULT_SETTINGS = {
+    'enabled': True,
+    'timeout': 10,
+    'max_workers': 2,
+}
+
+
+class HookError(Exception):
+    """
+    Raised when a hook script fails or takes too long.
+    """
+
+
+def get_hooks_dir():
+    return os.path.join(get_config_dir(), 'hooks.d')
+
+
+def find_hooks(directory):
+    """
+    Returns the executable files in the hooks directory, in alphabetical
+    order:
+
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> for name, mode in [('b', 0o755), ('a', 0o755), ('README', 0o644)]:
+    ...     path = os.path.join(directory, name)
+    ...     with open(path, 'w') as f:
+    ...         _ = f.write('#!/bin/sh\\n')
+    ...     os.chmod(path, mode)
+    >>> [os.path.basename(h) for h in find_hooks(directory)]
+    ['a', 'b']
+
+    If the directory does not exist, there are no hooks:
+
+    >>> find_hooks(os.path.join(directory, 'missing'))
+    []
+    """
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return []
+    paths = (os.path.join(directory, n) for n in names)
+    return [p for p in paths if os.path.isfile(p) and os.access(p, os.X_OK)]
+
+
+class HookRunner:
+    """
+    `HookRunner` runs the executables from the hooks directory when a device
+    is enabled or disabled, e.g. to switch the keyboard layout. Each hook is
+    invoked with the new state, the id and the name of the device as
+    arguments (also given in the `INPUT_DEVICE_STATE`, `INPUT_DEVICE_ID`,
+    `INPUT_DEVICE_NAME` and `INPUT_DEVICE_TYPE` environment variables):
+
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> output = os.path.join(directory, 'output')
+    >>> def write_hook(name, script):
+    ...     path = os.path.join(directory, name)
+    ...     with open(path, 'w') as f:
+    ...         _ = f.write('#!/bin/sh\\n' + script)
+    ...     os.chmod(path, 0o755)
+    >>> write_hook('log', 'echo "$@" $INPUT_DEVICE_TYPE >> ' + output)
+
+    `device_state_changed()` is meant to be added as a listener to `XInput`:
+
+    >>> from inputdeviceindicator.command import Device
+    >>> touchpad = Device(12, 'Touchpad', 2, 'slave', 'pointer')
+    >>> runner = HookRunner(directory)
+    >>> runner.device_state_changed(touchpad, False)
+    >>> runner.join()
+    >>> with open(output) as f:
+    ...     print(f.read(), end='')
+    disabled 12 Touchpad pointer
+
+    Hooks run in a pool of threads, so the caller (usually the main loop)
+    does not wait for them. While the hooks of a device run, its further
+    changes are coalesced: the hooks run once more, with the last state.
+
+    >>> import time
+    >>> write_hook('log', 'sleep 0.1; echo $1 >> ' + output)
+    >>> os.remove(output)
+    >>> start = time.perf_counter()
+    >>> for i in range(101):
+    ...     runner.device_state_changed(touchpad, i % 2 == 0)
+    >>> time.perf_counter() - start < 0.1
+    True
+    >>> runner.join()
+    >>> with open(output) as f:
+    ...     states = f.read().split()
+    >>> states[-1], len(states) <= 2
+    ('enabled', True)
+
+    A hook taking longer than `timeout` seconds is killed. Errors are given
+    to `on_error` (through `dispatch`, if given, e.g. `GLib.idle_add`), and
+    the other hooks run anyway:
+
+    >>> write_hook('slow', 'sleep 10')
+    >>> write_hook('broken', 'exit 3')
+    >>> os.remove(output)
+    >>> runner = HookRunner(directory, timeout=0.5, on_error=print)
+    >>> runner.device_state_changed(touchpad, True)
+    >>> runner.join()
+    hook broken failed with status 3
+    hook slow timed out after 0.5 seconds
+    >>> with open(output) as f:
+    ...     print(f.read(), end='')
+    enabled
+    """
+
+    def __init__(
+            self, directory=None, timeout=DEFAULT_SETTINGS['timeout'],
+            max_workers=DEFAULT_SETTINGS['max_workers'], on_error=None,
+            dispatch=None):
+        self.directory = directory if directory is not None \
+            else get_hooks_dir()
+        self.timeout = timeout
+        self.on_error = on_error
+        self.dispatch = dispatch
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='hooks'
+        )
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.entries = {}
+
+    def device_state_changed(self, device, enabled):
+        with self.lock:
+            entry = self.entries.get(device.id)
+            if entry is None:
+                entry = self.entries[device.id] = HookEntry(device)
+            entry.device = device
+            entry.requested = enabled
+            if entry.running:
+                return
+            entry.running = True
+        self.executor.submit(self.run, entry)
+
+    def run(self, entry):
+        while True:
+            with self.lock:
+                device, enabled = entry.device, entry.requested
+                if enabled == entry.done:
+                    entry.running = False
+                    self.idle.notify_all()
+                    return
+            for hook in find_hooks(self.directory):
+                try:
+                    self.run_hook(hook, device, enabled)
+                except HookError as e:
+                    self.call(self.on_error, e)
+            with self.lock:
+                entry.done = enabled
+
+    def run_hook(self, hook, device, enabled):
+        state = 'enabled' if enabled else 'disabled'
+        env = dict(
+            os.environ, INPUT_DEVICE_STATE=state,
+            INPUT_DEVICE_ID=str(device.id), INPUT_DEVICE_NAME=device.name,
+            INPUT_DEVICE_TYPE=device.type
+        )
+        name = os.path.basename(hook)
+        try:
+            subprocess.run(
+                [hook, state, str(device.id), device.name], env=env,
+                stdin=subprocess.DEVNULL, timeout=self.timeout, check=True
+            )
+        except subprocess.TimeoutExpired:
+            raise HookError(
+                'hook {0} timed out after {1} seconds'.format(
+                    name, self.timeout
+                )
+            )
+        except subprocess.CalledProcessError as e:
+            raise HookError(
+                'hook {0} failed with status {1}'.format(name, e.returncode)
+            )
+        except OSError as e:
+            raise HookError('hook {0} could not run: {1}'.format(name, e))
+
+    def call(self, callback, *args):
+        if callback is None:
+            return
+        if self.dispatch is not None:
+            self.dispatch(callback, *args)
+        else:
+            callback(*args)
+
+    def join(self):
+        """
+        Waits until there are no hooks running.
+        """
+        with self.lock:
+            self.idle.wait_for(
+                lambda: not any(e.running for e in self.entries.values())
+            )
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class HookEntry:
+
+    def __init__(self, device):
+        self.device = device
+        self.requested = device.enabled
+        self.done = None
+        self.running = False
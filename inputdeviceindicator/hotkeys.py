@@ -0,0 +1,183 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import gi
+gi.require_version('Gtk', '3.0')  # noqa
+try:
+    gi.require_version('Keybinder', '3.0')
+    from gi.repository import Keybinder as keybinder
+except (ValueError, ImportError):
+    keybinder = None  # Hotkeys are optional.
+
+from inputdeviceindicator.actions import apply_profile, find_devices, \
+    set_enabled
+from inputdeviceindicator.command import XInputError
+
+
+class HotkeyError(Exception):
+    """
+    Raised when a hotkey cannot be set up or its action is invalid.
+    """
+
+
+class Hotkeys:
+    """
+    `Hotkeys` binds global shortcuts to actions on devices. The keys are
+    grabbed by Keybinder in the indicator process, in the GTK main loop, so
+    no helper process is involved between the key press and `xinput`.
+
+    Bindings map accelerators to actions, which enable, disable or toggle
+    the devices with a name, or apply a profile:
+
+    >>> bindings = {
+    ...     '<Super>F9': {'action': 'toggle', 'device': 'Touchpad'},
+    ...     '<Super>F10': {'action': 'disable', 'device': 'Laptop keys'},
+    ...     '<Super>F11': {'action': 'profile', 'profile': 'docked'},
+    ... }
+    >>> profiles = {'docked': {'Touchpad': False, 'Laptop keys': False}}
+
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.mock import MockXInput, MockKeybinder
+    >>> xinput = MockXInput(parse('''
+    ... ⎡ Pointer            id=2    [master pointer  (3)]
+    ... ⎜   ↳ Touchpad       id=12   [slave  pointer  (2)]
+    ... ⎣ Keyboard           id=3    [master keyboard (2)]
+    ...     ↳ Laptop keys    id=11   [slave  keyboard (3)]
+    ... '''))
+    >>> kb = MockKeybinder()
+    >>> hotkeys = Hotkeys(xinput, bindings, profiles, keybinder=kb)
+    >>> hotkeys.start()
+    >>> kb.press('<Super>F9')
+    Device Touchpad disabled
+    >>> kb.press('<Super>F9')
+    Device Touchpad enabled
+    >>> kb.press('<Super>F11')
+    Device Touchpad disabled
+    Device Laptop keys disabled
+
+    With an `UndoHistory`, the changes are recorded in it, and the `undo`
+    and `redo` actions revert or repeat the last one:
+
+    >>> from inputdeviceindicator.undo import UndoHistory
+    >>> hotkeys = Hotkeys(
+    ...     xinput, {'<Super>z': {'action': 'undo'}}, keybinder=kb,
+    ...     history=UndoHistory(xinput)
+    ... )
+    >>> hotkeys.start()
+    >>> hotkeys.run({'action': 'toggle', 'device': 'Touchpad'})
+    Device Touchpad enabled
+    >>> kb.press('<Super>z')
+    Device Touchpad disabled
+
+    Actions take the devices from the cache of `XInput`, so they do not list
+    the devices again unless the cache was invalidated.
+
+    Errors are given to `on_error`:
+
+    >>> hotkeys = Hotkeys(
+    ...     xinput, {'<Super>F12': {'action': 'explode'}}, keybinder=kb,
+    ...     on_error=print
+    ... )
+    >>> hotkeys.start()
+    >>> kb.press('<Super>F12')
+    invalid hotkey action {'action': 'explode'}
+
+    as are hotkeys for devices which are not connected:
+
+    >>> action = {'action': 'toggle', 'device': 'Trackball'}
+    >>> hotkeys.activate('<Super>F8', action)
+    no device named 'Trackball'
+
+    If Keybinder is not available, that is an error as well:
+
+    >>> Hotkeys(xinput, bindings, keybinder=None, on_error=print).start()
+    global hotkeys need Keybinder (gir1.2-keybinder-3.0)
+    """
+
+    def __init__(
+            self, xinput, bindings, profiles=None, keybinder=keybinder,
+            on_error=None, history=None):
+        self.xinput = xinput
+        self.bindings = bindings
+        self.profiles = profiles if profiles is not None else {}
+        self.keybinder = keybinder
+        self.on_error = on_error
+        self.history = history
+
+    def start(self):
+        if self.keybinder is None:
+            self.report(
+                HotkeyError(
+                    'global hotkeys need Keybinder (gir1.2-keybinder-3.0)'
+                )
+            )
+            return
+        self.keybinder.init()
+        for accelerator, action in self.bindings.items():
+            if not self.keybinder.bind(accelerator, self.activate, action):
+                self.report(
+                    HotkeyError('could not bind {0}'.format(accelerator))
+                )
+
+    def stop(self):
+        if self.keybinder is None:
+            return
+        for accelerator in self.bindings:
+            self.keybinder.unbind(accelerator)
+
+    def activate(self, keystring, action):
+        try:
+            self.run(action)
+        except (XInputError, HotkeyError) as e:
+            self.report(e)
+
+    def run(self, action):
+        kind = action.get('action')
+        if kind in ('enable', 'disable', 'toggle') and 'device' in action:
+            devices = find_devices(
+                self.xinput.get_devices(), action['device']
+            )
+            if not devices:
+                raise XInputError(
+                    'no device named {0!r}'.format(action['device'])
+                )
+            if kind == 'toggle':
+                enabled = not all(d.enabled for d in devices)
+            else:
+                enabled = kind == 'enable'
+            changed = set_enabled(self.xinput, devices, enabled, 'hotkey')
+            self.record((d, enabled) for d in changed)
+        elif kind == 'profile' and action.get('profile') in self.profiles:
+            self.record(apply_profile(
+                self.xinput, self.xinput.get_devices(),
+                self.profiles[action['profile']], 'hotkey'
+            ))
+        elif kind in ('undo', 'redo') and self.history is not None:
+            if kind == 'undo':
+                self.history.undo()
+            else:
+                self.history.redo()
+        else:
+            raise HotkeyError('invalid hotkey action {0!r}'.format(action))
+
+    def record(self, changes):
+        if self.history is not None:
+            self.history.record(changes)
+
+    def report(self, error):
+        if self.on_error is not None:
+            self.on_error(error)
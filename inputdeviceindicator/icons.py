@@ -0,0 +1,147 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import hashlib
+import os
+import os.path
+import shutil
+
+import gi
+gi.require_version('GdkPixbuf', '2.0')  # noqa
+
+from gi.repository import GLib as glib
+from gi.repository import GdkPixbuf as gdkpb
+
+from inputdeviceindicator.info import ICON_PATH
+from inputdeviceindicator.paths import get_cache_dir
+
+
+ICON_NAME = 'input-device-indicator'
+ICON_SIZES = [16, 22, 24, 32, 48, 64, 128]
+
+
+def get_icon_theme_dir(svg_path=ICON_PATH, cache_dir=None, render=None):
+    """
+    Returns a directory containing an icon theme with the application icon
+    rendered as PNG files, so the panel does not need to parse the SVG.
+
+    The icons are rendered the first time the function is called, by the
+    `render` function (`render_png()` by default):
+
+    >>> import tempfile
+    >>> cache_dir = tempfile.mkdtemp()
+    >>> def render(svg_path, size, png_path):
+    ...     print('rendering', size)
+    ...     open(png_path, 'w').close()
+    >>> theme_dir = get_icon_theme_dir(
+    ...     cache_dir=cache_dir, render=render
+    ... ) # doctest: +ELLIPSIS
+    rendering 16
+    ...
+    rendering 128
+    >>> os.path.exists(get_icon_file(theme_dir, 48))
+    True
+
+    Later calls just reuse the rendered icons:
+
+    >>> get_icon_theme_dir(cache_dir=cache_dir, render=render) == theme_dir
+    True
+
+    The directory is named after the SVG hash, so if the SVG changes, the
+    icons are rendered again and the outdated ones are removed:
+
+    >>> svg_path = os.path.join(cache_dir, 'changed.svg')
+    >>> with open(svg_path, 'w') as f:
+    ...     _ = f.write('<svg/>')
+    >>> new_theme_dir = get_icon_theme_dir(
+    ...     svg_path, cache_dir=cache_dir, render=render
+    ... ) # doctest: +ELLIPSIS
+    rendering 16
+    ...
+    >>> new_theme_dir == theme_dir
+    False
+    >>> os.path.exists(theme_dir)
+    False
+
+    If the icons cannot be rendered, it returns `None`, and the caller should
+    use the SVG itself:
+
+    >>> def fail(svg_path, size, png_path):
+    ...     raise OSError('no space left on device')
+    >>> print(get_icon_theme_dir(
+    ...     os.path.join(cache_dir, 'changed.svg'),
+    ...     cache_dir=tempfile.mkdtemp(), render=fail
+    ... ))
+    None
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    if render is None:
+        render = render_png
+    icons_dir = os.path.join(cache_dir, 'icons')
+    theme_dir = os.path.join(icons_dir, get_file_hash(svg_path))
+    try:
+        for size in ICON_SIZES:
+            icon_file = get_icon_file(theme_dir, size)
+            if os.path.exists(icon_file):
+                continue
+            os.makedirs(os.path.dirname(icon_file), exist_ok=True)
+            temp_file = icon_file + '.tmp'
+            render(svg_path, size, temp_file)
+            os.replace(temp_file, icon_file)
+        remove_outdated_theme_dirs(icons_dir, theme_dir)
+    except (OSError, glib.Error):
+        return None
+    return theme_dir
+
+
+def get_icon_file(theme_dir, size):
+    size_dir = '{0}x{0}'.format(size)
+    return os.path.join(
+        theme_dir, 'hicolor', size_dir, 'apps', ICON_NAME + '.png'
+    )
+
+
+def get_file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def remove_outdated_theme_dirs(icons_dir, theme_dir):
+    for name in os.listdir(icons_dir):
+        path = os.path.join(icons_dir, name)
+        if path != theme_dir:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def render_png(svg_path, size, png_path):
+    pixbuf = gdkpb.Pixbuf.new_from_file_at_size(svg_path, size, size)
+    pixbuf.savev(png_path, 'png', [], [])
+
+
+def get_icon_pixbuf(size):
+    """
+    Returns the application icon as a pixbuf of the given size, loaded from
+    the rendered icons if possible:
+
+    >>> get_icon_pixbuf(128).get_width()
+    128
+    """
+    theme_dir = get_icon_theme_dir()
+    if theme_dir is not None and size in ICON_SIZES:
+        return gdkpb.Pixbuf.new_from_file(get_icon_file(theme_dir, size))
+    return gdkpb.Pixbuf.new_from_file_at_size(ICON_PATH, size, size)
@@ -22,18 +22,47 @@ gi.require_version('AppIndicator3', '0.1')  # noqa
 from gi.repository import Gtk as gtk
 from gi.repository import AppIndicator3 as appindicator
 
+from inputdeviceindicator import icons
 from inputdeviceindicator.menu import get_menu
 from inputdeviceindicator.info import get_icon_path
+from inputdeviceindicator.profiling import NULL_PROFILE
 
 
-def get_indicator():
-    return build_indicator(get_menu())
+def get_indicator(
+        xinput=None, profile=NULL_PROFILE, scheduler=None, layout='flat',
+        history=None):
+    menu = get_menu(xinput, profile, scheduler, layout, history)
+    with profile.phase('build indicator'):
+        return build_indicator(menu)
 
 
 def build_indicator(menu):
-    indicator = appindicator.Indicator.new(
-        'input-device-indicator', get_icon_path(),
-        appindicator.IndicatorCategory.SYSTEM_SERVICES
-    )
+    """
+    Creates the indicator with the given menu. The icon is looked up by name
+    in the theme with the rendered icons:
+
+    >>> indicator = build_indicator(gtk.Menu())
+    >>> indicator.get_icon()
+    'input-device-indicator'
+
+    If there are no rendered icons, the SVG is used instead:
+
+    >>> from inelegant.module import temp_var
+    >>> with temp_var(icons, 'get_icon_theme_dir', lambda: None):
+    ...     indicator = build_indicator(gtk.Menu())
+    >>> indicator.get_icon() == get_icon_path()
+    True
+    """
+    theme_dir = icons.get_icon_theme_dir()
+    if theme_dir is not None:
+        indicator = appindicator.Indicator.new_with_path(
+            'input-device-indicator', icons.ICON_NAME,
+            appindicator.IndicatorCategory.SYSTEM_SERVICES, theme_dir
+        )
+    else:
+        indicator = appindicator.Indicator.new(
+            'input-device-indicator', get_icon_path(),
+            appindicator.IndicatorCategory.SYSTEM_SERVICES
+        )
     indicator.set_menu(menu)
     return indicator
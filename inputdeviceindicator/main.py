@@ -15,16 +15,497 @@
 # You should have received a copy of the GNU General Public License along with
 # Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
 
-import gi
-gi.require_version('Gtk', '3.0')  # noqa
-gi.require_version('AppIndicator3', '0.1')  # noqa
+import argparse
+import sys
+import time
 
-from gi.repository import Gtk as gtk
-from gi.repository import AppIndicator3 as appindicator
-from inputdeviceindicator.indicator import get_indicator
+from inputdeviceindicator.backends import BackendError, select_backend
+from inputdeviceindicator.command import DEFAULT_TIMEOUTS
+from inputdeviceindicator.config import ConfigError, load_config
+from inputdeviceindicator.profiling import StartupProfile, NULL_PROFILE, \
+    import_startup_modules
 
 
-def main():
-    indicator = get_indicator()
-    indicator.set_status(appindicator.IndicatorStatus.ACTIVE)
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    profile = StartupProfile() if arguments.profile_startup else NULL_PROFILE
+    try:
+        config = load_config()
+    except ConfigError as e:
+        sys.exit(str(e))
+    config['timeouts'].update(arguments.timeouts)
+    if arguments.command == 'agent':
+        sys.exit(run_agent(arguments, config))
+    if arguments.command == 'history':
+        sys.exit(show_history(arguments, config))
+    if arguments.command in ('undo', 'redo'):
+        sys.exit(send_history_command(arguments.command))
+    try:
+        xinput = select_backend(
+            arguments.backend or config['backend'], config['timeouts']
+        )
+    except BackendError as e:
+        sys.exit(str(e))
+    if config['audit_log']['enabled']:
+        from inputdeviceindicator.audit import AuditLog
+        xinput.audit = AuditLog(
+            max_bytes=config['audit_log']['max_bytes'],
+            backups=config['audit_log']['backups']
+        )
+    if arguments.command == 'disable-for':
+        sys.exit(disable_for(xinput, arguments.device, arguments.duration))
+    if arguments.cat_detector:
+        config['cat_detector']['enabled'] = True
+    start(profile, xinput, config)
+
+    from gi.repository import Gtk as gtk
     gtk.main()
+
+
+def start(profile=NULL_PROFILE, xinput=None, config=None):
+    """
+    Import the GUI modules, build the indicator and activate it. When the main
+    loop is idle for the first time the icon is visible, and then the profile
+    is notified.
+
+    The GUI modules are not imported along with this module (nor with the
+    configuration), so the profile can time them:
+
+    >>> import os, subprocess, sys
+    >>> subprocess.run(
+    ...     [
+    ...         sys.executable, '-c', 'import sys, inputdeviceindicator.main; '
+    ...         'print("gi.repository.Gtk" in sys.modules)'
+    ...     ],
+    ...     env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+    ...     stdout=subprocess.PIPE, universal_newlines=True
+    ... ).stdout
+    'False\\n'
+    """
+    # Imported here, and not at the top, so the profile can time them.
+    import_startup_modules(profile)
+    from gi.repository import GLib as glib
+    from gi.repository import AppIndicator3 as appindicator
+    from inputdeviceindicator.indicator import get_indicator
+    from inputdeviceindicator.scheduler import ReenableScheduler
+    from inputdeviceindicator.undo import UndoHistory
+
+    if xinput is None:
+        xinput = select_backend()
+    xinput.dispatch = glib.idle_add
+    scheduler = ReenableScheduler(xinput)
+    layout = config['menu_layout'] if config is not None else 'flat'
+    history = UndoHistory(
+        xinput, config['undo']['size'] if config is not None else 20
+    )
+    indicator = get_indicator(xinput, profile, scheduler, layout, history)
+    with profile.phase('activate indicator'):
+        indicator.set_status(appindicator.IndicatorStatus.ACTIVE)
+    glib.idle_add(profile.icon_shown)
+    if config is not None:
+        start_services(
+            xinput, indicator.get_menu(), scheduler, config, history
+        )
+    return indicator
+
+
+def start_services(xinput, menu, scheduler, config, history=None):
+    """
+    Starts the features which run alongside the menu: the timers, the
+    control socket, the activity meter and countdown in the menu, and the
+    opt-in features which act on devices by themselves from the XI2 events
+    reported by an `EventMonitor`, such as the dead man's switch undoing
+    changes which leave no working input device. The hook scripts are run
+    on every device state change the indicator sees.
+    """
+    from gi.repository import GLib as glib
+    from inputdeviceindicator.activity import ActivityLabels, ActivityMeter
+    from inputdeviceindicator.catdetector import CatDetector
+    from inputdeviceindicator.control import ControlError, ControlServer
+    from inputdeviceindicator.countdown import CountdownLabels
+    from inputdeviceindicator.events import EventMonitor
+    from inputdeviceindicator.hooks import HookRunner
+    from inputdeviceindicator.hotkeys import Hotkeys
+    from inputdeviceindicator.menu import set_menu_status
+    from inputdeviceindicator.sysfs import UeventMonitor
+    from inputdeviceindicator.typingguard import TypingGuard
+    from inputdeviceindicator.undo import DeadMansSwitch
+
+    def show_error(error):
+        set_menu_status(menu, str(error))
+
+    scheduler.on_error = show_error
+    scheduler.start()
+    scheduler.on_change = CountdownLabels(menu, scheduler).scheduler_changed
+
+    def disable_device_for(device, seconds):
+        scheduler.disable_for(device, seconds)
+        return '{0} disabled for {1} seconds'.format(device, seconds)
+
+    handlers = {'disable-for': disable_device_for}
+    if history is not None:
+        handlers.update(undo=history.undo, redo=history.redo)
+    try:
+        ControlServer(handlers).start()
+    except ControlError as e:
+        sys.exit(str(e))
+
+    if config['hooks']['enabled']:
+        runner = HookRunner(
+            timeout=config['hooks']['timeout'],
+            max_workers=config['hooks']['max_workers'], on_error=show_error,
+            dispatch=glib.idle_add
+        )
+        xinput.add_listener(runner.device_state_changed)
+
+    # Hotplug is learned from uevents, even with XI2, so the menu does not
+    # need to poll xinput.
+    uevents = UeventMonitor()
+    try:
+        uevents.subscribe(xinput.uevent_received)
+        if getattr(menu, 'callbacks', None) is not None:
+            uevents.subscribe(menu.callbacks.uevent_received)
+    except OSError as e:
+        if xinput.event_source == 'uevent':
+            show_error('cannot monitor devices: {0}'.format(e))
+
+    monitor = EventMonitor(on_error=show_error)
+    if config['activity_meter']['enabled']:
+        ActivityLabels(
+            menu, ActivityMeter(monitor, config['activity_meter']['seconds'])
+        )
+    settings = config['disable_while_typing']
+    if config['cat_detector']['enabled'] or settings['enabled'] or \
+            config['hotkeys']:
+        # Subscribed first, so the device cache is up to date by the time
+        # the other listeners get the events.
+        monitor.subscribe(xinput.event_received, xinput.event_types)
+    if config['cat_detector']['enabled']:
+        CatDetector(
+            xinput, monitor, config['cat_detector'], on_error=show_error
+        ).start()
+    if settings['enabled']:
+        TypingGuard(
+            xinput, monitor, settings['keyboards'], settings['pointer'],
+            settings['idle'], on_error=show_error
+        ).start()
+    if config['hotkeys']:
+        Hotkeys(
+            xinput, config['hotkeys'], config['profiles'], on_error=show_error,
+            history=history
+        ).start()
+    switch = config['undo']['dead_mans_switch']
+    if history is not None and switch['enabled']:
+        DeadMansSwitch(
+            history, monitor, switch['seconds'], on_revert=show_error,
+            on_error=show_error
+        ).start()
+    return monitor
+
+
+def disable_for(xinput, device, seconds):
+    """
+    Disables a device for some time, from the command line. The running
+    indicator is asked to do it; if it is not running, the device is
+    disabled here and the timer is saved, so the indicator enables the device
+    again once it starts.
+
+    Returns the exit status.
+    """
+    from inputdeviceindicator.actions import find_devices, set_enabled
+    from inputdeviceindicator.command import XInputError
+    from inputdeviceindicator.control import ControlError, \
+        IndicatorNotRunning, send_command
+    from inputdeviceindicator.scheduler import TimerStore
+
+    try:
+        print(send_command(
+            {'command': 'disable-for', 'device': device, 'seconds': seconds}
+        ))
+        return 0
+    except IndicatorNotRunning:
+        pass
+    except ControlError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    try:
+        devices = find_devices(xinput.list(), device)
+        if not devices:
+            raise XInputError('no device named {0!r}'.format(device))
+        set_enabled(xinput, devices, False, 'command line')
+    except XInputError as e:
+        print(e, file=sys.stderr)
+        return 1
+    store = TimerStore()
+    timers = store.load()
+    timers[device] = time.time() + seconds
+    store.save(timers)
+    print(
+        '{0} disabled; it will be enabled again by the indicator after {1} '
+        'seconds, once it is running'.format(device, seconds)
+    )
+    return 0
+
+
+def send_history_command(command):
+    """
+    Asks the running indicator to undo or redo the last change to the
+    devices. Only the indicator knows its changes, so it has to be running.
+
+    Returns the exit status.
+    """
+    from inputdeviceindicator.control import ControlError, send_command
+
+    try:
+        print(send_command({'command': command}))
+    except ControlError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+def run_agent(arguments, config, sleep=time.sleep):
+    """
+    Runs the headless agent on the given displays: the profile is applied
+    and/or the snapshots are collected, and the status of each display is
+    printed. With an interval, this is repeated until interrupted.
+
+    Returns the exit status, which is an error if the last round failed on
+    some display.
+    """
+    from inputdeviceindicator.agent import AgentError, DisplayAgent
+
+    agent = DisplayAgent(
+        arguments.displays, config['profiles'], arguments.workers,
+        timeouts=config['timeouts']
+    )
+    try:
+        while True:
+            statuses = []
+            if arguments.profile is not None:
+                statuses = agent.apply_profile(arguments.profile)
+            if arguments.snapshots or arguments.profile is None:
+                statuses = agent.collect_snapshots()
+            for status in statuses:
+                print(status, flush=True)
+            if arguments.interval is None:
+                break
+            sleep(arguments.interval)
+    except AgentError as e:
+        print(e, file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.shutdown()
+    return 0 if all(s.ok for s in statuses) else 1
+
+
+def show_history(arguments, config):
+    """
+    Prints the changes of device states recorded in the audit log, oldest
+    first.
+    """
+    from inputdeviceindicator.audit import format_record, read_history
+
+    for record in read_history(
+            device=arguments.device, since=arguments.since,
+            until=arguments.until, backups=config['audit_log']['backups']):
+        print(format_record(record))
+    return 0
+
+
+def parse_arguments(argv=None):
+    """
+    Parses the command line arguments:
+
+    >>> parse_arguments([]).profile_startup
+    False
+    >>> parse_arguments(['--profile-startup']).profile_startup
+    True
+
+    The backend can be chosen, instead of picking the fastest one which
+    works:
+
+    >>> print(parse_arguments([]).backend)
+    None
+    >>> parse_arguments(['--backend', 'evdev']).backend
+    'evdev'
+
+    Timeouts for `xinput` operations can be given as `OPERATION=SECONDS`:
+
+    >>> arguments = parse_arguments(
+    ...     ['--timeout', 'list=10', '--timeout', 'enable=1']
+    ... )
+    >>> arguments.timeouts
+    {'list': 10.0, 'enable': 1.0}
+
+    Without a command, the indicator is started. With the `disable-for`
+    command, a device is disabled for some time:
+
+    >>> print(parse_arguments([]).command)
+    None
+    >>> arguments = parse_arguments(['disable-for', '5m', 'Touchpad'])
+    >>> arguments.command, arguments.duration, arguments.device
+    ('disable-for', 300, 'Touchpad')
+
+    With the `agent` command, no indicator is shown; instead, the devices of
+    many displays are managed at once:
+
+    >>> arguments = parse_arguments(
+    ...     ['agent', '--display', ':1', '--display', ':2', '--profile', 'k']
+    ... )
+    >>> arguments.displays, arguments.profile, arguments.interval
+    ([':1', ':2'], 'k', None)
+
+    The `history` command shows who changed the devices, and when:
+
+    >>> arguments = parse_arguments([
+    ...     'history', '--device', 'Touchpad',
+    ...     '--since', '2020-09-13 00:00+00:00'
+    ... ])
+    >>> arguments.device, arguments.since, arguments.until
+    ('Touchpad', 1599955200.0, None)
+
+    The `undo` and `redo` commands revert or repeat the last change made by
+    the running indicator:
+
+    >>> parse_arguments(['undo']).command
+    'undo'
+    """
+    parser = argparse.ArgumentParser(prog='input-device-indicator')
+    parser.add_argument(
+        '--profile-startup', action='store_true',
+        help='report import times and a startup timeline to standard error'
+    )
+    parser.add_argument(
+        '--cat-detector', action='store_true',
+        help='disable keyboards which seem to be mashed by a cat'
+    )
+    parser.add_argument(
+        '--backend', metavar='NAME',
+        help='how to list and disable devices (xinput, evdev or any other '
+        'installed backend); by default, the fastest one which works'
+    )
+    parser.add_argument(
+        '--timeout', dest='timeouts', metavar='OPERATION=SECONDS',
+        action='append', type=parse_timeout, default=[],
+        help='timeout for an xinput operation (list, enable or disable)'
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    disable_for_parser = subparsers.add_parser(
+        'disable-for', help='disable a device for some time'
+    )
+    disable_for_parser.add_argument(
+        'duration', type=parse_duration_argument,
+        help='for how long, e.g. 300, 5m or 1h30m'
+    )
+    disable_for_parser.add_argument('device', help='the name of the device')
+    agent_parser = subparsers.add_parser(
+        'agent', help='manage the devices of many displays, without a menu'
+    )
+    agent_parser.add_argument(
+        '--display', dest='displays', metavar='DISPLAY', action='append',
+        required=True, help='an X display to manage, e.g. :1'
+    )
+    agent_parser.add_argument(
+        '--profile', help='a profile to apply on all displays'
+    )
+    agent_parser.add_argument(
+        '--snapshots', action='store_true',
+        help='save the devices of each display (the default without a '
+        'profile)'
+    )
+    agent_parser.add_argument(
+        '--interval', type=float, metavar='SECONDS',
+        help='repeat every SECONDS, instead of running once'
+    )
+    agent_parser.add_argument(
+        '--workers', type=int, default=4,
+        help='how many displays are handled at the same time'
+    )
+    history_parser = subparsers.add_parser(
+        'history', help='show who enabled or disabled devices, and when'
+    )
+    history_parser.add_argument(
+        '--device', help='only changes of the device with this name'
+    )
+    history_parser.add_argument(
+        '--since', type=parse_time_argument, metavar='TIME',
+        help='only changes since TIME, e.g. 2020-09-13, "2020-09-13 10:00" '
+        'or 1h (one hour ago)'
+    )
+    history_parser.add_argument(
+        '--until', type=parse_time_argument, metavar='TIME',
+        help='only changes until TIME'
+    )
+    subparsers.add_parser(
+        'undo', help='undo the last change made by the running indicator'
+    )
+    subparsers.add_parser(
+        'redo', help='redo the last change undone by the running indicator'
+    )
+    arguments = parser.parse_args(argv)
+    arguments.timeouts = dict(arguments.timeouts)
+    return arguments
+
+
+def parse_duration_argument(value):
+    from inputdeviceindicator.scheduler import parse_duration
+    try:
+        return parse_duration(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_time_argument(value, clock=time.time):
+    """
+    Parses a point in time given in the command line, either as a date and
+    time, or as a duration meaning how long ago:
+
+    >>> parse_time_argument('2020-09-13T12:26:40+00:00')
+    1600000000.0
+    >>> parse_time_argument('1h', clock=lambda: 1600000000.0)
+    1599996400.0
+    >>> parse_time_argument('yesterday') # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+      ...
+    argparse.ArgumentTypeError: invalid time 'yesterday', ...
+    """
+    import datetime
+    from inputdeviceindicator.scheduler import parse_duration
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        pass
+    try:
+        return clock() - parse_duration(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'invalid time {0!r}, expected a date and time (e.g. 2020-09-13 '
+            '10:00) or how long ago (e.g. 1h30m)'.format(value)
+        )
+
+
+def parse_timeout(value):
+    """
+    Parses a timeout given in the command line:
+
+    >>> parse_timeout('list=2.5')
+    ('list', 2.5)
+    >>> parse_timeout('list') # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+      ...
+    argparse.ArgumentTypeError: invalid timeout 'list', ...
+    """
+    operation, _, seconds = value.partition('=')
+    try:
+        if operation not in DEFAULT_TIMEOUTS:
+            raise ValueError(operation)
+        return operation, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'invalid timeout {0!r}, expected OPERATION=SECONDS with OPERATION '
+            'being one of {1}'.format(value, ', '.join(DEFAULT_TIMEOUTS))
+        )
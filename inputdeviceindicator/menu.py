@@ -19,21 +19,170 @@ import gi
 gi.require_version('Gtk', '3.0')  # noqa
 gi.require_version('AppIndicator3', '0.1')  # noqa
 
+import threading
+
+from gi.repository import GLib as glib
 from gi.repository import Gtk as gtk
 
-from inputdeviceindicator.command import XInput
+from inputdeviceindicator.command import XInputError, wait_for_devices
 from inputdeviceindicator.about import get_about_dialog
+from inputdeviceindicator.actions import get_slave_devices, set_enabled
+from inputdeviceindicator.backends import select_backend
+from inputdeviceindicator.commandqueue import DeviceCommandQueue
+from inputdeviceindicator.grouping import group_devices
+from inputdeviceindicator.profiling import NULL_PROFILE
+from inputdeviceindicator.scheduler import DISABLE_DURATIONS, format_duration
+from inputdeviceindicator.snapshot import Snapshot
+
+
+POINTER_SETTINGS = [
+    ('libinput Tapping Enabled', 'Tap to click'),
+    ('libinput Natural Scrolling Enabled', 'Natural scrolling'),
+]
+
+MENU_LAYOUTS = ['flat', 'submenus']
+
+# How long to wait for the rest of a burst of uevents, in milliseconds.
+HOTPLUG_DELAY = 250
 
 
-def get_menu():
-    xinput = XInput()
+def get_menu(
+        xinput=None, profile=NULL_PROFILE, scheduler=None, layout='flat',
+        history=None):
+    """
+    Creates the indicator menu. If there is a snapshot of the devices from a
+    previous session, the menu is built from it right away, and the devices
+    are listed in the background; otherwise, they are listed before building
+    the menu. If `xinput` fails (e.g. because the X server is not ready yet)
+    the menu is built empty and the devices are listed in the background as
+    well.
+
+    The layout is one of `MENU_LAYOUTS` (see `build_menu()`). Changes made
+    from the menu are recorded in `history`, an `UndoHistory`, if given.
+    """
+    if xinput is None:
+        xinput = select_backend()
     menu = gtk.Menu()
-    about_dialog = get_about_dialog()
-    menu_callbacks = MenuCallbacks(xinput, menu, about_dialog)
-    build_menu(menu, xinput.list(), menu_callbacks)
+    menu.layout = layout
+    snapshot = Snapshot()
+    menu_callbacks = MenuCallbacks(
+        xinput, menu, snapshot=snapshot, scheduler=scheduler,
+        history=history
+    )
+    if history is not None:
+        history.on_change = menu_callbacks.history_changed
+    menu_callbacks.queue = DeviceCommandQueue(
+        xinput, on_done=menu_callbacks.command_done,
+        on_error=menu_callbacks.command_failed, dispatch=glib.idle_add,
+        source='menu'
+    )
+    xinput.add_listener(menu_callbacks.device_state_changed)
+    menu.callbacks = menu_callbacks
+    with profile.phase('load snapshot'):
+        devices = snapshot.load()
+    listed = False
+    if devices is None:
+        try:
+            with profile.phase('list devices'):
+                devices = xinput.list()
+            snapshot.save(devices)
+            listed = True
+        except XInputError:
+            devices = []
+    with profile.phase('build menu'):
+        build_menu(menu, devices, menu_callbacks)
+    if listed:
+        glib.idle_add(menu_callbacks.update_devices, devices)
+    else:
+        list_devices_in_background(xinput, menu_callbacks)
     return menu
 
 
+def list_devices_in_background(xinput, callbacks):
+    """
+    Lists the devices in another thread, so the main loop is not blocked
+    waiting for `xinput`, retrying until the X server answers. The devices,
+    and the properties of the slave devices, are given to
+    `callbacks.update_devices()` and errors to `callbacks.show_error()`, both
+    called in the main loop.
+    """
+    def show_error(error):
+        glib.idle_add(callbacks.show_error, error)
+
+    def list_devices():
+        try:
+            devices = wait_for_devices(xinput, on_error=show_error)
+        except XInputError:
+            return
+        properties = read_properties(xinput, devices, show_error)
+        glib.idle_add(callbacks.update_devices, devices, properties)
+
+    thread = threading.Thread(target=list_devices, daemon=True)
+    thread.start()
+    return thread
+
+
+def read_properties_in_background(xinput, callbacks, devices):
+    """
+    Reads the properties of the slave devices in another thread, like
+    `list_devices_in_background()`, giving them to
+    `callbacks.properties_read()` in the main loop.
+    """
+    def show_error(error):
+        glib.idle_add(callbacks.show_error, error)
+
+    def read():
+        properties = read_properties(xinput, devices, show_error)
+        glib.idle_add(callbacks.properties_read, devices, properties)
+
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    return thread
+
+
+def read_properties(xinput, devices, show_error):
+    """
+    Reads the properties of the slave devices, all at once. They are used to
+    group the devices and for the "Pointer settings" submenu.
+    """
+    try:
+        return xinput.get_properties(get_slave_devices(devices))
+    except XInputError as e:
+        show_error(e)
+        return {}
+
+
+def set_menu_status(menu, message):
+    """
+    Displays a message about the state of the indicator (for example, that
+    `xinput` is failing) in a menu built by `build_menu()`:
+
+    >>> from inputdeviceindicator.mock import MockMenuCallbacks
+    >>> menu = gtk.Menu()
+    >>> build_menu(menu, [], MockMenuCallbacks())
+    >>> item = menu.get_children()[0]
+    >>> item.get_visible()
+    False
+    >>> set_menu_status(menu, 'xinput timed out')
+    >>> item.get_visible(), item.get_label(), item.get_sensitive()
+    (True, 'xinput timed out', False)
+
+    With no message, the status is hidden again:
+
+    >>> set_menu_status(menu, None)
+    >>> item.get_visible()
+    False
+    """
+    status_menu_item = getattr(menu, 'status_menu_item', None)
+    if status_menu_item is None:
+        return
+    if message:
+        status_menu_item.set_label(message)
+        status_menu_item.show()
+    else:
+        status_menu_item.hide()
+
+
 def build_menu(menu, devices, callbacks):
     """
     Build a menu from a list of devices, connecting them to corresponding
@@ -110,14 +259,32 @@ def build_menu(menu, devices, callbacks):
     """
     for c in menu.get_children():
         menu.remove(c)
+        c.destroy()
 
-    for d in devices:
-        menu.append(gtk.MenuItem(label=d.name))
-        for c in d.children:
-            cdcmi = build_device_check_menu_item(
-                c, callbacks.child_device_check_menu_item_toggled
-            )
-            menu.append(cdcmi)
+    status_menu_item = gtk.MenuItem(label='')
+    status_menu_item.set_sensitive(False)
+    menu.append(status_menu_item)
+    menu.status_menu_item = status_menu_item
+
+    disable_for_menu_item = gtk.MenuItem(label='Disable for…')
+    menu.append(disable_for_menu_item)
+    menu.disable_for_menu_item = disable_for_menu_item
+
+    settings_menu_item = gtk.MenuItem(label='Pointer settings')
+    menu.append(settings_menu_item)
+    menu.settings_menu_item = settings_menu_item
+    update_settings_menu(menu, devices, {}, callbacks)
+
+    undo_menu_item = gtk.MenuItem(label='Undo last change')
+    undo_menu_item.connect('activate', callbacks.undo_menu_item_activate)
+    menu.append(undo_menu_item)
+    menu.undo_menu_item = undo_menu_item
+
+    redo_menu_item = gtk.MenuItem(label='Redo last change')
+    redo_menu_item.connect('activate', callbacks.redo_menu_item_activate)
+    menu.append(redo_menu_item)
+    menu.redo_menu_item = redo_menu_item
+    update_undo_menu_items(menu, getattr(callbacks, 'history', None))
 
     menu.append(gtk.SeparatorMenuItem())
 
@@ -135,7 +302,727 @@ def build_menu(menu, devices, callbacks):
     quit_menu_item.connect('activate', callbacks.quit_menu_item_activate)
     menu.append(quit_menu_item)
 
+    update_menu(menu, devices, callbacks)
+
     menu.show_all()
+    status_menu_item.hide()
+
+
+def update_undo_menu_items(menu, history):
+    """
+    Makes the "Undo last change" and "Redo last change" items clickable only
+    if there is something to undo or redo in the `UndoHistory`:
+
+    >>> from inputdeviceindicator.command import Device
+    >>> from inputdeviceindicator.mock import MockMenuCallbacks, MockXInput
+    >>> from inputdeviceindicator.undo import UndoHistory
+    >>> menu = gtk.Menu()
+    >>> build_menu(menu, [], MockMenuCallbacks())
+    >>> menu.undo_menu_item.get_sensitive()
+    False
+    >>> history = UndoHistory(MockXInput())
+    >>> history.record([(Device(4, 'Mouse', 2, 'slave', 'pointer'), False)])
+    >>> update_undo_menu_items(menu, history)
+    >>> menu.undo_menu_item.get_sensitive()
+    True
+    >>> menu.redo_menu_item.get_sensitive()
+    False
+
+    Without a history, the items are hidden.
+    """
+    undo_menu_item = getattr(menu, 'undo_menu_item', None)
+    if undo_menu_item is None:
+        return
+    for menu_item, sensitive in (
+            (undo_menu_item, history is not None and history.can_undo),
+            (menu.redo_menu_item, history is not None and history.can_redo)):
+        menu_item.set_sensitive(sensitive)
+        menu_item.set_no_show_all(history is None)
+        menu_item.set_visible(history is not None)
+
+
+def update_menu(menu, devices, callbacks, groups=()):
+    """
+    Updates a menu created by `build_menu()` so it reflects the given
+    devices. Only the items whose devices changed are touched.
+
+    Suppose we have this menu:
+
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.mock import MockMenuCallbacks
+    >>> callbacks = MockMenuCallbacks()
+    >>> menu = gtk.Menu()
+    >>> build_menu(menu, parse('''
+    ... ⎡ A        id=2    [master pointer  (3)]
+    ... ⎜   ↳ A1   id=4    [slave  pointer  (2)]
+    ... ⎜   ↳ A2   id=7    [slave  pointer  (2)]
+    ... ⎣ B        id=3    [master keyboard (2)]
+    ...     ↳ B1   id=5    [slave  keyboard (3)]
+    ...         This device is disabled
+    ... '''), callbacks)
+    >>> old_items = menu.get_children()
+
+    Now, some devices changed: A1 was unplugged, B1 was enabled and B2 was
+    plugged:
+
+    >>> update_menu(menu, parse('''
+    ... ⎡ A        id=2    [master pointer  (3)]
+    ... ⎜   ↳ A2   id=7    [slave  pointer  (2)]
+    ... ⎣ B        id=3    [master keyboard (2)]
+    ...     ↳ B1   id=5    [slave  keyboard (3)]
+    ...     ↳ B2   id=8    [slave  keyboard (3)]
+    ... '''), callbacks)
+
+    The menu reflects it...
+
+    >>> items = menu.get_children()
+    >>> [i.get_label() for i in items[:5]]
+    ['A', 'A2', 'B', 'B1', 'B2']
+    >>> items[3].get_active()
+    True
+
+    ...but the devices that were already there kept their items:
+
+    >>> items[1] is old_items[2], items[3] is old_items[4]
+    (True, True)
+
+    Note that updating the state of an item does not call the `toggled`
+    callback, since the device did not change because of the menu.
+
+    The "Disable for…" submenu is updated as well:
+
+    >>> disable_for_menu = menu.disable_for_menu_item.get_submenu()
+    >>> [i.get_label() for i in disable_for_menu.get_children()]
+    ['A2', 'B1', 'B2']
+
+    Stale devices (loaded from a snapshot) are displayed as insensitive items,
+    which become sensitive once the devices are confirmed:
+
+    >>> devices = parse('''
+    ... ⎡ A        id=2    [master pointer  (3)]
+    ... ⎜   ↳ A2   id=7    [slave  pointer  (2)]
+    ... ''')
+    >>> devices[0].children[0].stale = True
+    >>> update_menu(menu, devices, callbacks)
+    >>> menu.get_children()[1].get_sensitive()
+    False
+    >>> devices[0].children[0].stale = False
+    >>> update_menu(menu, devices, callbacks)
+    >>> menu.get_children()[1].get_sensitive()
+    True
+
+    If some devices are grouped by physical device (see `group_devices()`),
+    each group gets a single row, with a submenu for its parts, in the place
+    of its first part:
+
+    >>> from inputdeviceindicator.grouping import DeviceGroup
+    >>> devices = parse('''
+    ... ⎣ B                      id=3    [master keyboard (2)]
+    ...     ↳ USB Keyboard       id=5    [slave  keyboard (3)]
+    ...     ↳ B1                 id=6    [slave  keyboard (3)]
+    ...     ↳ USB Keyboard Keys  id=8    [slave  keyboard (3)]
+    ... ''')
+    >>> parts = [devices[0].children[0], devices[0].children[2]]
+    >>> update_menu(menu, devices, callbacks, [DeviceGroup('usb', parts)])
+    >>> [i.get_label() for i in menu.get_children()[:3]]
+    ['B', 'USB Keyboard', 'B1']
+
+    On machines with many devices, the menu can have a "submenus" layout
+    instead, where each master device gets a submenu for its children:
+
+    >>> menu = gtk.Menu()
+    >>> menu.layout = 'submenus'
+    >>> build_menu(menu, devices, callbacks)
+    >>> [i.get_label() for i in menu.get_children()[:2]]
+    ['B', '']
+
+    The items in the submenus are built when they are first opened (see
+    `build_master_menu_item()`) and, after that, updated like the others:
+
+    >>> master_menu_item = menu.get_children()[0]
+    >>> master_menu_item.emit('activate')
+    >>> del devices[0].children[1]
+    >>> update_menu(menu, devices, callbacks)
+    >>> [i.get_label() for i in master_menu_item.get_submenu().get_children()]
+    ['USB Keyboard', 'USB Keyboard Keys']
+    """
+    items = {}
+    for item in menu.get_children():
+        key = get_menu_row_key(item)
+        if key is not None:
+            items[key] = item
+    groups_by_device_id = {d.id: g for g in groups for d in g.devices}
+    layout = getattr(menu, 'layout', 'flat')
+
+    position = 0
+    for d in devices:
+        if layout == 'submenus' and d.level == 'master':
+            update_master_menu_row(
+                menu, items, position, d, callbacks, groups_by_device_id
+            )
+            position += 1
+            continue
+        update_menu_row(
+            menu, items, position, d, build_device_menu_item
+        )
+        position += 1
+        position = update_child_menu_rows(
+            menu, items, position, d.children, callbacks, groups_by_device_id
+        )
+
+    remove_menu_items(menu, items.values())
+    update_disable_for_menu(menu, devices, callbacks)
+
+
+def update_child_menu_rows(
+        menu, items, position, children, callbacks, groups_by_device_id):
+    for c in children:
+        group = groups_by_device_id.get(c.id)
+        if group is None:
+            update_menu_row(
+                menu, items, position, c,
+                lambda device: build_device_check_menu_item(
+                    device, callbacks.child_device_check_menu_item_toggled
+                )
+            )
+        elif c is group.devices[0]:
+            update_group_menu_row(menu, items, position, group, callbacks)
+        else:
+            continue
+        position += 1
+    return position
+
+
+def remove_menu_items(menu, items):
+    for item in list(items):
+        menu.remove(item)
+        item.destroy()
+
+
+def update_master_menu_row(
+        menu, items, position, device, callbacks, groups_by_device_id):
+    item = items.pop(device.id, None)
+    if item is None:
+        item = build_master_menu_item(device, callbacks)
+        menu.insert(item, position)
+        item.show()
+    else:
+        update_device_menu_item(item, device)
+        if menu.get_children().index(item) != position:
+            menu.reorder_child(item, position)
+    item.groups_by_device_id = groups_by_device_id
+    if item.populated:
+        update_master_submenu(item, callbacks)
+
+
+def build_master_menu_item(device, callbacks):
+    """
+    Returns a `gtk.MenuItem` for a master device in the "submenus" layout.
+    The items of its children go into its submenu, but they are only built
+    when the submenu is opened for the first time:
+
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.mock import MockMenuCallbacks
+    >>> devices = parse('''
+    ... ⎡ A        id=2    [master pointer  (3)]
+    ... ⎜   ↳ A1   id=4    [slave  pointer  (2)]
+    ... ⎜   ↳ A2   id=7    [slave  pointer  (2)]
+    ... ''')
+    >>> mi = build_master_menu_item(devices[0], MockMenuCallbacks())
+    >>> mi.get_label(), mi.device is devices[0]
+    ('A', True)
+    >>> [i.get_label() for i in mi.get_submenu().get_children()]
+    ['…']
+
+    The menu is opened through dbusmenu, which activates the item, or by
+    selecting the item in a GTK menu:
+
+    >>> mi.emit('activate')
+    >>> [i.get_label() for i in mi.get_submenu().get_children()]
+    ['A1', 'A2']
+
+    From then on, `update_menu()` keeps the submenu up to date.
+    """
+    menu_item = gtk.MenuItem(label=device.name)
+    menu_item.set_sensitive(not device.stale)
+    menu_item.device = device
+    menu_item.groups_by_device_id = {}
+    set_placeholder_submenu(menu_item)
+    menu_item.connect('activate', populate_master_menu_item, callbacks)
+    menu_item.connect('select', populate_master_menu_item, callbacks)
+    return menu_item
+
+
+def populate_master_menu_item(menu_item, callbacks):
+    if menu_item.populated:
+        return
+    menu_item.populated = True
+    update_master_submenu(menu_item, callbacks)
+
+
+def update_master_submenu(menu_item, callbacks):
+    submenu = menu_item.get_submenu()
+    items = {}
+    for item in submenu.get_children():
+        key = get_menu_row_key(item)
+        if key is not None:
+            items[key] = item
+        else:
+            submenu.remove(item)
+            item.destroy()
+    update_child_menu_rows(
+        submenu, items, 0, menu_item.device.children, callbacks,
+        menu_item.groups_by_device_id
+    )
+    remove_menu_items(submenu, items.values())
+
+
+def set_placeholder_submenu(menu_item):
+    """
+    Gives an item a submenu with only an insensitive placeholder, so it is
+    displayed as a submenu before its actual items are built.
+    """
+    submenu = gtk.Menu()
+    placeholder = gtk.MenuItem(label='…')
+    placeholder.set_sensitive(False)
+    submenu.append(placeholder)
+    submenu.show_all()
+    menu_item.set_submenu(submenu)
+    menu_item.populated = False
+
+
+def update_disable_for_menu(menu, devices, callbacks):
+    """
+    Builds the submenu of "Disable for…", with an item for each slave device
+    having, in turn, a submenu with the durations for which the device can be
+    disabled:
+
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.mock import MockMenuCallbacks
+    >>> menu = gtk.Menu()
+    >>> build_menu(menu, parse('''
+    ... ⎡ A        id=2    [master pointer  (3)]
+    ... ⎜   ↳ A1   id=4    [slave  pointer  (2)]
+    ... '''), MockMenuCallbacks())
+    >>> submenu = menu.disable_for_menu_item.get_submenu()
+    >>> device_item = submenu.get_children()[0]
+    >>> device_item.get_label()
+    'A1'
+    >>> durations = device_item.get_submenu().get_children()
+    >>> [i.get_label() for i in durations]
+    ['5 minutes', '15 minutes', '1 hour']
+
+    Each duration item is connected to the
+    `disable_for_menu_item_activate()` callback:
+
+    >>> durations[0].emit('activate')
+    Disable A1 for 300 seconds
+
+    The submenu is only rebuilt if the device names change. In the
+    "submenus" layout, it is only built when opened for the first time.
+    """
+    disable_for_menu_item = getattr(menu, 'disable_for_menu_item', None)
+    if disable_for_menu_item is None:
+        return
+    names = []
+    for d in get_slave_devices(devices):
+        if d.name not in names:
+            names.append(d.name)
+    if names == getattr(disable_for_menu_item, 'device_names', None):
+        return
+    disable_for_menu_item.device_names = names
+    disable_for_menu_item.set_sensitive(bool(names))
+
+    if getattr(menu, 'layout', 'flat') == 'submenus' and \
+            not getattr(disable_for_menu_item, 'populated', False):
+        if not hasattr(disable_for_menu_item, 'populated'):
+            set_placeholder_submenu(disable_for_menu_item)
+            for signal in ('activate', 'select'):
+                disable_for_menu_item.connect(
+                    signal, populate_disable_for_menu_item, callbacks
+                )
+        return
+    build_disable_for_submenu(disable_for_menu_item, callbacks)
+
+
+def populate_disable_for_menu_item(menu_item, callbacks):
+    if menu_item.populated:
+        return
+    menu_item.populated = True
+    build_disable_for_submenu(menu_item, callbacks)
+
+
+def build_disable_for_submenu(disable_for_menu_item, callbacks):
+    submenu = gtk.Menu()
+    for name in disable_for_menu_item.device_names:
+        durations_menu = gtk.Menu()
+        for seconds in DISABLE_DURATIONS:
+            duration_menu_item = gtk.MenuItem(label=format_duration(seconds))
+            duration_menu_item.device_name = name
+            duration_menu_item.seconds = seconds
+            duration_menu_item.connect(
+                'activate', callbacks.disable_for_menu_item_activate
+            )
+            durations_menu.append(duration_menu_item)
+        device_menu_item = gtk.MenuItem(label=name)
+        device_menu_item.set_submenu(durations_menu)
+        submenu.append(device_menu_item)
+    submenu.show_all()
+
+    old_submenu = disable_for_menu_item.get_submenu()
+    disable_for_menu_item.set_submenu(submenu)
+    if old_submenu is not None:
+        old_submenu.destroy()
+
+
+def update_settings_menu(menu, devices, properties, callbacks):
+    """
+    Builds the submenu of "Pointer settings", with an item for each slave
+    device having some of the `POINTER_SETTINGS` properties. Each of these
+    items has, in turn, a submenu with a check item per setting:
+
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.mock import MockMenuCallbacks
+    >>> devices = parse('''
+    ... ⎡ A        id=2    [master pointer  (3)]
+    ... ⎜   ↳ A1   id=4    [slave  pointer  (2)]
+    ... ⎜   ↳ A2   id=5    [slave  pointer  (2)]
+    ... ''')
+    >>> callbacks = MockMenuCallbacks()
+    >>> menu = gtk.Menu()
+    >>> build_menu(menu, devices, callbacks)
+    >>> menu.settings_menu_item.get_sensitive()
+    False
+    >>> update_settings_menu(menu, devices, {
+    ...     4: {'libinput Tapping Enabled': ['1'],
+    ...         'libinput Natural Scrolling Enabled': ['0']},
+    ...     5: {'Device Enabled': ['1']},
+    ... }, callbacks)
+    >>> submenu = menu.settings_menu_item.get_submenu()
+    >>> [i.get_label() for i in submenu.get_children()]
+    ['A1']
+    >>> settings = submenu.get_children()[0].get_submenu().get_children()
+    >>> [(i.get_label(), i.get_active()) for i in settings]
+    [('Tap to click', True), ('Natural scrolling', False)]
+
+    Each setting item is connected to the `setting_menu_item_toggled()`
+    callback:
+
+    >>> settings[1].set_active(True)
+    Natural scrolling of A1 toggled to True
+
+    The submenu is only rebuilt if devices or settings are added or removed.
+    Otherwise, the check items are just updated, so that only their
+    properties, and not the whole layout, are exported again over dbusmenu:
+
+    >>> old_settings = settings
+    >>> update_settings_menu(menu, devices, {
+    ...     4: {'libinput Tapping Enabled': ['0'],
+    ...         'libinput Natural Scrolling Enabled': ['1']},
+    ... }, callbacks)
+    >>> submenu = menu.settings_menu_item.get_submenu()
+    >>> settings = submenu.get_children()[0].get_submenu().get_children()
+    >>> settings == old_settings
+    True
+    >>> [(i.get_label(), i.get_active()) for i in settings]
+    [('Tap to click', False), ('Natural scrolling', True)]
+    """
+    settings_menu_item = getattr(menu, 'settings_menu_item', None)
+    if settings_menu_item is None:
+        return
+    settings = []
+    for d in get_slave_devices(devices):
+        device_properties = properties.get(d.id, {})
+        device_settings = [
+            (property, label, device_properties[property] == ['1'])
+            for property, label in POINTER_SETTINGS
+            if property in device_properties
+        ]
+        if device_settings:
+            settings.append((d, device_settings))
+    key = [
+        (d.id, d.name, [property for property, label, active in s])
+        for d, s in settings
+    ]
+    if key == getattr(settings_menu_item, 'settings', None):
+        submenu = settings_menu_item.get_submenu()
+        for device_menu_item, (device, device_settings) in zip(
+                submenu.get_children(), settings):
+            for setting_menu_item, (property, label, active) in zip(
+                    device_menu_item.get_submenu().get_children(),
+                    device_settings):
+                setting_menu_item.device = device
+                if setting_menu_item.get_active() != active:
+                    with setting_menu_item.handler_block(
+                            setting_menu_item.toggled_handler_id):
+                        setting_menu_item.set_active(active)
+        return
+
+    submenu = gtk.Menu()
+    for device, device_settings in settings:
+        device_submenu = gtk.Menu()
+        for property, label, active in device_settings:
+            setting_menu_item = gtk.CheckMenuItem(label=label)
+            setting_menu_item.set_active(active)
+            setting_menu_item.device = device
+            setting_menu_item.property = property
+            setting_menu_item.toggled_handler_id = setting_menu_item.connect(
+                'toggled', callbacks.setting_menu_item_toggled
+            )
+            device_submenu.append(setting_menu_item)
+        device_menu_item = gtk.MenuItem(label=device.name)
+        device_menu_item.set_submenu(device_submenu)
+        submenu.append(device_menu_item)
+    submenu.show_all()
+
+    old_submenu = settings_menu_item.get_submenu()
+    settings_menu_item.set_submenu(submenu)
+    if old_submenu is not None:
+        old_submenu.destroy()
+    settings_menu_item.settings = key
+    settings_menu_item.set_sensitive(bool(settings))
+
+
+def get_menu_row_key(item):
+    group = getattr(item, 'group', None)
+    if group is not None:
+        return group.key
+    device = getattr(item, 'device', None)
+    if device is not None:
+        return device.id
+    return None
+
+
+def update_group_menu_row(menu, items, position, group, callbacks):
+    item = items.pop(group.key, None)
+    if item is None:
+        item = build_group_menu_item(group, callbacks)
+        menu.insert(item, position)
+        item.show_all()
+        return
+
+    update_group_menu_item(item, group, callbacks)
+    if menu.get_children().index(item) != position:
+        menu.reorder_child(item, position)
+
+
+def update_menu_row(menu, items, position, device, build_menu_item):
+    item = items.pop(device.id, None)
+    is_check_item = device.level == 'slave' and device.type != 'floating'
+    if item is not None and \
+            isinstance(item, gtk.CheckMenuItem) != is_check_item:
+        menu.remove(item)
+        item.destroy()
+        item = None
+
+    if item is None:
+        item = build_menu_item(device)
+        menu.insert(item, position)
+        item.show()
+        return
+
+    update_device_menu_item(item, device)
+    if menu.get_children().index(item) != position:
+        menu.reorder_child(item, position)
+
+
+def update_device_menu_item(menu_item, device):
+    """
+    Updates a menu item to reflect the given device, without calling the
+    `toggled` callback:
+
+    >>> from inputdeviceindicator.command import Device
+    >>> def callback(mi):
+    ...    print("menu item toggled")
+    >>> mi = build_device_check_menu_item(
+    ...     Device(1, 'abc', 4, 'slave', 'keyboard'), callback
+    ... )
+    >>> d = Device(1, 'abcd', 4, 'slave', 'keyboard')
+    >>> d.enabled = False
+    >>> update_device_menu_item(mi, d)
+    >>> mi.get_label(), mi.get_active(), mi.device is d
+    ('abcd', False, True)
+    """
+    menu_item.device = device
+    label = get_device_menu_item_label(menu_item)
+    if menu_item.get_label() != label:
+        menu_item.set_label(label)
+    if menu_item.get_sensitive() == device.stale:
+        menu_item.set_sensitive(not device.stale)
+    if isinstance(menu_item, gtk.CheckMenuItem) and \
+            menu_item.get_active() != device.enabled:
+        with menu_item.handler_block(menu_item.toggled_handler_id):
+            menu_item.set_active(device.enabled)
+
+
+def get_device_menu_items(menu):
+    """
+    Returns the items of the devices in the menu, including the ones in the
+    submenus of groups and (once built) of master devices:
+
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.grouping import DeviceGroup
+    >>> from inputdeviceindicator.mock import MockMenuCallbacks
+    >>> devices = parse('''
+    ... ⎣ B                      id=3    [master keyboard (2)]
+    ...     ↳ USB Keyboard       id=5    [slave  keyboard (3)]
+    ...     ↳ B1                 id=6    [slave  keyboard (3)]
+    ...     ↳ USB Keyboard Keys  id=8    [slave  keyboard (3)]
+    ... ''')
+    >>> parts = [devices[0].children[0], devices[0].children[2]]
+    >>> menu = gtk.Menu()
+    >>> build_menu(menu, devices, MockMenuCallbacks())
+    >>> update_menu(
+    ...     menu, devices, MockMenuCallbacks(), [DeviceGroup('usb', parts)]
+    ... )
+    >>> [i.get_label() for i in get_device_menu_items(menu)]
+    ['B', 'USB Keyboard', 'USB Keyboard Keys', 'B1']
+    """
+    items = []
+    for item in menu.get_children():
+        if getattr(item, 'device', None) is not None:
+            items.append(item)
+        if getattr(item, 'populated', False) or (
+                getattr(item, 'group', None) is not None and
+                item.get_submenu() is not None):
+            items.extend(get_device_menu_items(item.get_submenu()))
+    return items
+
+
+def set_device_menu_item_suffix(menu_item, key, suffix):
+    """
+    Adds some information (e.g. how long until the device is enabled again)
+    after the name of the device in its item. Each kind of information has
+    its own key, so it can be updated independently:
+
+    >>> from inputdeviceindicator.command import Device
+    >>> mi = build_device_menu_item(Device(1, 'abc', 4, 'slave', 'keyboard'))
+    >>> set_device_menu_item_suffix(mi, 'timer', 'back in 4:33')
+    >>> set_device_menu_item_suffix(mi, 'activity', '● 3/s')
+    >>> mi.get_label()
+    'abc  ● 3/s  back in 4:33'
+
+    A `None` suffix removes the information:
+
+    >>> set_device_menu_item_suffix(mi, 'timer', None)
+    >>> mi.get_label()
+    'abc  ● 3/s'
+    """
+    suffixes = getattr(menu_item, 'label_suffixes', None)
+    if suffixes is None:
+        suffixes = menu_item.label_suffixes = {}
+    if suffix is None:
+        suffixes.pop(key, None)
+    else:
+        suffixes[key] = suffix
+    label = get_device_menu_item_label(menu_item)
+    if menu_item.get_label() != label:
+        menu_item.set_label(label)
+
+
+def get_device_menu_item_label(menu_item):
+    suffixes = getattr(menu_item, 'label_suffixes', {})
+    return '  '.join(
+        [menu_item.device.name] + [suffixes[k] for k in sorted(suffixes)]
+    )
+
+
+def build_device_menu_item(device):
+    """
+    Returns a `gtk.MenuItem` representing a device which is not toggled from
+    the menu (i.e. a master or floating device), with the device attached:
+
+    >>> from inputdeviceindicator.command import Device
+    >>> d = Device(1, 'abc', 4, 'master', 'keyboard')
+    >>> mi = build_device_menu_item(d)
+    >>> mi.get_label(), mi.device == d
+    ('abc', True)
+    """
+    menu_item = gtk.MenuItem(label=device.name)
+    menu_item.set_sensitive(not device.stale)
+    menu_item.device = device
+    return menu_item
+
+
+def build_group_menu_item(group, callbacks):
+    """
+    Returns a `gtk.MenuItem` representing a group of devices, with a submenu
+    where the whole group, or each of its parts, can be toggled:
+
+    >>> from inputdeviceindicator.command import Device
+    >>> from inputdeviceindicator.grouping import DeviceGroup
+    >>> from inputdeviceindicator.mock import MockMenuCallbacks
+    >>> group = DeviceGroup('usb', [
+    ...     Device(5, 'USB Keyboard', 3, 'slave', 'keyboard'),
+    ...     Device(8, 'USB Keyboard Keys', 3, 'slave', 'keyboard'),
+    ... ])
+    >>> mi = build_group_menu_item(group, MockMenuCallbacks())
+    >>> mi.get_label(), mi.group is group
+    ('USB Keyboard', True)
+    >>> items = mi.get_submenu().get_children()
+    >>> [i.get_label() for i in items]
+    ['All parts', '', 'USB Keyboard', 'USB Keyboard Keys']
+
+    The "All parts" item is connected to `group_menu_item_toggled()`, and
+    the items of the parts to `child_device_check_menu_item_toggled()`:
+
+    >>> items[0].set_active(False)
+    Group USB Keyboard toggled to False
+    >>> items[3].set_active(False)
+    Device USB Keyboard Keys toggled to False
+    """
+    menu_item = gtk.MenuItem(label=group.name)
+    menu_item.group = group
+    menu_item.set_submenu(build_group_menu(group, callbacks))
+    return menu_item
+
+
+def build_group_menu(group, callbacks):
+    submenu = gtk.Menu()
+    all_menu_item = gtk.CheckMenuItem(label='All parts')
+    all_menu_item.set_active(group.enabled)
+    all_menu_item.group = group
+    all_menu_item.toggled_handler_id = all_menu_item.connect(
+        'toggled', callbacks.group_menu_item_toggled
+    )
+    submenu.append(all_menu_item)
+    submenu.all_menu_item = all_menu_item
+    submenu.append(gtk.SeparatorMenuItem())
+    for device in group.devices:
+        submenu.append(
+            build_device_check_menu_item(
+                device, callbacks.child_device_check_menu_item_toggled
+            )
+        )
+    submenu.show_all()
+    return submenu
+
+
+def update_group_menu_item(menu_item, group, callbacks):
+    """
+    Updates the item of a group, and its submenu, to reflect the given group.
+    The submenu is only rebuilt if the parts of the group changed.
+    """
+    old_group = menu_item.group
+    menu_item.group = group
+    if menu_item.get_label() != group.name:
+        menu_item.set_label(group.name)
+    submenu = menu_item.get_submenu()
+    if [d.id for d in old_group.devices] != [d.id for d in group.devices]:
+        menu_item.set_submenu(build_group_menu(group, callbacks))
+        submenu.destroy()
+        return
+
+    for item, device in zip(submenu.get_children()[2:], group.devices):
+        update_device_menu_item(item, device)
+    update_group_all_menu_item(submenu.all_menu_item, group)
+
+
+def update_group_all_menu_item(menu_item, group):
+    menu_item.group = group
+    if menu_item.get_active() != group.enabled:
+        with menu_item.handler_block(menu_item.toggled_handler_id):
+            menu_item.set_active(group.enabled)
 
 
 def build_device_check_menu_item(device, callback):
@@ -199,17 +1086,28 @@ def build_device_check_menu_item(device, callback):
         'slave', "build_device_check_menu_item() only accepts child devices."
     menu_item = gtk.CheckMenuItem(label=device.name)
     menu_item.set_active(device.enabled)
+    menu_item.set_sensitive(not device.stale)
     menu_item.device = device
-    menu_item.connect('toggled', callback)
+    menu_item.toggled_handler_id = menu_item.connect('toggled', callback)
     return menu_item
 
 
 class MenuCallbacks:
 
-    def __init__(self, xinput, menu, about_dialog):
+    def __init__(
+            self, xinput, menu, get_about_dialog=get_about_dialog,
+            snapshot=None, scheduler=None, queue=None, history=None):
         self.xinput = xinput
         self.menu = menu
-        self.about_dialog = about_dialog
+        self.get_about_dialog = get_about_dialog
+        self.snapshot = snapshot
+        self.scheduler = scheduler
+        self.queue = queue
+        self.history = history
+        self.hotplug_pending = False
+        self.batches = {}
+        self.devices = None
+        self.properties = {}
 
     def child_device_check_menu_item_toggled(self, check_menu_item):
         """
@@ -220,7 +1118,7 @@ class MenuCallbacks:
 
         >>> from inputdeviceindicator.mock import MockXInput, MockAboutDialog
         >>> mcs = MenuCallbacks(
-        ...     MockXInput(), gtk.Menu(), MockAboutDialog()
+        ...     MockXInput(), gtk.Menu(), MockAboutDialog
         ... )
 
         When called with a menu item, it should try to toggle its state:
@@ -235,11 +1133,236 @@ class MenuCallbacks:
         >>> mi.set_active(True)
         >>> mcs.child_device_check_menu_item_toggled(mi)
         Device abc enabled
+
+        If `xinput` fails, the item goes back to its previous state and the
+        error is displayed in the menu:
+
+        >>> from inputdeviceindicator.command import XInputTimeout
+        >>> menu = gtk.Menu()
+        >>> build_menu(menu, [], mcs)
+        >>> mcs = MenuCallbacks(
+        ...     MockXInput(errors=[XInputTimeout('xinput timed out')]), menu,
+        ...     MockAboutDialog
+        ... )
+        >>> mi.set_active(False)
+        >>> mcs.child_device_check_menu_item_toggled(mi)
+        >>> mi.get_active()
+        True
+        >>> menu.status_menu_item.get_label()
+        'xinput timed out'
+
+        If there is a `DeviceCommandQueue`, the command is handed over to it
+        instead, so the main loop does not wait for `xinput`. Once the queue
+        is done, the item shows the confirmed state of the device:
+
+        >>> from inputdeviceindicator.commandqueue import DeviceCommandQueue
+        >>> mcs = MenuCallbacks(MockXInput(), menu, MockAboutDialog)
+        >>> mcs.queue = DeviceCommandQueue(
+        ...     mcs.xinput, on_done=mcs.command_done,
+        ...     on_error=mcs.command_failed
+        ... )
+        >>> mi.set_active(False)
+        >>> mcs.child_device_check_menu_item_toggled(mi)
+        >>> mcs.queue.join()
+        Device abc disabled
+        >>> mi.device.enabled
+        False
         """
-        if check_menu_item.get_active():
-            self.xinput.enable(check_menu_item.device)
-        else:
-            self.xinput.disable(check_menu_item.device)
+        device = check_menu_item.device
+        enabled = check_menu_item.get_active()
+        if self.queue is not None:
+            self.queue.request(device, enabled)
+            return
+        try:
+            if enabled:
+                self.xinput.enable(device, 'menu')
+            else:
+                self.xinput.disable(device, 'menu')
+        except XInputError as e:
+            with check_menu_item.handler_block(
+                    check_menu_item.toggled_handler_id):
+                check_menu_item.set_active(not enabled)
+            self.show_error(e)
+            return
+        device.enabled = enabled
+        self.record([(device, enabled)])
+        set_menu_status(self.menu, None)
+
+    def group_menu_item_toggled(self, check_menu_item):
+        """
+        Callback to enable or disable all parts of a group of devices at once,
+        when its "All parts" item is clicked:
+
+        >>> from inputdeviceindicator.command import Device
+        >>> from inputdeviceindicator.grouping import DeviceGroup
+        >>> from inputdeviceindicator.mock import MockXInput
+        >>> group = DeviceGroup('usb', [
+        ...     Device(5, 'USB Keyboard', 3, 'slave', 'keyboard'),
+        ...     Device(8, 'USB Keyboard Keys', 3, 'slave', 'keyboard'),
+        ... ])
+        >>> mcs = MenuCallbacks(MockXInput(), gtk.Menu())
+        >>> mi = build_group_menu_item(group, mcs)
+        >>> all_mi = mi.get_submenu().all_menu_item
+        >>> all_mi.set_active(False)
+        Device USB Keyboard disabled
+        Device USB Keyboard Keys disabled
+
+        If `xinput` fails, the item goes back to the state of the group and
+        the error is displayed in the menu.
+
+        If there is a `DeviceCommandQueue`, the group is handed over to it as
+        a single batch, so the main loop does not wait for `xinput`, all
+        devices are changed and confirmed at once, and quick toggles are
+        coalesced. The items are updated once the queue is done:
+
+        >>> from inputdeviceindicator.commandqueue import DeviceCommandQueue
+        >>> from inputdeviceindicator.undo import UndoHistory
+        >>> mcs.history = UndoHistory(mcs.xinput)
+        >>> mcs.queue = DeviceCommandQueue(
+        ...     mcs.xinput, on_done=mcs.command_done,
+        ...     on_error=mcs.command_failed, max_workers=1
+        ... )
+        >>> all_mi.set_active(True)
+        >>> mcs.queue.join()
+        Device USB Keyboard enabled
+        Device USB Keyboard Keys enabled
+        >>> [d.enabled for d in group.devices]
+        [True, True]
+
+        The changes to the group are recorded together, to be undone at once:
+
+        >>> list(mcs.history.changes)
+        [((5, 'USB Keyboard', True), (8, 'USB Keyboard Keys', True))]
+        """
+        group = check_menu_item.group
+        enabled = check_menu_item.get_active()
+        if self.queue is not None:
+            # The devices of the group are undone together, so their changes
+            # are recorded at once, when all of them are done.
+            batch = CommandBatch(group.devices)
+            for device in group.devices:
+                self.finish_command(device)
+                self.batches[device.id] = batch
+            self.queue.request_many(group.devices, enabled)
+            return
+        try:
+            changed = set_enabled(self.xinput, group.devices, enabled, 'menu')
+        except XInputError as e:
+            update_group_all_menu_item(check_menu_item, group)
+            self.show_error(e)
+            return
+        self.record((d, enabled) for d in changed)
+        set_menu_status(self.menu, None)
+
+    def undo_menu_item_activate(self, menu_item):
+        """
+        Reverts the last change made to the devices, with all devices changed
+        together by it:
+
+        >>> from inputdeviceindicator.command import parse
+        >>> from inputdeviceindicator.grouping import DeviceGroup
+        >>> from inputdeviceindicator.mock import MockXInput
+        >>> from inputdeviceindicator.undo import UndoHistory
+        >>> devices = parse('''
+        ... ⎡ Pointer      id=2    [master pointer  (3)]
+        ... ⎜   ↳ Mouse    id=4    [slave  pointer  (2)]
+        ... ⎜   ↳ Buttons  id=5    [slave  pointer  (2)]
+        ... ''')
+        >>> xinput = MockXInput(devices)
+        >>> menu = gtk.Menu()
+        >>> mcs = MenuCallbacks(xinput, menu, history=UndoHistory(xinput))
+        >>> build_menu(menu, devices, mcs)
+        >>> group = DeviceGroup('usb', devices[0].children)
+        >>> all_mi = build_group_menu_item(group, mcs).get_submenu() \\
+        ...     .all_menu_item
+        >>> all_mi.set_active(False)
+        Device Mouse disabled
+        Device Buttons disabled
+        >>> mcs.undo_menu_item_activate(menu.undo_menu_item)
+        Device Mouse enabled
+        Device Buttons enabled
+
+        Then the change can be redone:
+
+        >>> mcs.redo_menu_item_activate(menu.redo_menu_item)
+        Device Mouse disabled
+        Device Buttons disabled
+        """
+        self.run_history_command(self.history.undo)
+
+    def redo_menu_item_activate(self, menu_item):
+        """
+        Applies again the last change undone.
+        """
+        self.run_history_command(self.history.redo)
+
+    def run_history_command(self, command):
+        try:
+            command()
+        except XInputError as e:
+            self.show_error(e)
+            return
+        set_menu_status(self.menu, None)
+
+    def record(self, changes):
+        if self.history is not None:
+            self.history.record(changes)
+
+    def history_changed(self, history):
+        update_undo_menu_items(self.menu, history)
+
+    def disable_for_menu_item_activate(self, menu_item):
+        """
+        Disables a device for some time, using the scheduler given to the
+        constructor:
+
+        >>> from inputdeviceindicator.mock import MockXInput, MockScheduler
+        >>> callbacks = MenuCallbacks(
+        ...     MockXInput(), gtk.Menu(), scheduler=MockScheduler()
+        ... )
+        >>> mi = gtk.MenuItem(label='5 minutes')
+        >>> mi.device_name, mi.seconds = 'Touchpad', 300
+        >>> callbacks.disable_for_menu_item_activate(mi)
+        Touchpad disabled for 300 seconds
+        """
+        if self.scheduler is None:
+            return
+        try:
+            self.scheduler.disable_for(
+                menu_item.device_name, menu_item.seconds
+            )
+        except XInputError as e:
+            self.show_error(e)
+
+    def setting_menu_item_toggled(self, check_menu_item):
+        """
+        Sets the property of a device when its item in the "Pointer
+        settings" submenu is clicked:
+
+        >>> from inputdeviceindicator.command import Device
+        >>> from inputdeviceindicator.mock import MockXInput
+        >>> callbacks = MenuCallbacks(MockXInput(), gtk.Menu())
+        >>> mi = gtk.CheckMenuItem(label='Tap to click')
+        >>> mi.device = Device(4, 'Touchpad', 2, 'slave', 'pointer')
+        >>> mi.property = 'libinput Tapping Enabled'
+        >>> mi.set_active(True)
+        >>> callbacks.setting_menu_item_toggled(mi)
+        Device Touchpad: libinput Tapping Enabled set to 1
+
+        If `xinput` fails, the item goes back to its previous state and the
+        error is displayed in the menu.
+        """
+        active = check_menu_item.get_active()
+        try:
+            self.xinput.set_properties(
+                check_menu_item.device,
+                {check_menu_item.property: 1 if active else 0}
+            )
+        except XInputError as e:
+            with check_menu_item.handler_block(
+                    check_menu_item.toggled_handler_id):
+                check_menu_item.set_active(not active)
+            self.show_error(e)
 
     def about_menu_item_activate(self, menu_item):
         """
@@ -247,17 +1370,21 @@ class MenuCallbacks:
 
         >>> from inputdeviceindicator.mock import MockXInput, MockAboutDialog
         >>> callbacks = MenuCallbacks(
-        ...     MockXInput(), gtk.Menu(), MockAboutDialog()
+        ...     MockXInput(), gtk.Menu(), MockAboutDialog
         ... )
 
-        It should display the dialog given to the constructor:
+        The dialog is only created when the item is activated, with the
+        function given to the constructor. It is displayed and, once closed,
+        destroyed, so it does not take memory while not in use:
 
-        >>> from inelegant.module import temp_var
         >>> callbacks.about_menu_item_activate(None)
+        about dialog created
         about dialog displayed
+        about dialog destroyed
         """
-        self.about_dialog.run()
-        self.about_dialog.hide()
+        about_dialog = self.get_about_dialog()
+        about_dialog.run()
+        about_dialog.destroy()
 
     def quit_menu_item_activate(self, menu_item):
         """
@@ -265,7 +1392,7 @@ class MenuCallbacks:
 
         >>> from inputdeviceindicator.mock import MockXInput, MockAboutDialog
         >>> callbacks = MenuCallbacks(
-        ...     MockXInput(), gtk.Menu(), MockAboutDialog()
+        ...     MockXInput(), gtk.Menu(), MockAboutDialog
         ... )
 
         It should do it by calling `gtk.main_quit()`:
@@ -331,7 +1458,7 @@ class MenuCallbacks:
         menu item (and the xinput to `MenuCallback` constructor)...
 
         >>> from inputdeviceindicator.mock import MockXInput, MockAboutDialog
-        >>> callbacks = MenuCallbacks(xinput, menu, MockAboutDialog())
+        >>> callbacks = MenuCallbacks(xinput, menu, MockAboutDialog)
         >>> callbacks.refresh_menu_item_activate(menu_item)
 
         ...the device menu items should be updated:
@@ -347,5 +1474,222 @@ class MenuCallbacks:
         'Y1'
         >>> items[3].get_active()
         False
+
+        If `xinput` fails, the error is displayed in the menu:
+
+        >>> from inputdeviceindicator.command import XInputError
+        >>> xinput.errors.append(XInputError('Unable to connect to X server'))
+        >>> callbacks.refresh_menu_item_activate(menu_item)
+        >>> menu.status_menu_item.get_label()
+        'Unable to connect to X server'
+        """
+        try:
+            devices = self.xinput.list()
+        except XInputError as e:
+            self.show_error(e)
+            return
+        self.update_devices(devices)
+
+    def update_devices(self, devices, properties=None):
+        """
+        Updates the menu with the given devices and the properties of their
+        slave devices and, if there is a snapshot, saves them into it:
+
+        >>> import os.path, tempfile
+        >>> from inputdeviceindicator.command import parse
+        >>> from inputdeviceindicator.mock import MockXInput
+        >>> menu = gtk.Menu()
+        >>> snapshot = Snapshot(
+        ...     os.path.join(tempfile.mkdtemp(), 'devices.json')
+        ... )
+        >>> callbacks = MenuCallbacks(MockXInput(), menu, snapshot=snapshot)
+        >>> build_menu(menu, [], callbacks)
+        >>> callbacks.update_devices(parse('''
+        ... ⎡ A        id=2    [master pointer  (3)]
+        ... ⎜   ↳ A1   id=4    [slave  pointer  (2)]
+        ... '''))
+        >>> [i.get_label() for i in menu.get_children()[:2]]
+        ['A', 'A1']
+        >>> snapshot.load()
+        [Device(2, 'A', 3, 'master', 'pointer', True, \
+[Device(4, 'A1', 2, 'slave', 'pointer', True)])]
+
+        Without properties, the menu is updated with the last ones known, so
+        the main loop does not wait for `xinput`. The properties are read in
+        the background, and the menu is updated again once they arrive (see
+        `properties_read()`).
+        """
+        set_menu_status(self.menu, None)
+        self.devices = devices
+        if properties is None:
+            read_properties_in_background(self.xinput, self, devices)
+            properties = self.properties
+        else:
+            self.properties = properties
+        update_menu(
+            self.menu, devices, self, group_devices(devices, properties)
+        )
+        update_settings_menu(self.menu, devices, properties, self)
+        if self.snapshot is not None:
+            self.snapshot.save(devices)
+
+    def uevent_received(self, uevent):
+        """
+        Lists the devices again, in the background, when a `UeventMonitor`
+        reports that a device was plugged or unplugged. A device brings a
+        burst of uevents (one for each of its nodes), so the devices are
+        listed once, `HOTPLUG_DELAY` milliseconds after the first one.
         """
-        build_menu(self.menu, self.xinput.list(), self)
+        if uevent.action == 'change' and uevent.node is not None:
+            return
+        if self.hotplug_pending:
+            return
+        self.hotplug_pending = True
+        glib.timeout_add(HOTPLUG_DELAY, self.hotplug_timeout)
+
+    def hotplug_timeout(self):
+        self.hotplug_pending = False
+        list_devices_in_background(self.xinput, self)
+        return False
+
+    def properties_read(self, devices, properties):
+        """
+        Updates the menu with the properties read in the background, unless
+        the devices were updated again in the meantime:
+
+        >>> from inputdeviceindicator.command import parse
+        >>> from inputdeviceindicator.mock import MockXInput
+        >>> menu = gtk.Menu()
+        >>> callbacks = MenuCallbacks(MockXInput(), menu)
+        >>> build_menu(menu, [], callbacks)
+        >>> devices = parse('''
+        ... ⎡ A        id=2    [master pointer  (3)]
+        ... ⎜   ↳ A1   id=4    [slave  pointer  (2)]
+        ... ''')
+        >>> callbacks.update_devices(devices)
+        >>> properties = {4: {'libinput Tapping Enabled': ['0']}}
+        >>> callbacks.properties_read(parse('''
+        ... ⎡ B        id=2    [master pointer  (3)]
+        ... '''), properties)
+        >>> callbacks.properties
+        {}
+        >>> callbacks.properties_read(devices, properties)
+        >>> callbacks.properties
+        {4: {'libinput Tapping Enabled': ['0']}}
+        """
+        if devices is self.devices:
+            self.update_devices(devices, properties)
+
+    def device_state_changed(self, device, enabled):
+        """
+        Updates the item of a device enabled or disabled by some other part
+        of the indicator, without calling `xinput` again:
+
+        >>> from inputdeviceindicator.command import parse
+        >>> from inputdeviceindicator.mock import MockXInput
+        >>> devices = parse('''
+        ... ⎡ A        id=2    [master pointer  (3)]
+        ... ⎜   ↳ A1   id=4    [slave  pointer  (2)]
+        ... ''')
+        >>> menu = gtk.Menu()
+        >>> callbacks = MenuCallbacks(MockXInput(devices), menu)
+        >>> build_menu(menu, devices, callbacks)
+        >>> callbacks.device_state_changed(devices[0].children[0], False)
+        >>> menu.get_children()[1].get_active()
+        False
+
+        The items of devices in groups are updated as well.
+        """
+        for item in get_device_menu_items(self.menu):
+            if item.device.id != device.id:
+                continue
+            item.device.enabled = enabled
+            update_device_menu_item(item, item.device)
+            all_menu_item = getattr(item.get_parent(), 'all_menu_item', None)
+            if all_menu_item is not None:
+                update_group_all_menu_item(all_menu_item, all_menu_item.group)
+
+    def command_done(self, device, enabled, previous):
+        """
+        Called when the queued commands of a device are done: the item of the
+        device shows its confirmed state.
+
+        The change is recorded in the history only if the device actually
+        changed. So, a device quickly disabled and enabled again, whose
+        requests were coalesced by the queue, leaves no change to undo:
+
+        >>> from inputdeviceindicator.command import Device
+        >>> from inputdeviceindicator.commandqueue import DeviceCommandQueue
+        >>> from inputdeviceindicator.mock import MockSlowXInput
+        >>> from inputdeviceindicator.undo import UndoHistory
+        >>> xinput = MockSlowXInput(delay=0.1)
+        >>> history = UndoHistory(xinput)
+        >>> mcs = MenuCallbacks(xinput, gtk.Menu(), history=history)
+        >>> mcs.queue = DeviceCommandQueue(
+        ...     xinput, on_done=mcs.command_done,
+        ...     on_error=mcs.command_failed
+        ... )
+        >>> device = Device(4, 'Touchpad', 2, 'slave', 'pointer')
+        >>> mcs.queue.request(device, False)
+        >>> mcs.queue.request(device, True)
+        >>> mcs.queue.join()
+        >>> xinput.calls, device.enabled
+        (2, True)
+        >>> list(history.changes)
+        []
+
+        Real changes are recorded, though:
+
+        >>> mcs.queue.request(device, False)
+        >>> mcs.queue.join()
+        >>> list(history.changes)
+        [((4, 'Touchpad', False),)]
+        """
+        self.device_state_changed(device, enabled)
+        self.finish_command(
+            device, (device, enabled) if enabled != previous else None
+        )
+        set_menu_status(self.menu, None)
+
+    def command_failed(self, device, error, enabled):
+        """
+        Called when a queued command fails: shows the error and puts the item
+        of the device back in its last confirmed state.
+        """
+        self.device_state_changed(device, enabled)
+        self.finish_command(device)
+        self.show_error(error)
+
+    def finish_command(self, device, change=None):
+        """
+        Records the change made by the queued commands of a device, if any.
+        If the device was toggled as part of a group, the change is kept until
+        all devices of the group are done.
+        """
+        batch = self.batches.pop(device.id, None)
+        if batch is None:
+            if change is not None:
+                self.record([change])
+            return
+        batch.pending.discard(device.id)
+        if change is not None:
+            batch.changes.append(change)
+        if not batch.pending:
+            self.record(batch.changes)
+
+    def show_error(self, error):
+        """
+        Displays an error (usually an `XInputError`) in the menu.
+        """
+        set_menu_status(self.menu, str(error))
+
+
+class CommandBatch:
+    """
+    The devices of a group toggled through the command queue: the ids of
+    those still pending, and the changes made to the others.
+    """
+
+    def __init__(self, devices):
+        self.pending = {d.id for d in devices}
+        self.changes = []
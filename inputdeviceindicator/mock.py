@@ -15,23 +15,77 @@
 # You should have received a copy of the GNU General Public License along with
 # Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
 
+import fcntl
+import os
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+
+from inputdeviceindicator.command import CircuitBreaker, XInputError
+
+
 def noop(*args, **kwargs):
     pass
 
 
 class MockXInput:
 
-    def __init__(self, devices=None):
+    def __init__(self, devices=None, errors=None, properties=None):
         self.devices = devices if devices is not None else []
+        self.errors = list(errors) if errors is not None else []
+        self.properties = properties if properties is not None else {}
+        self.breaker = CircuitBreaker()
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
 
     def list(self):
+        self.raise_error()
         return self.devices
 
-    def enable(self, device):
+    def get_devices(self):
+        return self.list()
+
+    def invalidate(self):
+        pass
+
+    def get_properties(self, devices):
+        self.raise_error()
+        return {d.id: dict(self.properties.get(d.id, {})) for d in devices}
+
+    def set_properties(self, device, values):
+        self.raise_error()
+        for name, value in values.items():
+            print(
+                'Device {0}: {1} set to {2}'.format(device.name, name, value)
+            )
+            self.properties.setdefault(device.id, {})[name] = [str(value)]
+
+    def enable(self, device, source=None):
+        self.raise_error()
         print('Device {0} enabled'.format(device.name))
+        for listener in list(self.listeners):
+            listener(device, True)
 
-    def disable(self, device):
+    def disable(self, device, source=None):
+        self.raise_error()
         print('Device {0} disabled'.format(device.name))
+        for listener in list(self.listeners):
+            listener(device, False)
+
+    def set_enabled_many(self, devices, enabled, source=None):
+        for device in devices:
+            if enabled:
+                self.enable(device, source)
+            else:
+                self.disable(device, source)
+
+    def raise_error(self):
+        if self.errors:
+            raise self.errors.pop(0)
 
 
 class MockMenuCallbacks:
@@ -43,9 +97,37 @@ class MockMenuCallbacks:
             )
         )
 
+    def group_menu_item_toggled(self, check_menu_item):
+        print(
+            'Group {0} toggled to {1}'.format(
+                check_menu_item.group.name, check_menu_item.get_active()
+            )
+        )
+
     def refresh_menu_item_activate(self, menu_item, menu):
         print('Refresh menu item activated')
 
+    def disable_for_menu_item_activate(self, menu_item):
+        print(
+            'Disable {0} for {1} seconds'.format(
+                menu_item.device_name, menu_item.seconds
+            )
+        )
+
+    def setting_menu_item_toggled(self, check_menu_item):
+        print(
+            '{0} of {1} toggled to {2}'.format(
+                check_menu_item.get_label(), check_menu_item.device.name,
+                check_menu_item.get_active()
+            )
+        )
+
+    def undo_menu_item_activate(self, menu_item):
+        print('Undo menu item activated')
+
+    def redo_menu_item_activate(self, menu_item):
+        print('Redo menu item activated')
+
     def about_menu_item_activate(self, menu_item, menu):
         print('about menu item activated')
 
@@ -55,8 +137,322 @@ class MockMenuCallbacks:
 
 class MockAboutDialog:
 
+    def __init__(self):
+        print('about dialog created')
+
     def run(self):
         print('about dialog displayed')
 
-    def hide(self):
+    def destroy(self):
+        print('about dialog destroyed')
+
+
+class MockEventMonitor:
+
+    def __init__(self):
+        self.listeners = []
+        self.types = {}
+
+    def subscribe(self, listener, types=None):
+        self.listeners.append(listener)
+        self.types[listener] = types
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def dispatch(self, event):
+        for listener in list(self.listeners):
+            types = self.types.get(listener)
+            if types is None or event.type in types:
+                listener(event)
+
+
+class MockTimer:
+
+    def __init__(self):
+        self.timeouts = []
+
+    def timeout_add(self, interval, callback, *args):
+        self.timeouts.append((interval, callback, args))
+        return callback
+
+    def source_remove(self, source_id):
+        self.timeouts = [t for t in self.timeouts if t[1] is not source_id]
+
+    @property
+    def pending(self):
+        return [interval for interval, callback, args in self.timeouts]
+
+    def fire(self):
+        interval, callback, args = self.timeouts.pop(0)
+        if callback(*args):
+            self.timeouts.append((interval, callback, args))
+
+
+class MockKeybinder:
+
+    def __init__(self):
+        self.bindings = {}
+
+    def init(self):
         pass
+
+    def bind(self, keystring, handler, user_data):
+        self.bindings[keystring] = (handler, user_data)
+        return True
+
+    def unbind(self, keystring):
+        del self.bindings[keystring]
+
+    def press(self, keystring):
+        handler, user_data = self.bindings[keystring]
+        handler(keystring, user_data)
+
+
+class MockScheduler:
+
+    def __init__(self):
+        self.remaining = {}
+        self.on_change = None
+
+    def disable_for(self, name, seconds):
+        print('{0} disabled for {1} seconds'.format(name, seconds))
+        self.remaining[name] = seconds
+        if self.on_change is not None:
+            self.on_change()
+
+    def get_remaining(self, name):
+        return self.remaining.get(name)
+
+
+class MockAuditLog:
+
+    def record(self, device, enabled, source, result='ok'):
+        print('Audit: {0} {1} by {2}: {3}'.format(
+            device.name, 'enabled' if enabled else 'disabled', source, result
+        ))
+
+
+class MockEntryPoint:
+
+    def __init__(self, factory):
+        self.factory = factory
+
+    def load(self):
+        return self.factory
+
+
+class MockBackend(MockXInput):
+    """
+    A backend whose probe takes `duration` seconds of `MockBackend.clock()`,
+    or fails if it does not work.
+    """
+
+    now = 0
+
+    def __init__(self, timeouts=None, duration=0, works=True):
+        MockXInput.__init__(self)
+        self.timeouts = timeouts
+        self.duration = duration
+        self.works = works
+
+    @classmethod
+    def clock(cls):
+        return cls.now
+
+    @classmethod
+    def entry_point(cls, **kwargs):
+        return MockEntryPoint(
+            lambda timeouts=None: cls(timeouts=timeouts, **kwargs)
+        )
+
+    def probe(self):
+        if not self.works:
+            raise XInputError('backend does not work')
+        MockBackend.now += self.duration
+
+    def __repr__(self):
+        return 'MockBackend(duration={0})'.format(self.duration)
+
+
+class MockSlowXInput:
+
+    def __init__(self, delay=0, errors=None):
+        self.delay = delay
+        self.errors = list(errors) if errors is not None else []
+        self.states = {}
+        self.calls = 0
+        self.batches = 0
+        self.running = 0
+        self.running_per_device = {}
+        self.max_running = 0
+        self.max_running_per_device = 0
+        self.lock = threading.Lock()
+
+    def enable(self, device, source=None):
+        self.set_state(device, True)
+
+    def disable(self, device, source=None):
+        self.set_state(device, False)
+
+    def set_enabled_many(self, devices, enabled, source=None):
+        with self.lock:
+            self.batches += 1
+        for device in devices:
+            self.set_state(device, enabled)
+
+    def set_state(self, device, enabled):
+        with self.lock:
+            self.calls += 1
+            self.running += 1
+            running = self.running_per_device.get(device.id, 0) + 1
+            self.running_per_device[device.id] = running
+            self.max_running = max(self.max_running, self.running)
+            self.max_running_per_device = max(
+                self.max_running_per_device, running
+            )
+            error = self.errors.pop(0) if self.errors else None
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+            self.running_per_device[device.id] -= 1
+            if error is None:
+                self.states[device.id] = enabled
+        if error is not None:
+            raise error
+
+
+def make_sysfs():
+    """
+    Creates a fake sysfs tree with a USB keyboard with two interfaces
+    (event4 and event5), an AT keyboard (event2) and a virtual mouse
+    (event7), and returns its root.
+    """
+    root = tempfile.mkdtemp()
+    usb = os.path.join(root, 'devices', 'pci0000:00', 'usb1', '1-2')
+    inputs = {
+        'event4': (
+            os.path.join(
+                usb, '1-2:1.0', '0003:046D:C31C.0001', 'input', 'input4'
+            ),
+            'USB Keyboard', '120013', 'usb-0000:00:14.0-2/input0',
+            ('046d', 'c31c')
+        ),
+        'event5': (
+            os.path.join(
+                usb, '1-2:1.1', '0003:046D:C31C.0002', 'input', 'input5'
+            ),
+            'USB Keyboard Consumer Control', '13', 'usb-0000:00:14.0-2/input1',
+            ('046d', 'c31c')
+        ),
+        'event2': (
+            os.path.join(
+                root, 'devices', 'platform', 'i8042', 'serio0', 'input',
+                'input2'
+            ),
+            'AT Translated Set 2 keyboard', '120013', 'isa0060/serio0/input0',
+            ('0001', '0001')
+        ),
+        'event7': (
+            os.path.join(root, 'devices', 'virtual', 'input', 'input7'),
+            'Virtual Mouse', '7', '', ('0000', '0000')
+        ),
+    }
+    for event, (path, name, ev, phys, (vendor, product)) in inputs.items():
+        os.makedirs(os.path.join(path, 'capabilities'))
+        os.makedirs(os.path.join(path, 'id'))
+        for file_name, value in [
+                ('name', name), ('phys', phys), ('capabilities/ev', ev),
+                ('id/vendor', vendor), ('id/product', product)]:
+            with open(os.path.join(path, file_name), 'w') as f:
+                f.write(value + '\n')
+        event_path = os.path.join(root, 'class', 'input', event)
+        os.makedirs(event_path)
+        os.symlink(path, os.path.join(event_path, 'device'))
+    with open(os.path.join(usb, 'idVendor'), 'w') as f:
+        f.write('046d\n')
+    return root
+
+
+UINPUT_PATH = '/dev/uinput'
+UI_SET_EVBIT = 0x40045564
+UI_SET_KEYBIT = 0x40045565
+UI_SET_RELBIT = 0x40045566
+UI_DEV_CREATE = 0x5501
+UI_DEV_DESTROY = 0x5502
+EV_KEY = 0x01
+EV_REL = 0x02
+KEY_A = 30
+BTN_LEFT = 0x110
+REL_X = 0x00
+REL_Y = 0x01
+
+
+class MockUInputDevice:
+    """
+    Creates a virtual input device through uinput (which requires write
+    access to /dev/uinput), either a keyboard or a mouse, and waits for it
+    to show up in sysfs.
+    """
+
+    def __init__(self, name, type='keyboard', sysfs_root='/sys', timeout=5):
+        self.name = name
+        self.fd = os.open(UINPUT_PATH, os.O_WRONLY | os.O_NONBLOCK)
+        fcntl.ioctl(self.fd, UI_SET_EVBIT, EV_KEY)
+        if type == 'keyboard':
+            fcntl.ioctl(self.fd, UI_SET_KEYBIT, KEY_A)
+        else:
+            fcntl.ioctl(self.fd, UI_SET_KEYBIT, BTN_LEFT)
+            fcntl.ioctl(self.fd, UI_SET_EVBIT, EV_REL)
+            fcntl.ioctl(self.fd, UI_SET_RELBIT, REL_X)
+            fcntl.ioctl(self.fd, UI_SET_RELBIT, REL_Y)
+        # struct uinput_user_dev: name, input_id, ff_effects_max and the
+        # absmax, absmin, absfuzz and absflat arrays.
+        os.write(
+            self.fd,
+            struct.pack('80sHHHHi', name.encode('utf-8'), 0x06, 1, 1, 1) +
+            bytes(4 * 64 * 4)
+        )
+        fcntl.ioctl(self.fd, UI_DEV_CREATE)
+        self.node = self.wait_for_node(sysfs_root, timeout)
+
+    def wait_for_node(self, sysfs_root, timeout):
+        input_class = os.path.join(sysfs_root, 'class', 'input')
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for event in os.listdir(input_class):
+                if not event.startswith('event'):
+                    continue
+                name_path = os.path.join(input_class, event, 'device', 'name')
+                try:
+                    with open(name_path) as f:
+                        name = f.read().strip()
+                except OSError:
+                    continue
+                node = os.path.join('/dev/input', event)
+                if name == self.name and os.path.exists(node):
+                    return node
+            time.sleep(0.05)
+        self.destroy()
+        raise TimeoutError('uinput device {0} not found'.format(self.name))
+
+    def destroy(self):
+        fcntl.ioctl(self.fd, UI_DEV_DESTROY)
+        os.close(self.fd)
+
+
+def start_xvfb():
+    """
+    Starts an Xvfb server on a free display, and returns its process and its
+    display name.
+    """
+    read_fd, write_fd = os.pipe()
+    process = subprocess.Popen(
+        ['Xvfb', '-displayfd', str(write_fd), '-nolisten', 'tcp'],
+        pass_fds=[write_fd], stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        number = f.readline().strip()
+    return process, ':' + number
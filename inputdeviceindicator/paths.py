@@ -0,0 +1,99 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import os.path
+
+
+APPLICATION_DIR_NAME = 'input-device-indicator'
+
+
+def get_cache_dir():
+    """
+    Returns the directory where the indicator caches data, following the XDG
+    Base Directory specification:
+
+    >>> os.environ['XDG_CACHE_HOME'] = '/tmp/cache'
+    >>> get_cache_dir()
+    '/tmp/cache/input-device-indicator'
+
+    If `$XDG_CACHE_HOME` is not set, it defaults to `~/.cache`:
+
+    >>> del os.environ['XDG_CACHE_HOME']
+    >>> get_cache_dir() == os.path.expanduser(
+    ...     '~/.cache/input-device-indicator'
+    ... )
+    True
+    """
+    return _get_xdg_dir('XDG_CACHE_HOME', '~/.cache')
+
+
+def get_config_dir():
+    """
+    Returns the directory of the indicator configuration, following the XDG
+    Base Directory specification:
+
+    >>> os.environ['XDG_CONFIG_HOME'] = '/tmp/config'
+    >>> get_config_dir()
+    '/tmp/config/input-device-indicator'
+    >>> del os.environ['XDG_CONFIG_HOME']
+    >>> get_config_dir() == os.path.expanduser(
+    ...     '~/.config/input-device-indicator'
+    ... )
+    True
+    """
+    return _get_xdg_dir('XDG_CONFIG_HOME', '~/.config')
+
+
+def get_state_dir():
+    """
+    Returns the directory where the indicator keeps state which should
+    survive restarts, following the XDG Base Directory specification:
+
+    >>> os.environ['XDG_STATE_HOME'] = '/tmp/state'
+    >>> get_state_dir()
+    '/tmp/state/input-device-indicator'
+    >>> del os.environ['XDG_STATE_HOME']
+    >>> get_state_dir() == os.path.expanduser(
+    ...     '~/.local/state/input-device-indicator'
+    ... )
+    True
+    """
+    return _get_xdg_dir('XDG_STATE_HOME', '~/.local/state')
+
+
+def get_runtime_dir():
+    """
+    Returns the directory for runtime files, such as sockets, which only make
+    sense during the session. It is `$XDG_RUNTIME_DIR`, falling back to the
+    cache directory:
+
+    >>> os.environ['XDG_RUNTIME_DIR'] = '/run/user/1000'
+    >>> get_runtime_dir()
+    '/run/user/1000/input-device-indicator'
+    >>> del os.environ['XDG_RUNTIME_DIR']
+    >>> get_runtime_dir() == get_cache_dir()
+    True
+    """
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return _get_xdg_dir('XDG_RUNTIME_DIR', None)
+    return get_cache_dir()
+
+
+def _get_xdg_dir(variable, default):
+    base_dir = os.environ.get(variable) or os.path.expanduser(default)
+    return os.path.join(base_dir, APPLICATION_DIR_NAME)
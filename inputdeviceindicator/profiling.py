@@ -0,0 +1,214 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import importlib
+import os
+import sys
+import time
+
+from contextlib import contextmanager
+
+
+TIME_TO_ICON_BUDGET = 2.0
+"""
+How many seconds the indicator may take, on the reference machine, from the
+start of `main()` until the icon is visible. Slower machines (or busy CI
+runners) can scale it with the environment variable below.
+"""
+
+BUDGET_SCALE_VARIABLE = 'INPUT_DEVICE_INDICATOR_BUDGET_SCALE'
+
+GI_VERSIONS = [('Gtk', '3.0'), ('AppIndicator3', '0.1')]
+
+STARTUP_IMPORTS = [
+    'gi.repository.GLib',
+    'gi.repository.Gtk',
+    'gi.repository.GdkPixbuf',
+    'gi.repository.AppIndicator3',
+    'inputdeviceindicator.command',
+    'inputdeviceindicator.icons',
+    'inputdeviceindicator.about',
+    'inputdeviceindicator.snapshot',
+    'inputdeviceindicator.menu',
+    'inputdeviceindicator.indicator',
+]
+
+
+class StartupProfile:
+    """
+    `StartupProfile` records how long each step of the startup takes, so we
+    can know where the time until the icon appears is spent.
+
+    It uses a clock function, `time.perf_counter()` by default:
+
+    >>> ticks = iter([0.0, 0.1, 0.3, 0.3, 0.7, 0.8])
+    >>> profile = StartupProfile(clock=lambda: next(ticks))
+
+    Imports are timed with `import_module()`...
+
+    >>> profile.import_module('os') # doctest: +ELLIPSIS
+    <module 'os' ...>
+
+    ...and any other step with the `phase()` context manager:
+
+    >>> with profile.phase('build menu'):
+    ...     pass
+
+    Once the icon is visible, `icon_shown()` should be called. It then
+    writes a report to the output (standard error by default):
+
+    >>> profile.output = sys.stdout
+    >>> profile.icon_shown()
+    Imports:
+          200.0 ms  os
+    Timeline:
+          100.0 ms  +200.0 ms  import os
+          300.0 ms  +400.0 ms  build menu
+    Time to icon: 800.0 ms
+
+    The time to icon is also available as a number, in seconds:
+
+    >>> profile.time_to_icon()
+    0.8
+    """
+
+    def __init__(self, clock=time.perf_counter, output=None):
+        self.clock = clock
+        self.output = output if output is not None else sys.stderr
+        self.start = clock()
+        self.imports = []
+        self.phases = []
+        self.icon_time = None
+
+    def import_module(self, name):
+        with self.phase('import ' + name) as record:
+            module = importlib.import_module(name)
+        self.imports.append((name, record[2] - record[1]))
+        return module
+
+    @contextmanager
+    def phase(self, name):
+        record = [name, self.clock() - self.start, None]
+        try:
+            yield record
+        finally:
+            record[2] = self.clock() - self.start
+            self.phases.append(tuple(record))
+
+    def icon_shown(self):
+        self.icon_time = self.clock() - self.start
+        self.output.write(self.report())
+        self.output.flush()
+
+    def time_to_icon(self):
+        return self.icon_time
+
+    def report(self):
+        lines = ['Imports:']
+        for name, duration in self.imports:
+            lines.append('    {0:>7.1f} ms  {1}'.format(duration * 1000, name))
+        lines.append('Timeline:')
+        for name, start, end in self.phases:
+            lines.append(
+                '    {0:>7.1f} ms  +{1:.1f} ms  {2}'.format(
+                    start * 1000, (end - start) * 1000, name
+                )
+            )
+        if self.icon_time is not None:
+            lines.append(
+                'Time to icon: {0:.1f} ms'.format(self.icon_time * 1000)
+            )
+        return '\n'.join(lines) + '\n'
+
+
+class NullProfile:
+    """
+    A profile that records nothing, used when the startup is not profiled:
+
+    >>> profile = NullProfile()
+    >>> profile.import_module('os') # doctest: +ELLIPSIS
+    <module 'os' ...>
+    >>> with profile.phase('build menu'):
+    ...     pass
+    >>> profile.icon_shown()
+    """
+
+    def import_module(self, name):
+        return importlib.import_module(name)
+
+    @contextmanager
+    def phase(self, name):
+        yield [name, None, None]
+
+    def icon_shown(self):
+        pass
+
+
+NULL_PROFILE = NullProfile()
+
+
+def import_startup_modules(profile):
+    """
+    Import the heavy modules needed at startup through the given profile, so
+    their import time is recorded.
+    """
+    gi = profile.import_module('gi')
+    for namespace, version in GI_VERSIONS:
+        gi.require_version(namespace, version)
+    for name in STARTUP_IMPORTS:
+        profile.import_module(name)
+
+
+def get_time_to_icon_budget():
+    """
+    Returns the time to icon budget, scaled by the `BUDGET_SCALE_VARIABLE`
+    environment variable if it is set:
+
+    >>> os.environ.pop(BUDGET_SCALE_VARIABLE, None) and None
+    >>> get_time_to_icon_budget() == TIME_TO_ICON_BUDGET
+    True
+    >>> os.environ[BUDGET_SCALE_VARIABLE] = '3'
+    >>> get_time_to_icon_budget() == 3 * TIME_TO_ICON_BUDGET
+    True
+    >>> del os.environ[BUDGET_SCALE_VARIABLE]
+    """
+    scale = float(os.environ.get(BUDGET_SCALE_VARIABLE, '1'))
+    return TIME_TO_ICON_BUDGET * scale
+
+
+def check_time_to_icon_budget():
+    """
+    Starts the indicator as `main()` would, iterates the GTK main loop until
+    the icon is shown and checks the time it took is within budget:
+
+    >>> check_time_to_icon_budget() # doctest: +ELLIPSIS
+    Imports:
+    ...
+    Time to icon: ... ms
+    True
+    """
+    from inputdeviceindicator.main import start
+
+    profile = StartupProfile(output=sys.stdout)
+    indicator = start(profile)
+
+    from gi.repository import Gtk as gtk
+    from gi.repository import AppIndicator3 as appindicator
+    while profile.time_to_icon() is None:
+        gtk.main_iteration()
+    indicator.set_status(appindicator.IndicatorStatus.PASSIVE)
+    return profile.time_to_icon() < get_time_to_icon_budget()
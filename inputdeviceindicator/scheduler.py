@@ -0,0 +1,352 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import heapq
+import json
+import os
+import os.path
+import re
+import time
+
+from gi.repository import GLib as glib
+
+from inputdeviceindicator.actions import find_devices, set_enabled
+from inputdeviceindicator.command import XInputError
+from inputdeviceindicator.paths import get_state_dir
+
+
+DISABLE_DURATIONS = [300, 900, 3600]
+
+DURATION_REGEX = re.compile(r'^(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s?)?$')
+
+RETRY_DELAY = 5
+
+MAX_RETRY_DELAY = 300
+
+
+class TimerStore:
+    """
+    `TimerStore` saves the pending re-enables, so they survive restarts of
+    the indicator. Since the indicator may be down for a while, deadlines are
+    saved as wall clock times.
+
+    >>> import tempfile
+    >>> store = TimerStore(os.path.join(tempfile.mkdtemp(), 'timers.json'))
+    >>> store.load()
+    {}
+    >>> store.save({'Touchpad': 1600000000.0})
+    >>> store.load()
+    {'Touchpad': 1600000000.0}
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(get_state_dir(), 'timers.json')
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return {
+                    str(name): float(deadline)
+                    for name, deadline in json.load(f).items()
+                }
+        except (OSError, ValueError, TypeError, AttributeError):
+            return {}
+
+    def save(self, timers):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(timers, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+
+class ReenableScheduler:
+    """
+    `ReenableScheduler` disables devices for some time. All pending
+    re-enables are kept in a heap ordered by deadline, and a single GLib
+    timeout is set for the earliest one.
+
+    >>> import tempfile
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.mock import MockXInput, MockTimer
+    >>> xinput = MockXInput(parse('''
+    ... ⎡ Pointer            id=2    [master pointer  (3)]
+    ... ⎜   ↳ Touchpad       id=12   [slave  pointer  (2)]
+    ... ⎜   ↳ Mouse          id=13   [slave  pointer  (2)]
+    ... '''))
+    >>> now = [1000.0]
+    >>> timer = MockTimer()
+    >>> store = TimerStore(os.path.join(tempfile.mkdtemp(), 'timers.json'))
+    >>> scheduler = ReenableScheduler(
+    ...     xinput, store, clock=lambda: now[0],
+    ...     timeout_add=timer.timeout_add, source_remove=timer.source_remove
+    ... )
+    >>> scheduler.start()
+
+    Disabling devices for a while sets a timeout only for the earliest
+    deadline:
+
+    >>> scheduler.disable_for('Touchpad', 300)
+    Device Touchpad disabled
+    >>> scheduler.disable_for('Mouse', 60)
+    Device Mouse disabled
+    >>> timer.pending
+    [60000]
+
+    The remaining time of each device is known (e.g. for a countdown):
+
+    >>> scheduler.get_remaining('Touchpad'), scheduler.get_remaining('Mouse')
+    (300.0, 60.0)
+
+    When the timeout fires, the due devices are enabled, and the timeout is
+    set for the next deadline:
+
+    >>> now[0] = 1060.0
+    >>> timer.fire()
+    Device Mouse enabled
+    >>> timer.pending
+    [240000]
+
+    The pending timers are saved, so another scheduler (e.g. after a restart)
+    picks them up:
+
+    >>> store.load()
+    {'Touchpad': 1300.0}
+    >>> timer = MockTimer()
+    >>> scheduler = ReenableScheduler(
+    ...     xinput, store, clock=lambda: now[0],
+    ...     timeout_add=timer.timeout_add, source_remove=timer.source_remove
+    ... )
+    >>> scheduler.start()
+    >>> timer.pending
+    [240000]
+
+    If the device cannot be enabled (e.g. at login, before X is ready), the
+    error is reported and the re-enable is retried later, backing off while
+    it keeps failing:
+
+    >>> now[0] = 1300.0
+    >>> xinput.errors = [
+    ...     XInputError('Unable to connect to X server'),
+    ...     XInputError('Unable to connect to X server')
+    ... ]
+    >>> scheduler.on_error = print
+    >>> timer.fire()
+    Unable to connect to X server
+    >>> timer.pending
+    [5000]
+    >>> now[0] = 1305.0
+    >>> timer.fire()
+    Unable to connect to X server
+    >>> timer.pending
+    [10000]
+    >>> store.load()
+    {'Touchpad': 1315.0}
+    >>> now[0] = 1315.0
+    >>> timer.fire()
+    Device Touchpad enabled
+    >>> timer.pending
+    []
+    >>> store.load()
+    {}
+
+    If the device is enabled in some other way, its timer is cancelled:
+
+    >>> scheduler.disable_for('Touchpad', 300)
+    Device Touchpad disabled
+
+    >>> xinput.enable(xinput.devices[0].children[0])
+    Device Touchpad enabled
+    >>> scheduler.get_remaining('Touchpad') is None
+    True
+    >>> timer.pending
+    []
+    >>> store.load()
+    {}
+    """
+
+    def __init__(
+            self, xinput, store=None, clock=time.time,
+            timeout_add=glib.timeout_add, source_remove=glib.source_remove,
+            on_change=None, on_error=None):
+        self.xinput = xinput
+        self.store = store if store is not None else TimerStore()
+        self.clock = clock
+        self.timeout_add = timeout_add
+        self.source_remove = source_remove
+        self.on_change = on_change
+        self.on_error = on_error
+        self.deadlines = {}
+        self.failures = {}
+        self.heap = []
+        self.timeout_id = None
+        self.timeout_deadline = None
+
+    def start(self):
+        self.xinput.add_listener(self.device_state_changed)
+        for name, deadline in self.store.load().items():
+            self.deadlines[name] = deadline
+            heapq.heappush(self.heap, (deadline, name))
+        self.reschedule()
+
+    def disable_for(self, name, seconds):
+        devices = find_devices(self.xinput.get_devices(), name)
+        if not devices:
+            raise XInputError('no device named {0!r}'.format(name))
+        set_enabled(self.xinput, devices, False, 'timer')
+        deadline = self.clock() + seconds
+        self.deadlines[name] = deadline
+        heapq.heappush(self.heap, (deadline, name))
+        self.changed()
+
+    def cancel(self, name):
+        self.failures.pop(name, None)
+        if self.deadlines.pop(name, None) is not None:
+            self.changed()
+
+    def get_remaining(self, name):
+        deadline = self.deadlines.get(name)
+        if deadline is None:
+            return None
+        return max(deadline - self.clock(), 0)
+
+    def device_state_changed(self, device, enabled):
+        if enabled:
+            self.cancel(device.name)
+
+    def fire(self):
+        self.timeout_id = None
+        self.timeout_deadline = None
+        due = []
+        now = self.clock()
+        while self.heap and self.heap[0][0] <= now:
+            deadline, name = heapq.heappop(self.heap)
+            if self.deadlines.get(name) == deadline:
+                due.append(name)
+        if due:
+            self.reenable(due)
+        self.reschedule()
+        return False
+
+    def reenable(self, names):
+        # A timer is only dropped once its device is enabled: otherwise, it
+        # would stay disabled with nothing to bring it back.
+        try:
+            devices = self.xinput.get_devices()
+        except XInputError as e:
+            self.report(e)
+            for name in names:
+                self.retry(name)
+            self.changed()
+            return
+        for name in names:
+            try:
+                set_enabled(
+                    self.xinput, find_devices(devices, name), True, 'timer'
+                )
+            except XInputError as e:
+                self.report(e)
+                self.retry(name)
+                continue
+            self.deadlines.pop(name, None)
+            self.failures.pop(name, None)
+        self.changed()
+
+    def retry(self, name):
+        failures = self.failures.get(name, 0)
+        self.failures[name] = failures + 1
+        delay = min(RETRY_DELAY * 2 ** failures, MAX_RETRY_DELAY)
+        deadline = self.clock() + delay
+        self.deadlines[name] = deadline
+        heapq.heappush(self.heap, (deadline, name))
+
+    def changed(self):
+        self.store.save(self.deadlines)
+        self.reschedule()
+        if self.on_change is not None:
+            self.on_change()
+
+    def reschedule(self):
+        # Drop entries of cancelled or replaced timers from the heap top.
+        while self.heap and \
+                self.deadlines.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        deadline = self.heap[0][0] if self.heap else None
+        if deadline == self.timeout_deadline:
+            return
+        if self.timeout_id is not None:
+            self.source_remove(self.timeout_id)
+            self.timeout_id = None
+        self.timeout_deadline = deadline
+        if deadline is not None:
+            delay = max(deadline - self.clock(), 0)
+            self.timeout_id = self.timeout_add(round(delay * 1000), self.fire)
+
+    def report(self, error):
+        if self.on_error is not None:
+            self.on_error(error)
+
+
+def parse_duration(value):
+    """
+    Parses a duration as given in the command line, returning seconds:
+
+    >>> parse_duration('300'), parse_duration('5m'), parse_duration('1h30m')
+    (300, 300, 5400)
+    >>> parse_duration('soon')
+    Traceback (most recent call last):
+      ...
+    ValueError: invalid duration 'soon'
+    """
+    m = DURATION_REGEX.match(value)
+    if m is None or not value:
+        raise ValueError('invalid duration {0!r}'.format(value))
+    hours, minutes, seconds = (int(g or 0) for g in m.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def format_duration(seconds):
+    """
+    Formats a duration for the menu:
+
+    >>> format_duration(300), format_duration(3600), format_duration(90)
+    ('5 minutes', '1 hour', '90 seconds')
+    """
+    if seconds % 3600 == 0:
+        hours = seconds // 3600
+        return '{0} hour{1}'.format(hours, 's' if hours != 1 else '')
+    if seconds % 60 == 0:
+        minutes = seconds // 60
+        return '{0} minute{1}'.format(minutes, 's' if minutes != 1 else '')
+    return '{0} seconds'.format(seconds)
+
+
+def format_countdown(seconds):
+    """
+    Formats the remaining time of a timer:
+
+    >>> format_countdown(272.3), format_countdown(3725)
+    ('4:33', '1:02:05')
+    """
+    seconds = int(seconds + 0.999)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return '{0}:{1:02}:{2:02}'.format(hours, minutes, seconds)
+    return '{0}:{1:02}'.format(minutes, seconds)
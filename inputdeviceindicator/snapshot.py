@@ -0,0 +1,115 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import json
+import os
+import os.path
+
+from inputdeviceindicator.command import Device
+from inputdeviceindicator.paths import get_cache_dir
+
+
+class Snapshot:
+    """
+    A `Snapshot` stores the last known device tree in a file, so the menu can
+    be built from it right after login, before `xinput` answers.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'devices.json')
+    >>> snapshot = Snapshot(path)
+
+    If nothing was saved yet, there is nothing to load:
+
+    >>> print(snapshot.load())
+    None
+
+    Once devices are saved...
+
+    >>> from inputdeviceindicator.command import parse
+    >>> snapshot.save(parse('''
+    ... ⎡ A        id=2    [master pointer  (3)]
+    ... ⎜   ↳ A1   id=4    [slave  pointer  (2)]
+    ...         This device is disabled
+    ... ~ C        id=6    [floating slave]
+    ... '''))
+
+    ...they can be loaded back:
+
+    >>> devices = snapshot.load()
+    >>> devices
+    [Device(2, 'A', 3, 'master', 'pointer', True, \
+[Device(4, 'A1', 2, 'slave', 'pointer', False)]), \
+Device(6, 'C', None, 'slave', 'floating', True)]
+
+    The loaded devices are marked as stale, since they may not reflect the
+    current state anymore:
+
+    >>> devices[0].stale, devices[0].children[0].stale
+    (True, True)
+
+    The file is compact:
+
+    >>> print(open(path).read())
+    [[2,"A",3,"master","pointer",true,[[4,"A1",2,"slave","pointer",false,[]]]],\
+[6,"C",null,"slave","floating",true,[]]]
+
+    A corrupted file is just ignored:
+
+    >>> with open(path, 'w') as f:
+    ...     _ = f.write('[[2, "A"')
+    >>> print(snapshot.load())
+    None
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(get_cache_dir(), 'devices.json')
+        self.path = path
+
+    def save(self, devices):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(
+                [to_row(d) for d in devices], f, ensure_ascii=False,
+                separators=(',', ':')
+            )
+        os.replace(temp_path, self.path)
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return [from_row(r) for r in json.load(f)]
+        except (OSError, ValueError, TypeError):
+            return None
+
+
+def to_row(device):
+    return [
+        device.id, device.name, device.parent_id, device.level, device.type,
+        device.enabled, [to_row(c) for c in device.children]
+    ]
+
+
+def from_row(row):
+    id, name, parent_id, level, type, enabled, children = row
+    device = Device(id, name, parent_id, level, type)
+    device.enabled = enabled
+    device.stale = True
+    for c in children:
+        device.add_child(from_row(c))
+    return device
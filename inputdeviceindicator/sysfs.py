@@ -0,0 +1,351 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import re
+import socket
+import struct
+
+from gi.repository import GLib as glib
+
+from inputdeviceindicator.actions import get_slave_devices
+from inputdeviceindicator.grouping import SYSFS_ROOT, get_device_node
+
+
+DEV_INPUT_ROOT = '/dev/input'
+EVENT_NODE_REGEX = re.compile(r'^event(?P<number>\d+)$')
+CAPABILITIES = ['ev', 'key', 'rel', 'abs']
+LONG_BITS = struct.calcsize('l') * 8
+EV_KEY = 0x01
+EV_REL = 0x02
+EV_ABS = 0x03
+
+NETLINK_KOBJECT_UEVENT = 15
+KERNEL_GROUP = 1
+UDEV_GROUP = 2
+UDEV_HEADER = struct.Struct('=8sIIII')
+
+
+class SysfsDevice:
+    """
+    An input device as described by sysfs, with its node, name, physical
+    path, vendor and product ids, and its capabilities bitmaps:
+
+    >>> d = SysfsDevice(
+    ...     '/dev/input/event7', 'Virtual Mouse', '', '0000', '0000',
+    ...     {'ev': 0x7}
+    ... )
+    >>> d
+    SysfsDevice('/dev/input/event7', 'Virtual Mouse', '', '0000', '0000')
+
+    The type of the device is the one X would give it, or `None` if X would
+    not list it:
+
+    >>> d.type
+    'pointer'
+    """
+
+    def __init__(self, node, name, phys, vendor, product, capabilities):
+        self.node = node
+        self.name = name
+        self.phys = phys
+        self.vendor = vendor
+        self.product = product
+        self.capabilities = capabilities
+
+    @property
+    def number(self):
+        return int(EVENT_NODE_REGEX.match(os.path.basename(self.node)).group(
+            'number'
+        ))
+
+    @property
+    def type(self):
+        ev = self.capabilities.get('ev', 0)
+        if ev & (1 << EV_REL | 1 << EV_ABS):
+            return 'pointer'
+        if ev & (1 << EV_KEY):
+            return 'keyboard'
+        return None
+
+    def __repr__(self):
+        return 'SysfsDevice({0})'.format(', '.join(
+            repr(p) for p in [
+                self.node, self.name, self.phys, self.vendor, self.product
+            ]
+        ))
+
+
+def enumerate_devices(sysfs_root=SYSFS_ROOT, dev_root=DEV_INPUT_ROOT):
+    """
+    Lists the input devices from /sys/class/input, ordered by their event
+    numbers, without invoking any program:
+
+    >>> from inputdeviceindicator.mock import make_sysfs
+    >>> for d in enumerate_devices(make_sysfs()):
+    ...     print(d)
+    SysfsDevice('/dev/input/event2', 'AT Translated Set 2 keyboard', \
+'isa0060/serio0/input0', '0001', '0001')
+    SysfsDevice('/dev/input/event4', 'USB Keyboard', \
+'usb-0000:00:14.0-2/input0', '046d', 'c31c')
+    SysfsDevice('/dev/input/event5', 'USB Keyboard Consumer Control', \
+'usb-0000:00:14.0-2/input1', '046d', 'c31c')
+    SysfsDevice('/dev/input/event7', 'Virtual Mouse', '', '0000', '0000')
+
+    Devices removed while they are read are skipped.
+    """
+    input_class = os.path.join(sysfs_root, 'class', 'input')
+    try:
+        names = os.listdir(input_class)
+    except FileNotFoundError:
+        return []
+    events = sorted(
+        (int(m.group('number')), name)
+        for name, m in ((n, EVENT_NODE_REGEX.match(n)) for n in names)
+        if m is not None
+    )
+    devices = []
+    for number, name in events:
+        device = read_device(
+            os.path.join(input_class, name, 'device'),
+            os.path.join(dev_root, name)
+        )
+        if device is not None:
+            devices.append(device)
+    return devices
+
+
+def read_device(path, node):
+    try:
+        name = read_attribute(path, 'name')
+        capabilities = {
+            c: parse_bitmap(read_attribute(path, 'capabilities', c))
+            for c in CAPABILITIES
+            if os.path.exists(os.path.join(path, 'capabilities', c))
+        }
+    except (OSError, ValueError):
+        return None
+    return SysfsDevice(
+        node, name, read_attribute(path, 'phys', default=''),
+        read_attribute(path, 'id', 'vendor', default=''),
+        read_attribute(path, 'id', 'product', default=''), capabilities
+    )
+
+
+def read_attribute(path, *names, default=None):
+    try:
+        with open(os.path.join(path, *names)) as f:
+            return f.read().strip()
+    except OSError:
+        if default is None:
+            raise
+        return default
+
+
+def parse_bitmap(string):
+    """
+    Parses a capabilities bitmap, given by sysfs as hexadecimal words of the
+    size of a `long`, the most significant first:
+
+    >>> parse_bitmap('120013')
+    1179667
+    >>> parse_bitmap('1 0') == 1 << LONG_BITS
+    True
+    >>> parse_bitmap('')
+    0
+    """
+    value = 0
+    for word in string.split():
+        value = (value << LONG_BITS) | int(word, 16)
+    return value
+
+
+def match_devices(devices, properties, sysfs_devices):
+    """
+    Finds the sysfs device behind each slave device listed by `xinput`, by
+    their device nodes, given the properties of the devices (as returned by
+    `XInput.get_properties()`). Returns a dict from device ids to sysfs
+    devices:
+
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.mock import make_sysfs
+    >>> devices = parse('''
+    ... ⎣ Keyboard                       id=3    [master keyboard (2)]
+    ...     ↳ USB Keyboard               id=8    [slave  keyboard (3)]
+    ...     ↳ Virtual core XTEST keyboard   id=5    [slave  keyboard (3)]
+    ... ''')
+    >>> properties = {
+    ...     8: {'Device Node': ['/dev/input/event4']},
+    ...     5: {},
+    ... }
+    >>> match_devices(devices, properties, enumerate_devices(make_sysfs()))
+    {8: SysfsDevice('/dev/input/event4', 'USB Keyboard', \
+'usb-0000:00:14.0-2/input0', '046d', 'c31c')}
+    """
+    nodes = {d.node: d for d in sysfs_devices}
+    matches = {}
+    for device in get_slave_devices(devices):
+        node = get_device_node(properties.get(device.id, {}))
+        if node in nodes:
+            matches[device.id] = nodes[node]
+    return matches
+
+
+class Uevent:
+    """
+    A kernel or udev event about an input device node: its action ("add",
+    "remove", "change" etc.) and node.
+
+    >>> Uevent('add', '/dev/input/event4')
+    Uevent('add', '/dev/input/event4')
+    """
+
+    def __init__(self, action, node):
+        self.action = action
+        self.node = node
+
+    def __repr__(self):
+        return 'Uevent({0!r}, {1!r})'.format(self.action, self.node)
+
+
+def parse_uevent(data, dev_root=DEV_INPUT_ROOT):
+    """
+    Parses a message from the uevent netlink socket, as sent by the kernel:
+
+    >>> parse_uevent(
+    ...     b'add@/devices/virtual/input/input7/event7\\0ACTION=add\\0'
+    ...     b'DEVPATH=/devices/virtual/input/input7/event7\\0'
+    ...     b'SUBSYSTEM=input\\0DEVNAME=input/event7\\0SEQNUM=4242\\0'
+    ... )
+    Uevent('add', '/dev/input/event7')
+
+    or by udev, once it has created the device node:
+
+    >>> properties = (
+    ...     b'ACTION=remove\\0SUBSYSTEM=input\\0DEVNAME=input/event7\\0'
+    ... )
+    >>> parse_uevent(
+    ...     UDEV_HEADER.pack(b'libudev\\0', 0xfeedcafe, UDEV_HEADER.size,
+    ...         UDEV_HEADER.size, len(properties)) + properties
+    ... )
+    Uevent('remove', '/dev/input/event7')
+
+    Events about other devices, including input devices which are not event
+    nodes, are ignored:
+
+    >>> parse_uevent(b'add@/devices/virtual/input/input7\\0ACTION=add\\0'
+    ...     b'SUBSYSTEM=input\\0')
+    """
+    if data.startswith(b'libudev\0'):
+        prefix, magic, header_size, offset, length = \
+            UDEV_HEADER.unpack_from(data)
+        data = data[offset:offset + length]
+    fields = dict(
+        field.partition('=')[::2]
+        for field in data.decode('utf-8', 'replace').split('\0')
+        if '=' in field
+    )
+    if fields.get('SUBSYSTEM') != 'input':
+        return None
+    name = os.path.basename(fields.get('DEVNAME', ''))
+    if EVENT_NODE_REGEX.match(name) is None:
+        return None
+    return Uevent(fields.get('ACTION'), os.path.join(dev_root, name))
+
+
+class UeventMonitor:
+    """
+    `UeventMonitor` listens to the uevent netlink socket and dispatches the
+    events about input device nodes to the subscribed listeners, from the
+    GLib main loop. By default, it listens to udev, so listeners only learn
+    about new devices once their nodes are ready.
+
+    Like `EventMonitor`, the socket is only open while there are listeners:
+
+    >>> monitor = UeventMonitor()
+    >>> monitor.socket is None
+    True
+    >>> def listener(uevent):
+    ...     print(uevent)
+    >>> monitor.subscribe(listener)
+    >>> monitor.socket is None
+    False
+    >>> monitor.feed(b'remove@/devices/virtual/input/input7/event7\\0'
+    ...     b'ACTION=remove\\0SUBSYSTEM=input\\0DEVNAME=input/event7\\0')
+    Uevent('remove', '/dev/input/event7')
+    >>> monitor.unsubscribe(listener)
+    >>> monitor.socket is None
+    True
+    """
+
+    def __init__(self, group=UDEV_GROUP, dev_root=DEV_INPUT_ROOT):
+        self.group = group
+        self.dev_root = dev_root
+        self.listeners = []
+        self.socket = None
+        self.watch_id = None
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+        if self.socket is None:
+            self.start()
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+        if not self.listeners:
+            self.stop()
+
+    def start(self):
+        self.socket = socket.socket(
+            socket.AF_NETLINK, socket.SOCK_DGRAM | socket.SOCK_NONBLOCK,
+            NETLINK_KOBJECT_UEVENT
+        )
+        self.socket.bind((0, self.group))
+        self.watch_id = glib.io_add_watch(
+            self.socket.fileno(), glib.PRIORITY_DEFAULT,
+            glib.IO_IN | glib.IO_HUP | glib.IO_ERR, self.read
+        )
+
+    def stop(self):
+        if self.socket is None:
+            return
+        glib.source_remove(self.watch_id)
+        self.socket.close()
+        self.socket = None
+        self.watch_id = None
+
+    def read(self, fd, condition):
+        while True:
+            try:
+                data = self.socket.recv(65536)
+            except BlockingIOError:
+                return True
+            except OSError:
+                # E.g. ENOBUFS, when events were lost: listeners should list
+                # the devices again, so they are told about a change.
+                self.dispatch(Uevent('change', None))
+                return True
+            self.feed(data)
+
+    def feed(self, data):
+        uevent = parse_uevent(data, self.dev_root)
+        if uevent is not None:
+            self.dispatch(uevent)
+
+    def dispatch(self, uevent):
+        for listener in list(self.listeners):
+            listener(uevent)
@@ -21,7 +21,33 @@ from inelegant.finder import TestFinder
 
 
 load_tests = TestFinder(
+    'inputdeviceindicator.actions',
+    'inputdeviceindicator.agent',
+    'inputdeviceindicator.activity',
+    'inputdeviceindicator.asyncxinput',
+    'inputdeviceindicator.audit',
+    'inputdeviceindicator.backends',
+    'inputdeviceindicator.catdetector',
     'inputdeviceindicator.command',
+    'inputdeviceindicator.commandqueue',
+    'inputdeviceindicator.config',
+    'inputdeviceindicator.control',
+    'inputdeviceindicator.countdown',
+    'inputdeviceindicator.evdev',
+    'inputdeviceindicator.events',
+    'inputdeviceindicator.grouping',
+    'inputdeviceindicator.hooks',
+    'inputdeviceindicator.hotkeys',
+    'inputdeviceindicator.icons',
     'inputdeviceindicator.indicator',
-    'inputdeviceindicator.menu'
+    'inputdeviceindicator.info',
+    'inputdeviceindicator.main',
+    'inputdeviceindicator.menu',
+    'inputdeviceindicator.paths',
+    'inputdeviceindicator.profiling',
+    'inputdeviceindicator.scheduler',
+    'inputdeviceindicator.snapshot',
+    'inputdeviceindicator.sysfs',
+    'inputdeviceindicator.typingguard',
+    'inputdeviceindicator.undo'
 ).load_tests
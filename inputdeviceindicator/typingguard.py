@@ -0,0 +1,216 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import time
+
+from gi.repository import GLib as glib
+
+from inputdeviceindicator.catdetector import MODIFIER_KEYCODES
+from inputdeviceindicator.command import XInputError
+from inputdeviceindicator.config import DEFAULT_CONFIG
+
+
+DEFAULT_SETTINGS = DEFAULT_CONFIG['disable_while_typing']
+
+
+class TypingGuard:
+    """
+    `TypingGuard` disables a pointer device (usually a touchpad) while some
+    keyboards are being typed on, and enables it again once the keyboards
+    are idle for a while.
+
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.events import Event
+    >>> from inputdeviceindicator.mock import MockXInput, MockEventMonitor, \\
+    ...     MockTimer
+    >>> xinput = MockXInput(parse('''
+    ... ⎡ Pointer            id=2    [master pointer  (3)]
+    ... ⎜   ↳ Touchpad       id=12   [slave  pointer  (2)]
+    ... ⎣ Keyboard           id=3    [master keyboard (2)]
+    ...     ↳ Laptop keys    id=11   [slave  keyboard (3)]
+    ...     ↳ USB keyboard   id=13   [slave  keyboard (3)]
+    ... '''))
+    >>> monitor = MockEventMonitor()
+    >>> now = [0.0]
+    >>> timer = MockTimer()
+    >>> guard = TypingGuard(
+    ...     xinput, monitor, ['Laptop keys'], 'Touchpad', idle=0.5,
+    ...     clock=lambda: now[0], timeout_add=timer.timeout_add
+    ... )
+    >>> guard.start()
+
+    A key press disables the touchpad, and only one timer is scheduled no
+    matter how many keys are pressed:
+
+    >>> def press(keycode, time):
+    ...     now[0] = time
+    ...     monitor.dispatch(Event('RawKeyPress', 11, 11, keycode, time=time))
+    >>> for i in range(10):
+    ...     press(38 + i, i * 0.1)
+    Device Touchpad disabled
+    >>> timer.pending
+    [500]
+
+    When the timer fires, if a key was pressed in the meantime, it is
+    rescheduled for the remaining time:
+
+    >>> now[0] = 0.6
+    >>> timer.fire()
+    >>> timer.pending
+    [800]
+
+    Otherwise, the touchpad is enabled:
+
+    >>> now[0] = 1.5
+    >>> timer.fire()
+    Device Touchpad enabled
+    >>> timer.pending
+    []
+
+    Modifiers (so one can Ctrl+click) and other keyboards are ignored:
+
+    >>> press(37, 2.0)
+    >>> monitor.dispatch(Event('RawKeyPress', 13, 13, 38, time=2.1))
+    >>> timer.pending
+    []
+
+    A touchpad turned off by the user is left alone: typing does not disable
+    it again, and it is not enabled once the keyboards are idle:
+
+    >>> touchpad = xinput.devices[0].children[0]
+    >>> xinput.disable(touchpad, 'menu')
+    Device Touchpad disabled
+    >>> press(38, 3.0)
+    >>> timer.pending
+    []
+
+    If the user enables the touchpad while the guard has it disabled, the
+    guard lets go of it, and does not enable it again when the timer fires:
+
+    >>> xinput.enable(touchpad, 'menu')
+    Device Touchpad enabled
+    >>> press(38, 4.0)
+    Device Touchpad disabled
+    >>> xinput.enable(touchpad, 'menu')
+    Device Touchpad enabled
+    >>> now[0] = 5.0
+    >>> timer.fire()
+    >>> guard.pointer_disabled
+    False
+    """
+
+    def __init__(
+            self, xinput, monitor, keyboards, pointer, idle=0.5,
+            clock=time.monotonic, timeout_add=glib.timeout_add,
+            on_error=None):
+        self.xinput = xinput
+        self.monitor = monitor
+        self.keyboard_names = set(keyboards)
+        self.pointer_name = pointer
+        self.idle = idle
+        self.clock = clock
+        self.timeout_add = timeout_add
+        self.on_error = on_error
+        self.keyboard_ids = set()
+        self.pointer = None
+        self.pointer_disabled = False
+        self.last_key_time = None
+        self.timer_pending = False
+
+    def start(self):
+        self.xinput.add_listener(self.device_state_changed)
+        self.update_devices()
+        self.monitor.subscribe(
+            self.handle_event, {'HierarchyChanged', 'RawKeyPress'}
+        )
+
+    def stop(self):
+        self.monitor.unsubscribe(self.handle_event)
+        if self.pointer_disabled:
+            self.set_pointer_enabled(True)
+
+    def update_devices(self):
+        try:
+            devices = self.xinput.get_devices()
+        except XInputError as e:
+            self.report(e)
+            return
+        children = [c for d in devices for c in d.children]
+        self.keyboard_ids = {
+            c.id for c in children if c.name in self.keyboard_names
+        }
+        pointers = [c for c in children if c.name == self.pointer_name]
+        self.pointer = pointers[0] if pointers else None
+
+    def handle_event(self, event):
+        if event.type == 'HierarchyChanged':
+            self.update_devices()
+        elif event.type == 'RawKeyPress' and \
+                event.source_id in self.keyboard_ids and \
+                event.detail not in MODIFIER_KEYCODES:
+            self.last_key_time = self.clock()
+            if not self.pointer_disabled:
+                # A pointer disabled by someone else is not the guard's to
+                # enable later.
+                if self.pointer is None or not self.pointer.enabled:
+                    return
+                self.set_pointer_enabled(False)
+            if self.pointer_disabled and not self.timer_pending:
+                self.schedule(self.idle)
+
+    def device_state_changed(self, device, enabled):
+        if self.pointer is None or device.id != self.pointer.id:
+            return
+        self.pointer.enabled = enabled
+        if enabled != (not self.pointer_disabled):
+            # Changed from outside (e.g. the menu): the pointer is no longer
+            # the guard's.
+            self.pointer_disabled = False
+
+    def schedule(self, delay):
+        self.timer_pending = True
+        self.timeout_add(max(round(delay * 1000), 1), self.timer_fired)
+
+    def timer_fired(self):
+        remaining = self.last_key_time + self.idle - self.clock()
+        if remaining > 0:
+            self.schedule(remaining)
+        else:
+            self.timer_pending = False
+            if self.pointer_disabled:
+                self.set_pointer_enabled(True)
+        return False
+
+    def set_pointer_enabled(self, enabled):
+        if self.pointer is None:
+            return
+        # Set beforehand, so our own change is not taken as coming from
+        # outside by device_state_changed().
+        disabled = self.pointer_disabled
+        self.pointer_disabled = not enabled
+        try:
+            if enabled:
+                self.xinput.enable(self.pointer, 'typing guard')
+            else:
+                self.xinput.disable(self.pointer, 'typing guard')
+        except XInputError as e:
+            self.pointer_disabled = disabled
+            self.report(e)
+
+    def report(self, error):
+        if self.on_error is not None:
+            self.on_error(error)
@@ -0,0 +1,286 @@
+# Copyright © 2020 Adam Brandizzi
+#
+# This file is part of Input Device Indicator.
+#
+# Input Device Indicator is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# Input Device Indicator is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Input Device Indicator.  If not, see <https://www.gnu.org/licenses/>
+
+import collections
+
+from gi.repository import GLib as glib
+
+from inputdeviceindicator.actions import set_enabled
+from inputdeviceindicator.command import XInputError, \
+    get_device_from_list_by_id
+from inputdeviceindicator.config import DEFAULT_CONFIG
+from inputdeviceindicator.events import INPUT_EVENT_TYPES
+
+
+DEFAULT_SETTINGS = DEFAULT_CONFIG['undo']
+
+
+class UndoHistory:
+    """
+    `UndoHistory` keeps the last changes made to the devices, so they can be
+    undone (and redone). Each change is a batch of devices and the states
+    they were set to, such as a single toggle or a whole profile:
+
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.mock import MockXInput
+    >>> devices = parse('''
+    ... ⎡ Pointer      id=2    [master pointer  (3)]
+    ... ⎜   ↳ Mouse    id=4    [slave  pointer  (2)]
+    ... ⎜   ↳ Touchpad id=5    [slave  pointer  (2)]
+    ... ''')
+    >>> xinput = MockXInput(devices)
+    >>> history = UndoHistory(xinput)
+    >>> mouse, touchpad = devices[0].children
+    >>> mouse.enabled = touchpad.enabled = False
+    >>> history.record([(mouse, False), (touchpad, False)])
+    >>> history.changes
+    deque([((4, 'Mouse', False), (5, 'Touchpad', False))], maxlen=20)
+
+    Undoing a change reverts its whole batch at once:
+
+    >>> history.undo()
+    Device Mouse enabled
+    Device Touchpad enabled
+    'Mouse, Touchpad enabled again'
+
+    and it can be redone:
+
+    >>> history.redo()
+    Device Mouse disabled
+    Device Touchpad disabled
+    'Mouse, Touchpad disabled again'
+
+    Only the last `size` changes are kept, and recording a new change
+    forgets the undone ones:
+
+    >>> history.undo()
+    Device Mouse enabled
+    Device Touchpad enabled
+    'Mouse, Touchpad enabled again'
+    >>> touchpad.enabled = False
+    >>> history.record([(touchpad, False)])
+    >>> history.redo()
+    Traceback (most recent call last):
+      ...
+    inputdeviceindicator.command.XInputError: there is nothing to redo
+
+    If the change cannot be applied, it stays where it was, so it can be
+    tried again:
+
+    >>> from inputdeviceindicator.command import XInputError
+    >>> xinput.errors.append(XInputError('Unable to connect to X server'))
+    >>> history.undo()
+    Traceback (most recent call last):
+      ...
+    inputdeviceindicator.command.XInputError: Unable to connect to X server
+    >>> history.changes[-1], len(history.undone)
+    (((5, 'Touchpad', False),), 0)
+    >>> history.undo()
+    Device Touchpad enabled
+    'Touchpad enabled again'
+
+    `on_change` is called whenever there is something new to undo or redo,
+    e.g. so the menu can update its items.
+    """
+
+    def __init__(self, xinput, size=DEFAULT_SETTINGS['size'], on_change=None):
+        self.xinput = xinput
+        self.changes = collections.deque(maxlen=size)
+        self.undone = collections.deque(maxlen=size)
+        self.on_change = on_change
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """
+        Registers a function to be called with each recorded change.
+        """
+        self.listeners.append(listener)
+
+    def record(self, changes):
+        """
+        Records a batch of changes, given as pairs of devices and the states
+        they were set to. Devices are stored by id and name only.
+        """
+        change = tuple((d.id, d.name, enabled) for d, enabled in changes)
+        if not change:
+            return
+        self.changes.append(change)
+        self.undone.clear()
+        self.changed()
+        for listener in list(self.listeners):
+            listener(change)
+
+    @property
+    def can_undo(self):
+        return bool(self.changes)
+
+    @property
+    def can_redo(self):
+        return bool(self.undone)
+
+    def undo(self):
+        """
+        Reverts the last change, returning a description of what was done.
+        """
+        if not self.changes:
+            raise XInputError('there is nothing to undo')
+        message = self.apply(self.changes[-1], reverse=True, source='undo')
+        self.undone.append(self.changes.pop())
+        self.changed()
+        return message
+
+    def redo(self):
+        """
+        Applies the last undone change again, returning a description of
+        what was done.
+        """
+        if not self.undone:
+            raise XInputError('there is nothing to redo')
+        message = self.apply(self.undone[-1], reverse=False, source='redo')
+        self.changes.append(self.undone.pop())
+        self.changed()
+        return message
+
+    def apply(self, change, reverse, source):
+        devices = self.xinput.get_devices()
+        states = {}
+        for id, name, enabled in change:
+            device = get_device_from_list_by_id(devices, id)
+            if device is not None and device.name == name:
+                states.setdefault(enabled != reverse, []).append(device)
+        for enabled, devices in states.items():
+            set_enabled(self.xinput, devices, enabled, source)
+        return ' and '.join(
+            '{0} {1} again'.format(
+                ', '.join(d.name for d in devices),
+                'enabled' if enabled else 'disabled'
+            )
+            for enabled, devices in states.items()
+        ) or 'the devices are gone'
+
+    def changed(self):
+        if self.on_change is not None:
+            self.on_change(self)
+
+
+class DeadMansSwitch:
+    """
+    `DeadMansSwitch` undoes changes which disable devices if no input comes
+    in a while after them: if the last working keyboard and mouse were
+    disabled by mistake, they are enabled again without any input.
+
+    >>> from inputdeviceindicator.command import parse
+    >>> from inputdeviceindicator.events import Event
+    >>> from inputdeviceindicator.mock import MockXInput, MockEventMonitor, \\
+    ...     MockTimer
+    >>> devices = parse('''
+    ... ⎡ Pointer      id=2    [master pointer  (3)]
+    ... ⎜   ↳ Mouse    id=4    [slave  pointer  (2)]
+    ... ⎣ Keyboard     id=3    [master keyboard (2)]
+    ...     ↳ Keys     id=5    [slave  keyboard (3)]
+    ... ''')
+    >>> mouse, keys = devices[0].children[0], devices[1].children[0]
+    >>> history = UndoHistory(MockXInput(devices))
+    >>> monitor = MockEventMonitor()
+    >>> timer = MockTimer()
+    >>> switch = DeadMansSwitch(
+    ...     history, monitor, seconds=15, timeout_add=timer.timeout_add,
+    ...     source_remove=timer.source_remove, on_revert=print
+    ... )
+    >>> switch.start()
+
+    Once a device is disabled, input events are monitored for a while:
+
+    >>> mouse.enabled = False
+    >>> history.record([(mouse, False)])
+    >>> timer.pending, len(monitor.listeners)
+    ([15000], 1)
+
+    If some input comes, all is fine:
+
+    >>> monitor.dispatch(Event('RawKeyPress', 5, 5, 38))
+    >>> timer.pending, len(monitor.listeners)
+    ([], 0)
+
+    Otherwise, the change is undone:
+
+    >>> keys.enabled = False
+    >>> history.record([(keys, False)])
+    >>> timer.fire()
+    Device Keys enabled
+    No input after disabling devices: Keys enabled again
+    >>> len(monitor.listeners)
+    0
+
+    Changes which only enable devices are not watched.
+    """
+
+    def __init__(
+            self, history, monitor, seconds=15,
+            timeout_add=glib.timeout_add, source_remove=glib.source_remove,
+            on_revert=None, on_error=None):
+        self.history = history
+        self.monitor = monitor
+        self.seconds = seconds
+        self.timeout_add = timeout_add
+        self.source_remove = source_remove
+        self.on_revert = on_revert
+        self.on_error = on_error
+        self.change = None
+        self.timeout_id = None
+
+    def start(self):
+        self.history.add_listener(self.change_recorded)
+
+    def change_recorded(self, change):
+        self.disarm()
+        if all(enabled for id, name, enabled in change):
+            return
+        self.change = change
+        self.monitor.subscribe(self.event_received, INPUT_EVENT_TYPES)
+        self.timeout_id = self.timeout_add(
+            int(self.seconds * 1000), self.expire
+        )
+
+    def event_received(self, event):
+        self.disarm()
+
+    def disarm(self):
+        if self.change is None:
+            return
+        self.change = None
+        self.monitor.unsubscribe(self.event_received)
+        if self.timeout_id is not None:
+            self.source_remove(self.timeout_id)
+            self.timeout_id = None
+
+    def expire(self):
+        self.timeout_id = None
+        change = self.change
+        self.disarm()
+        if self.history.changes and self.history.changes[-1] == change:
+            try:
+                message = self.history.undo()
+            except XInputError as e:
+                if self.on_error is not None:
+                    self.on_error(e)
+                return False
+            if self.on_revert is not None:
+                self.on_revert(
+                    'No input after disabling devices: {0}'.format(message)
+                )
+        return False
@@ -37,6 +37,10 @@ setup(
     entry_points={
         'gui_scripts': [
             'input-device-indicator=inputdeviceindicator.main:main'
+        ],
+        'inputdeviceindicator.backends': [
+            'xinput=inputdeviceindicator.command:XInput',
+            'evdev=inputdeviceindicator.evdev:EvdevInput'
         ]
     },
     test_suite='inputdeviceindicator.tests',
@@ -47,9 +51,10 @@ setup(
             ['inputdeviceindicator/resources/input-device-indicator.desktop']
         ),
         (
-            'share/icons/',
+            'share/icons/hicolor/scalable/apps/',
             ['inputdeviceindicator/resources/input-device-indicator.svg']
         ),
+        ('share/doc/input-device-indicator/', ['LICENSE.txt']),
     ],
     classifiers=[
         "Development Status :: 4 - Beta",